@@ -1,3 +1,4 @@
+import hashlib
 import chromadb
 
 # This is the "knowledge" we will give to the LLM.
@@ -6,6 +7,9 @@ documents = [
     "The 'floats' table contains metadata about each individual Argo float, such as its unique platform_number, the project_name it belongs to, and the platform_type.",
     "The 'profiles' table stores information for each measurement cycle. Each row represents a single vertical profile with a platform_number, cycle_number, a timestamp 'profile_time', and a geographic 'location'.",
     "The 'measurements' table contains the core scientific data. Each row has the pressure (pres_adjusted), temperature (temp_adjusted), and salinity (psal_adjusted) for a single depth level within a profile.",
+    "The 'float_latest_position' table is a precomputed rollup with one row per float: its latest cycle_number, profile_time and location. It is much cheaper than searching the profiles table.",
+    "The 'profile_counts_monthly' table is a precomputed rollup of profile_count and float_count per 5-degree grid cell (lat_cell, lon_cell = southern/western edge in degrees) and month.",
+    "The 'depth_bin_means_monthly' table is a precomputed rollup of mean_temp_adjusted and mean_psal_adjusted (good QC only) per 5-degree grid cell, month and pressure bin from depth_min to depth_max decibars. temp_good_count and psal_good_count are the number of values behind each mean; measurement_count also counts bad-QC and missing values, so never weight means by it.",
     
     # Column Descriptions
     "The column 'platform_number' is the unique integer ID for each Argo float.",
@@ -20,6 +24,9 @@ documents = [
     # Example Question/Query Pairs
     "To get a temperature profile for a float, you can use a query like: SELECT pres_adjusted, temp_adjusted FROM measurements WHERE platform_number = [number] AND cycle_number = [number] ORDER BY pres_adjusted ASC;",
     "To find the last known location of a float, you can use a query like: SELECT ST_AsText(location) FROM profiles WHERE platform_number = [number] ORDER BY profile_time DESC LIMIT 1;",
+    "To find the last known location of every float cheaply, you can use a query like: SELECT platform_number, profile_time, ST_AsText(location) FROM float_latest_position;",
+    "To count profiles per month in a region, you can use a query like: SELECT month, sum(profile_count) FROM profile_counts_monthly WHERE lat_cell BETWEEN 5 AND 20 AND lon_cell BETWEEN 50 AND 70 GROUP BY month ORDER BY month;",
+    "To get the mean temperature by depth in a region for a month, you can use a query like: SELECT depth_min, depth_max, sum(mean_temp_adjusted * temp_good_count) / NULLIF(sum(temp_good_count), 0) FROM depth_bin_means_monthly WHERE lat_cell BETWEEN 5 AND 20 AND lon_cell BETWEEN 50 AND 70 AND month = '2025-09-01' GROUP BY depth_min, depth_max ORDER BY depth_min;",
     "To find floats near a specific point (e.g., longitude 72.87, latitude 19.07), you can use a PostGIS function like: SELECT platform_number FROM profiles WHERE ST_DWithin(location, ST_GeographyFromText('SRID=4326;POINT(72.87 19.07)'), 100000);"
 ]
 
@@ -29,14 +36,22 @@ client = chromadb.PersistentClient(path="argo_knowledge_base")
 # Create a collection (or get it if it already exists)
 collection = client.get_or_create_collection(name="argo_schema_info")
 
-# Add the documents to the collection.
-# We create simple IDs for each document.
-collection.add(
-    documents=documents,
-    ids=[f"doc_{i}" for i in range(len(documents))]
+# Key each document by a hash of its content, so re-running after the list changes upserts the
+# new and edited documents and removes the stale ones (including old positional doc_{i} IDs).
+def doc_id(doc):
+    return "doc_" + hashlib.sha256(doc.encode("utf-8")).hexdigest()[:32]
+
+docs_by_id = {doc_id(doc): doc for doc in documents}
+stale_ids = [i for i in collection.get(include=[])["ids"] if i not in docs_by_id]
+collection.upsert(
+    documents=list(docs_by_id.values()),
+    ids=list(docs_by_id)
 )
+if stale_ids:
+    collection.delete(ids=stale_ids)
 
-print(f"✅ Successfully created and populated the ChromaDB collection with {len(documents)} documents.")
+print(f"✅ Successfully created and populated the ChromaDB collection with {len(docs_by_id)} documents "
+      f"({len(stale_ids)} stale removed).")
 print("You can now query this collection in your RAG pipeline.")
 
 # Example of how you would query it in your backend
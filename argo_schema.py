@@ -0,0 +1,306 @@
+import os
+import argparse
+import psycopg2
+
+# Connection defaults match docker-compose.yml; override with the usual POSTGRES_* variables.
+DEFAULT_DB_PARAMS = {
+    "host": os.getenv("POSTGRES_HOST", "localhost"),
+    "port": os.getenv("POSTGRES_PORT", "5432"),
+    "database": os.getenv("POSTGRES_DB", "argodb"),
+    "user": os.getenv("POSTGRES_USER", "argo"),
+    "password": os.getenv("POSTGRES_PASSWORD", "mysecretpassword"),
+}
+
+# --- BASE TABLES ---
+# IF NOT EXISTS everywhere, so databases created by hand before migrations existed are adopted as-is.
+BASE_TABLES_DDL = """
+CREATE EXTENSION IF NOT EXISTS postgis;
+
+CREATE TABLE IF NOT EXISTS floats (
+    platform_number BIGINT PRIMARY KEY,
+    project_name TEXT,
+    pi_name TEXT,
+    platform_type TEXT,
+    float_serial_no TEXT,
+    wmo_inst_type TEXT
+);
+
+CREATE TABLE IF NOT EXISTS profiles (
+    platform_number BIGINT NOT NULL REFERENCES floats (platform_number),
+    cycle_number INTEGER NOT NULL,
+    direction CHAR(1),
+    profile_time TIMESTAMP,
+    location GEOGRAPHY(Point, 4326),
+    profile_pres_qc CHAR(1),
+    profile_temp_qc CHAR(1),
+    profile_psal_qc CHAR(1),
+    PRIMARY KEY (platform_number, cycle_number)
+);
+
+CREATE TABLE IF NOT EXISTS measurements (
+    platform_number BIGINT NOT NULL,
+    cycle_number INTEGER NOT NULL,
+    pres_adjusted REAL NOT NULL,
+    pres_adjusted_qc CHAR(1),
+    temp_adjusted REAL,
+    temp_adjusted_qc CHAR(1),
+    psal_adjusted REAL,
+    psal_adjusted_qc CHAR(1),
+    PRIMARY KEY (platform_number, cycle_number, pres_adjusted)
+);
+"""
+
+# --- INGEST BOOKKEEPING ---
+# data_version is a single-row counter; see load_argo_data.bump_data_version for how it is used.
+DATA_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO data_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+"""
+
+# One row per NetCDF file loaded by the parallel directory ingest.
+MANIFEST_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    path TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    mtime TIMESTAMP NOT NULL,
+    size_bytes BIGINT NOT NULL,
+    floats_inserted INTEGER NOT NULL,
+    profiles_read INTEGER NOT NULL,
+    profiles_inserted INTEGER NOT NULL,
+    measurements_read INTEGER NOT NULL,
+    measurements_inserted INTEGER NOT NULL,
+    duration_seconds DOUBLE PRECISION NOT NULL,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# --- ROLLUPS ---
+# Small pre-aggregated tables for the most common questions, so generated SQL can avoid
+# scanning raw profiles/measurements. Refreshed by load_argo_data.refresh_rollups.
+ROLLUP_DDL = """
+CREATE OR REPLACE VIEW profile_cells AS
+SELECT platform_number,
+       cycle_number,
+       (floor(ST_Y(location::geometry) / 5) * 5)::INTEGER AS lat_cell,
+       (floor(ST_X(location::geometry) / 5) * 5)::INTEGER AS lon_cell,
+       date_trunc('month', profile_time)::DATE AS month
+FROM profiles
+WHERE location IS NOT NULL AND profile_time IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS float_latest_position (
+    platform_number BIGINT PRIMARY KEY,
+    cycle_number INTEGER NOT NULL,
+    profile_time TIMESTAMP NOT NULL,
+    location GEOGRAPHY(Point, 4326)
+);
+
+CREATE TABLE IF NOT EXISTS profile_counts_monthly (
+    lat_cell INTEGER NOT NULL,
+    lon_cell INTEGER NOT NULL,
+    month DATE NOT NULL,
+    profile_count INTEGER NOT NULL,
+    float_count INTEGER NOT NULL,
+    PRIMARY KEY (lat_cell, lon_cell, month)
+);
+
+CREATE TABLE IF NOT EXISTS depth_bin_means_monthly (
+    lat_cell INTEGER NOT NULL,
+    lon_cell INTEGER NOT NULL,
+    month DATE NOT NULL,
+    depth_min REAL NOT NULL,
+    depth_max REAL NOT NULL,
+    measurement_count INTEGER NOT NULL,
+    mean_temp_adjusted DOUBLE PRECISION,
+    mean_psal_adjusted DOUBLE PRECISION,
+    PRIMARY KEY (lat_cell, lon_cell, month, depth_min)
+);
+"""
+
+# --- INDEXES ---
+# GiST for ST_DWithin/ST_Intersects on profile locations, B-tree for profile_time ranges and
+# "latest profile" lookups, BRIN on the append-mostly manifest.
+INDEXES_DDL = """
+CREATE INDEX IF NOT EXISTS profiles_location_gist ON profiles USING GIST (location);
+CREATE INDEX IF NOT EXISTS profiles_profile_time_idx ON profiles (profile_time);
+CREATE INDEX IF NOT EXISTS profiles_platform_time_idx ON profiles (platform_number, profile_time DESC);
+CREATE INDEX IF NOT EXISTS float_latest_position_location_gist ON float_latest_position USING GIST (location);
+CREATE INDEX IF NOT EXISTS ingest_manifest_loaded_at_brin ON ingest_manifest USING BRIN (loaded_at);
+"""
+
+# --- PARTITIONED MEASUREMENTS ---
+# WMO platform numbers are 7 digits whose leading digit is the WMO region, so one range
+# partition per leading digit keeps each float's levels together and lets
+# "WHERE platform_number = ..." prune to a single partition.
+MEASUREMENT_COLUMNS = ("platform_number, cycle_number, pres_adjusted, pres_adjusted_qc, "
+                       "temp_adjusted, temp_adjusted_qc, psal_adjusted, psal_adjusted_qc")
+MEASUREMENT_PARTITION_DIGITS = range(1, 10)
+
+
+def _partition_measurements(cur):
+    cur.execute("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relname = 'measurements';
+    """)
+    row = cur.fetchone()
+    if row and row[0] == 'p':
+        return
+    if row:
+        cur.execute("ALTER TABLE measurements RENAME TO measurements_unpartitioned;")
+
+    cur.execute("""
+        CREATE TABLE measurements (
+            platform_number BIGINT NOT NULL,
+            cycle_number INTEGER NOT NULL,
+            pres_adjusted REAL NOT NULL,
+            pres_adjusted_qc CHAR(1),
+            temp_adjusted REAL,
+            temp_adjusted_qc CHAR(1),
+            psal_adjusted REAL,
+            psal_adjusted_qc CHAR(1),
+            CONSTRAINT measurements_partitioned_pkey PRIMARY KEY (platform_number, cycle_number, pres_adjusted)
+        ) PARTITION BY RANGE (platform_number);
+    """)
+    for digit in MEASUREMENT_PARTITION_DIGITS:
+        cur.execute(f"""
+            CREATE TABLE measurements_p{digit} PARTITION OF measurements
+            FOR VALUES FROM ({digit * 1000000}) TO ({(digit + 1) * 1000000});
+        """)
+    cur.execute("CREATE TABLE measurements_default PARTITION OF measurements DEFAULT;")
+
+    if row:
+        cur.execute(f"""
+            INSERT INTO measurements ({MEASUREMENT_COLUMNS})
+            SELECT {MEASUREMENT_COLUMNS} FROM measurements_unpartitioned
+            ON CONFLICT DO NOTHING;
+        """)
+        cur.execute("DROP TABLE measurements_unpartitioned;")
+
+
+# --- PROFILE CHECKSUMS ---
+# Hash of each profile's values as last loaded, so a sync can tell reprocessed cycles
+# (delayed-mode QC/adjustments) from unchanged re-downloads. NULL for rows loaded before this.
+PROFILE_CHECKSUM_DDL = """
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS content_checksum TEXT;
+"""
+
+
+# --- ROLLUP QC COUNTS ---
+# measurement_count includes levels with bad QC or NULL values, which the means skip. These
+# count the values each mean actually averages, so means can be weighted when combining bins.
+ROLLUP_QC_COUNTS_DDL = """
+ALTER TABLE depth_bin_means_monthly
+    ADD COLUMN IF NOT EXISTS temp_good_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS psal_good_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE depth_bin_means_monthly r
+SET temp_good_count = s.temp_good_count, psal_good_count = s.psal_good_count
+FROM (
+    SELECT b.lat_cell, b.lon_cell, b.month, b.depth_min,
+           count(m.temp_adjusted) FILTER (WHERE m.temp_adjusted_qc = '1') AS temp_good_count,
+           count(m.psal_adjusted) FILTER (WHERE m.psal_adjusted_qc = '1') AS psal_good_count
+    FROM depth_bin_means_monthly b
+    JOIN profile_cells c USING (lat_cell, lon_cell, month)
+    JOIN measurements m USING (platform_number, cycle_number)
+    WHERE m.pres_adjusted >= b.depth_min AND m.pres_adjusted < b.depth_max
+    GROUP BY b.lat_cell, b.lon_cell, b.month, b.depth_min
+) s
+WHERE r.lat_cell = s.lat_cell AND r.lon_cell = s.lon_cell AND r.month = s.month AND r.depth_min = s.depth_min;
+"""
+
+
+# --- MIGRATIONS ---
+# Append-only: (version, description, SQL string or callable taking a cursor).
+MIGRATIONS = [
+    (1, "base tables", BASE_TABLES_DDL),
+    (2, "ingest bookkeeping", DATA_VERSION_DDL + MANIFEST_DDL),
+    (3, "rollup tables", ROLLUP_DDL),
+    (4, "spatial and temporal indexes", INDEXES_DDL),
+    (5, "partition measurements by platform range", _partition_measurements),
+    (6, "profile content checksums", PROFILE_CHECKSUM_DDL),
+    (7, "good-QC counts on depth bin means", ROLLUP_QC_COUNTS_DDL),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Serializes concurrent migrate() calls (loader workers, API start-up, CLI).
+MIGRATION_LOCK_ID = 0x41524731
+
+
+def current_version(conn):
+    """
+    Returns the highest applied migration version (0 for an unmanaged database).
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute("SELECT COALESCE(max(version), 0) FROM schema_migrations;")
+        return cur.fetchone()[0]
+
+
+def migrate(conn, target=LATEST_VERSION, verbose=False):
+    """
+    Applies every pending migration up to target, each in its own transaction, and records it
+    in schema_migrations. Returns the list of versions applied.
+    """
+    applied = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+            """)
+            conn.commit()
+            done = current_version(conn)
+            for version, description, step in MIGRATIONS:
+                if version <= done or version > target:
+                    continue
+                if verbose:
+                    print(f"  - Applying migration {version}: {description}")
+                try:
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                    cur.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s);",
+                                (version, description))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(version)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    return applied
+
+
+def ensure_schema(db_params, target=LATEST_VERSION, verbose=True):
+    """
+    Connects, applies pending migrations and reports what was done.
+    """
+    conn = psycopg2.connect(**db_params)
+    try:
+        applied = migrate(conn, target=target, verbose=verbose)
+        if verbose:
+            if applied:
+                print(f"✅ Schema migrated to version {applied[-1]}.")
+            else:
+                print(f"✅ Schema already at version {current_version(conn)}.")
+        return applied
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create or upgrade the Argo Postgres/PostGIS schema.")
+    parser.add_argument("--target", type=int, default=LATEST_VERSION, help="Migrate up to this version.")
+    args = parser.parse_args()
+    ensure_schema(DEFAULT_DB_PARAMS, target=args.target)
@@ -0,0 +1,141 @@
+"""
+Loader throughput: measurement rows/sec of load_argo_nc_to_postgres (row-by-row) and
+bulk_load_argo_nc_to_postgres (COPY) on the bundled 20250912_prof.nc and on a synthetic
+file that repeats its profiles SCALE times (shifted cycle numbers, earlier dates, jittered
+positions). Prints a JSON report.
+
+DESTRUCTIVE: drops the Argo tables in the target database before each run. Point it at a
+scratch database, e.g. the PostGIS container from docker-compose.yml.
+
+    python benchmarks/bench_loader.py --scale 10 --yes-drop-tables --output loader_bench.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+import netCDF4
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import argo_schema
+import load_argo_data
+from bench_schema import BUNDLED_FILE, DROP_SQL
+
+LOADERS = {
+    "row_by_row": load_argo_data.load_argo_nc_to_postgres,
+    "bulk_copy": load_argo_data.bulk_load_argo_nc_to_postgres,
+}
+
+
+def write_scaled_file(source_path, target_path, scale, seed=0):
+    """
+    Writes a copy of source_path whose per-profile variables are repeated scale times.
+    Copy k gets cycle_number + k * 1000, JULD - k days and positions jittered by up to 5 degrees.
+    """
+    rng = np.random.default_rng(seed)
+    with netCDF4.Dataset(source_path) as src, netCDF4.Dataset(target_path, "w") as dst:
+        n_prof = len(src.dimensions["N_PROF"])
+        for name, dim in src.dimensions.items():
+            size = n_prof * scale if name == "N_PROF" else (None if dim.isunlimited() else len(dim))
+            dst.createDimension(name, size)
+        for name, var in src.variables.items():
+            # History variables are indexed (N_HISTORY, N_PROF) and not read by the loaders.
+            if "N_PROF" in var.dimensions and var.dimensions[0] != "N_PROF":
+                continue
+            fill_value = var.getncattr("_FillValue") if "_FillValue" in var.ncattrs() else None
+            out = dst.createVariable(name, var.dtype, var.dimensions, fill_value=fill_value)
+            out.setncatts({k: var.getncattr(k) for k in var.ncattrs() if k != "_FillValue"})
+            values = var[:]
+            if var.dimensions and var.dimensions[0] == "N_PROF":
+                copies = []
+                for k in range(scale):
+                    copy = values.copy()
+                    if name == "CYCLE_NUMBER":
+                        copy = copy + k * 1000
+                    elif name in ("JULD", "JULD_LOCATION"):
+                        copy = copy - k
+                    elif name == "LATITUDE" and k:
+                        copy = np.ma.clip(copy + rng.uniform(-5, 5, copy.shape), -89, 89)
+                    elif name == "LONGITUDE" and k:
+                        copy = copy + rng.uniform(-5, 5, copy.shape)
+                    copies.append(copy)
+                values = np.ma.concatenate(copies, axis=0)
+            out[:] = values
+    return target_path
+
+
+def count_rows(db_params):
+    with psycopg2.connect(**db_params) as conn, conn.cursor() as cur:
+        cur.execute("SELECT (SELECT count(*) FROM floats), (SELECT count(*) FROM profiles), "
+                    "(SELECT count(*) FROM measurements);")
+        floats, profiles, measurements = cur.fetchone()
+    conn.close()
+    return {"floats": floats, "profiles": profiles, "measurements": measurements}
+
+
+def reset_tables(db_params):
+    conn = psycopg2.connect(**db_params)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(DROP_SQL)
+        conn.commit()
+        argo_schema.migrate(conn)
+    finally:
+        conn.close()
+
+
+def time_loader(loader, path, db_params):
+    reset_tables(db_params)
+    started = time.perf_counter()
+    # Both loaders print progress per profile; keep the report on stdout clean.
+    with contextlib.redirect_stdout(io.StringIO()):
+        loader(path, db_params)
+    seconds = time.perf_counter() - started
+    rows = count_rows(db_params)
+    return {
+        "seconds": round(seconds, 3),
+        "rows": rows,
+        "measurement_rows_per_sec": round(rows["measurements"] / seconds, 1),
+        "profiles_per_sec": round(rows["profiles"] / seconds, 1),
+    }
+
+
+def run(db_params, scale, loaders=tuple(LOADERS)):
+    with tempfile.TemporaryDirectory() as tmp:
+        files = {"bundled": BUNDLED_FILE}
+        if scale > 1:
+            files[f"scaled_x{scale}"] = write_scaled_file(BUNDLED_FILE, os.path.join(tmp, "scaled_prof.nc"), scale)
+        results, speedups = {}, {}
+        for file_label, path in files.items():
+            runs = {name: time_loader(LOADERS[name], path, db_params) for name in loaders}
+            # Rates are only comparable if every loader did the same work.
+            row_counts = {name: result["rows"] for name, result in runs.items()}
+            if len({json.dumps(rows, sort_keys=True) for rows in row_counts.values()}) > 1:
+                raise RuntimeError(f"Loaders produced different rows for {file_label}: {row_counts}")
+            results.update({f"{name}/{file_label}": result for name, result in runs.items()})
+            if {"row_by_row", "bulk_copy"} <= runs.keys():
+                speedups[file_label] = round(runs["bulk_copy"]["measurement_rows_per_sec"]
+                                             / max(runs["row_by_row"]["measurement_rows_per_sec"], 1e-6), 2)
+    return {"scale": scale, "results": results, "bulk_copy_speedup": speedups}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark loader rows/sec on the bundled and a scaled NetCDF file.")
+    parser.add_argument("--scale", type=int, default=10, help="Copies of the bundled profiles in the synthetic file.")
+    parser.add_argument("--loaders", nargs="+", choices=list(LOADERS), default=list(LOADERS))
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    parser.add_argument("--yes-drop-tables", action="store_true", help="Confirm the target database may be wiped.")
+    args = parser.parse_args()
+    if not args.yes_drop_tables:
+        parser.error("this benchmark drops the Argo tables; rerun with --yes-drop-tables against a scratch database")
+
+    report = run(argo_schema.DEFAULT_DB_PARAMS, args.scale, args.loaders)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
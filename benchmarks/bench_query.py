@@ -0,0 +1,214 @@
+"""
+End-to-end /query latency and throughput, fully offline.
+
+The LLM and embeddings come from the fake backend in core/llm.py (LLM_BACKEND=fake, fixed
+latency per call). The API runs in-process against Postgres from the POSTGRES_* variables (the
+PostGIS container from docker-compose.yml works). The bundled 20250912_prof.nc is bulk-loaded
+(idempotent) and the schema docs are embedded into a throwaway Chroma directory. For every
+--concurrency level, --requests queries are sent and p50/p95/p99 latency, throughput and the
+mean per-stage time from Server-Timing are reported as JSON.
+
+    python benchmarks/bench_query.py --concurrency 1 8 32 --requests 200 --output query_bench.json
+
+--url benchmarks an already running server instead (no set-up, real LLM unless it was started
+with LLM_BACKEND=fake).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, "floatchat-backend")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BACKEND_DIR)
+
+QUERIES = [
+    "Show the latest profiles in the Indian Ocean for September 2025",
+    "List the 10 most recent Argo profiles",
+    "Which floats reported a profile on 12 September 2025?",
+    "Show me recent profiles near the equator in the Arabian Sea",
+    "What are the newest cycles of float 2903793?",
+    "Get the last profiles from floats in the Bay of Bengal this month",
+]
+
+
+def _parse_server_timing(header: str) -> dict:
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration)
+    return stages
+
+
+def _latency_stats(latencies_ms: list) -> dict:
+    if not latencies_ms:
+        return {}
+    array = np.array(latencies_ms)
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2),
+            "mean_ms": round(array.mean(), 2), "max_ms": round(array.max(), 2)}
+
+
+async def drive(client, concurrency: int, total_requests: int, unique: bool, headers: dict = None) -> dict:
+    """
+    Sends total_requests POST /query calls from `concurrency` concurrent workers.
+    """
+    latencies, stage_totals, statuses = [], {}, {}
+    response_bytes = [0]
+    next_index = iter(range(total_requests))
+
+    async def worker():
+        for i in next_index:
+            query = QUERIES[i % len(QUERIES)]
+            if unique:
+                query = f"{query} (request {i})"
+            started = time.perf_counter()
+            response = await client.post("/query", json={"query": query}, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            response_bytes[0] += response.num_bytes_downloaded
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            for stage, ms in _parse_server_timing(response.headers.get("server-timing")).items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + ms
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 2),
+        "latency": _latency_stats(latencies),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "mean_response_bytes": round(response_bytes[0] / total_requests, 1),
+        "stage_mean_ms": {stage: round(total / total_requests, 2) for stage, total in stage_totals.items()},
+    }
+
+
+def prepare_offline_env(args, chroma_dir):
+    """
+    Configures the in-process app for offline runs. Must run before main is imported.
+    """
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["EMBEDDING_BACKEND"] = args.embedding_backend
+    # Every request comes from this one client; keep the global limit and coalescing only.
+    os.environ["QUERY_MAX_IN_FLIGHT_PER_CLIENT"] = "0"
+    if args.no_coalescing:
+        os.environ["QUERY_COALESCING_ENABLED"] = "false"
+    if args.no_cache:
+        os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+        os.environ["RESULT_CACHE_ENABLED"] = "false"
+
+    import argo_schema
+    import load_argo_data
+    import get_collection
+    from core import ai, llm
+
+    if not args.skip_load:
+        with contextlib.redirect_stdout(sys.stderr):
+            load_argo_data.bulk_load_argo_nc_to_postgres(os.path.join(ROOT, "20250912_prof.nc"),
+                                                         argo_schema.DEFAULT_DB_PARAMS)
+
+    import chromadb
+    docs = get_collection.fetch_schema_info()
+    embeddings = asyncio.run(llm.FakeBackend(latency=0).embed(docs))
+    collection = chromadb.PersistentClient(path=chroma_dir).get_or_create_collection(get_collection.COLLECTION_NAME)
+    collection.upsert(documents=docs, embeddings=embeddings, ids=[get_collection.doc_id(d) for d in docs])
+    ai.CHROMA_PATH = chroma_dir
+
+
+async def _wait_ready(client, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if (await client.get("/ready")).status_code == 200:
+            return
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API did not become ready; check Postgres and the POSTGRES_* variables.")
+
+
+COLUMNAR_HEADERS = {
+    "accept": "application/vnd.floatchat.columnar+json; precision=float32",
+    "accept-encoding": "br, gzip",
+}
+
+
+async def run_levels(client, args) -> list:
+    await _wait_ready(client, args.ready_timeout)
+    headers = COLUMNAR_HEADERS if args.columnar else None
+    # One untimed pass so first-request costs (imports, plan cache) are not counted.
+    await drive(client, 1, min(len(QUERIES), args.requests), args.unique, headers)
+    return [await drive(client, level, args.requests, args.unique, headers) for level in args.concurrency]
+
+
+async def run(args) -> dict:
+    import httpx
+    timeout = httpx.Timeout(args.request_timeout)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            levels = await run_levels(client, args)
+            cache = (await client.get("/cache")).json()
+            admission = (await client.get("/admission")).json()
+    else:
+        import main
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+                levels = await run_levels(client, args)
+                cache = (await client.get("/cache")).json()
+                admission = (await client.get("/admission")).json()
+    return {
+        "target": args.url or "in-process",
+        "llm_latency_ms": None if args.url else args.llm_latency_ms,
+        "embedding_backend": os.environ.get("EMBEDDING_BACKEND"),
+        "unique_queries": args.unique,
+        "caches_enabled": not args.no_cache,
+        "coalescing": not args.no_coalescing,
+        "columnar": args.columnar,
+        "levels": levels,
+        "cache": cache,
+        "admission": admission,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark /query latency and throughput offline.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level.")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="Latency of each fake LLM call.")
+    parser.add_argument("--embedding-backend", default="gemini", choices=["gemini", "local", "tfidf"],
+                        help="'gemini' routes embeddings through the fake backend as well.")
+    parser.add_argument("--unique", action="store_true", help="Make every query text distinct (no semantic cache hits).")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the semantic and result caches.")
+    parser.add_argument("--no-coalescing", action="store_true", help="Run every identical in-flight query separately.")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Ask for the compressed columnar response format (float32).")
+    parser.add_argument("--skip-load", action="store_true", help="Do not bulk-load the bundled NetCDF file first.")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app.")
+    parser.add_argument("--ready-timeout", type=float, default=60)
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    return parser
+
+
+def run_benchmark(args) -> dict:
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        if not args.url:
+            prepare_offline_env(args, chroma_dir)
+        return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    report = run_benchmark(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,175 @@
+"""
+Query latency before/after the index and partitioning migrations (argo_schema versions 4-5).
+
+Loads the bundled 20250912_prof.nc, replicates it SCALE times in SQL (same floats, shifted
+cycle numbers, earlier dates and jittered positions) to reach a realistic table size, times a
+set of queries shaped like the LLM-generated ones on the bare schema (version 3), applies the
+remaining migrations, and times them again. Prints a JSON report.
+
+DESTRUCTIVE: drops the Argo tables in the target database. Point it at a scratch database.
+
+    python benchmarks/bench_schema.py --scale 200 --yes-drop-tables --output schema_bench.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import argo_schema
+import load_argo_data
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED_FILE = os.path.join(ROOT, "20250912_prof.nc")
+BARE_SCHEMA_VERSION = 3
+
+DROP_SQL = """
+DROP VIEW IF EXISTS profile_cells;
+DROP TABLE IF EXISTS measurements, profiles, floats, float_latest_position, profile_counts_monthly,
+    depth_bin_means_monthly, ingest_manifest, data_version, schema_migrations CASCADE;
+"""
+
+REPLICATE_PROFILES_SQL = """
+INSERT INTO profiles (platform_number, cycle_number, direction, profile_time, location,
+                      profile_pres_qc, profile_temp_qc, profile_psal_qc)
+SELECT p.platform_number, p.cycle_number + k * 1000, p.direction, p.profile_time - make_interval(days => k),
+       ST_SetSRID(ST_MakePoint(
+           ST_X(p.location::geometry) + (random() - 0.5) * 20,
+           greatest(-89, least(89, ST_Y(p.location::geometry) + (random() - 0.5) * 20))
+       ), 4326)::geography,
+       p.profile_pres_qc, p.profile_temp_qc, p.profile_psal_qc
+FROM profiles p CROSS JOIN generate_series(1, %(scale)s) AS k
+WHERE p.cycle_number < 1000;
+"""
+
+REPLICATE_MEASUREMENTS_SQL = """
+INSERT INTO measurements (platform_number, cycle_number, pres_adjusted, pres_adjusted_qc,
+                          temp_adjusted, temp_adjusted_qc, psal_adjusted, psal_adjusted_qc)
+SELECT m.platform_number, m.cycle_number + k * 1000, m.pres_adjusted, m.pres_adjusted_qc,
+       m.temp_adjusted, m.temp_adjusted_qc, m.psal_adjusted, m.psal_adjusted_qc
+FROM measurements m CROSS JOIN generate_series(1, %(scale)s) AS k
+WHERE m.cycle_number < 1000;
+"""
+
+QUERIES = {
+    "profiles_within_500km": """
+        SELECT platform_number, cycle_number, profile_time FROM profiles
+        WHERE ST_DWithin(location, ST_GeographyFromText('SRID=4326;POINT(72.87 -19.07)'), 500000);
+    """,
+    "profiles_in_one_month": """
+        SELECT count(*) FROM profiles WHERE profile_time >= '2025-03-01' AND profile_time < '2025-04-01';
+    """,
+    "latest_profile_of_float": """
+        SELECT cycle_number, profile_time, ST_AsText(location) FROM profiles
+        WHERE platform_number = 2903793 ORDER BY profile_time DESC LIMIT 1;
+    """,
+    "one_profile_levels": """
+        SELECT pres_adjusted, temp_adjusted FROM measurements
+        WHERE platform_number = 2903793 AND cycle_number = 1064 ORDER BY pres_adjusted;
+    """,
+    "float_mean_temp_in_period": """
+        SELECT avg(m.temp_adjusted) FROM profiles p JOIN measurements m USING (platform_number, cycle_number)
+        WHERE p.platform_number = 1902573 AND p.profile_time >= '2025-01-01' AND p.profile_time < '2025-07-01';
+    """,
+    "region_period_mean_temp": """
+        SELECT avg(m.temp_adjusted) FROM profiles p JOIN measurements m USING (platform_number, cycle_number)
+        WHERE ST_DWithin(p.location, ST_GeographyFromText('SRID=4326;POINT(72.87 -19.07)'), 300000)
+          AND p.profile_time >= '2025-01-01' AND p.profile_time < '2025-04-01' AND m.pres_adjusted < 100;
+    """,
+}
+
+
+def time_queries(conn, repeats):
+    results = {}
+    with conn.cursor() as cur:
+        for name, sql in QUERIES.items():
+            cur.execute(sql)  # warm the cache and the plan
+            cur.fetchall()
+            samples = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                cur.execute(sql)
+                cur.fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name] = {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3)}
+    conn.rollback()
+    return results
+
+
+def table_counts(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT (SELECT count(*) FROM profiles), (SELECT count(*) FROM measurements);")
+        profiles, measurements = cur.fetchone()
+    conn.rollback()
+    return {"profiles": profiles, "measurements": measurements}
+
+
+def run(db_params, scale, repeats):
+    conn = psycopg2.connect(**db_params)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(DROP_SQL)
+        conn.commit()
+        argo_schema.migrate(conn, target=BARE_SCHEMA_VERSION)
+
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            load_argo_data.copy_nc_file_into_db(cur, BUNDLED_FILE)
+            cur.execute(REPLICATE_PROFILES_SQL, {"scale": scale})
+            cur.execute(REPLICATE_MEASUREMENTS_SQL, {"scale": scale})
+        conn.commit()
+        load_seconds = time.perf_counter() - started
+
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE;")
+        conn.autocommit = False
+        before = time_queries(conn, repeats)
+
+        started = time.perf_counter()
+        applied = argo_schema.migrate(conn)
+        migrate_seconds = time.perf_counter() - started
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE;")
+        conn.autocommit = False
+        after = time_queries(conn, repeats)
+
+        return {
+            "scale": scale,
+            "repeats": repeats,
+            "rows": table_counts(conn),
+            "load_seconds": round(load_seconds, 3),
+            "migrations_applied": applied,
+            "migrate_seconds": round(migrate_seconds, 3),
+            "queries": {
+                name: {
+                    "before": before[name],
+                    "after": after[name],
+                    "speedup": round(before[name]["median_ms"] / max(after[name]["median_ms"], 1e-6), 2),
+                }
+                for name in QUERIES
+            },
+        }
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark queries before/after the schema index and partition migrations.")
+    parser.add_argument("--scale", type=int, default=200, help="Copies of the bundled file to generate.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    parser.add_argument("--yes-drop-tables", action="store_true", help="Confirm the target database may be wiped.")
+    args = parser.parse_args()
+    if not args.yes_drop_tables:
+        parser.error("this benchmark drops the Argo tables; rerun with --yes-drop-tables against a scratch database")
+
+    report = run(argo_schema.DEFAULT_DB_PARAMS, args.scale, args.repeats)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
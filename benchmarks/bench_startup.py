@@ -0,0 +1,101 @@
+"""
+API worker start-up time: how long `import main` takes, and how long a fresh uvicorn worker
+needs before it answers / (liveness) and before /ready returns 200 (ChromaDB, schema index,
+query cache, LLM client and Postgres pool warm). Prints a JSON report.
+
+Runs from floatchat-backend with the current environment (POSTGRES_*, GEMINI_API_KEY, ...).
+--fake-llm sets LLM_BACKEND=fake so no Gemini key is needed.
+
+    python benchmarks/bench_startup.py --repeats 5 --fake-llm --output startup_bench.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, "floatchat-backend")
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def _status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as err:
+        return err.code
+    except OSError:
+        return None
+
+
+def time_import(env):
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def time_worker(env, port, timeout):
+    """
+    Starts one uvicorn worker and polls it; returns seconds until / and /ready first answer 200.
+    """
+    started = time.perf_counter()
+    worker = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    live_seconds = ready_seconds = None
+    try:
+        while time.perf_counter() - started < timeout and ready_seconds is None:
+            if live_seconds is None and _status(f"http://127.0.0.1:{port}/") == 200:
+                live_seconds = time.perf_counter() - started
+            if live_seconds is not None and _status(f"http://127.0.0.1:{port}/ready") == 200:
+                ready_seconds = time.perf_counter() - started
+            time.sleep(0.02)
+    finally:
+        worker.terminate()
+        worker.wait()
+    return live_seconds, ready_seconds
+
+
+def _summary(samples):
+    samples = [s for s in samples if s is not None]
+    if not samples:
+        return None
+    return {"median_s": round(statistics.median(samples), 3), "min_s": round(min(samples), 3),
+            "max_s": round(max(samples), 3)}
+
+
+def run(repeats, port, timeout, fake_llm):
+    env = dict(os.environ)
+    if fake_llm:
+        env["LLM_BACKEND"] = "fake"
+    imports = [time_import(env) for _ in range(repeats)]
+    workers = [time_worker(env, port, timeout) for _ in range(repeats)]
+    return {
+        "repeats": repeats,
+        "llm_backend": env.get("LLM_BACKEND", "gemini"),
+        "import_main": _summary(imports),
+        "time_to_live": _summary([live for live, _ in workers]),
+        "time_to_ready": _summary([ready for _, ready in workers]),
+        "never_ready": sum(ready is None for _, ready in workers),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark API import time and worker time-to-ready.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for /ready per worker.")
+    parser.add_argument("--fake-llm", action="store_true", help="Use the offline fake LLM backend.")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    report = run(args.repeats, args.port, args.timeout, args.fake_llm)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,103 @@
+"""
+Runs the offline benchmark suite (loader throughput and /query latency) and writes one JSON
+report with the git revision and environment, so releases can be compared. With --baseline,
+compares against an earlier report and exits with status 1 if any tracked metric regressed by
+more than --tolerance.
+
+DESTRUCTIVE: the loader benchmark drops the Argo tables. Point POSTGRES_* at a scratch database.
+
+    python benchmarks/run_all.py --yes-drop-tables --output bench_report.json
+    python benchmarks/run_all.py --yes-drop-tables --baseline bench_report.json --output new.json
+"""
+import os
+import sys
+import json
+import platform
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bench_loader
+import bench_query
+import argo_schema
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def tracked_metrics(report):
+    """
+    Flattens a suite report to {metric: (value, higher_is_better)}.
+    """
+    metrics = {}
+    for name, result in report["loader"]["results"].items():
+        metrics[f"loader/{name}/measurement_rows_per_sec"] = (result["measurement_rows_per_sec"], True)
+    for level in report["query"]["levels"]:
+        prefix = f"query/c{level['concurrency']}"
+        metrics[f"{prefix}/throughput_rps"] = (level["throughput_rps"], True)
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            metrics[f"{prefix}/{key}"] = (level["latency"][key], False)
+    return metrics
+
+
+def compare(baseline, current, tolerance):
+    """
+    Returns the metrics that got worse than baseline by more than tolerance (a fraction).
+    """
+    regressions = []
+    before = tracked_metrics(baseline)
+    for name, (value, higher_is_better) in tracked_metrics(current).items():
+        if name not in before or not before[name][0]:
+            continue
+        change = (value - before[name][0]) / before[name][0]
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({"metric": name, "baseline": before[name][0], "current": value,
+                                "change": round(change, 3)})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--scale", type=int, default=10, help="Synthetic file scale for the loader benchmark.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--baseline", help="Earlier report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression.")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    parser.add_argument("--yes-drop-tables", action="store_true", help="Confirm the target database may be wiped.")
+    args = parser.parse_args()
+    if not args.yes_drop_tables:
+        parser.error("the loader benchmark drops the Argo tables; rerun with --yes-drop-tables against a scratch database")
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "loader": bench_loader.run(argo_schema.DEFAULT_DB_PARAMS, args.scale),
+    }
+    query_args = bench_query.build_parser().parse_args([
+        "--concurrency", *map(str, args.concurrency), "--requests", str(args.requests),
+        "--llm-latency-ms", str(args.llm_latency_ms),
+    ])
+    report["query"] = bench_query.run_benchmark(query_args)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(json.load(f), report, args.tolerance)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if report.get("regressions"):
+        sys.exit(1)
@@ -1,22 +1,86 @@
-from fastapi import APIRouter, HTTPException
-from core.models import QueryRequest
-from core.ai import triage_query, generate_sql_from_query, interpret_results_for_frontend
-from core.db import execute_sql_query
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from core.models import QueryRequest, StreamRequest
+from core.ai import (
+    triage_query, embed_query, semantic_cache_usable, lookup_cached_query, store_cached_query,
+    retrieve_schema_context,
+    generate_sql_from_query, interpret_results_for_frontend, get_query_cache,
+    readiness as ai_readiness
+)
+from core.db import (
+    run_limited_sql_query, pool_metrics, ping_pool, rejected_plans, QueryRejected,
+    result_cache, sign_sql, verify_sql_signature, stream_sql_query
+)
+from core import metrics
+from core.admission import query_admission, client_key
+from core.export import (
+    ndjson_chunks, arrow_chunks, choose_format, NDJSON_MEDIA_TYPE, ARROW_MEDIA_TYPE,
+    columnar_options, encode_columnar, compress_body, COLUMNAR_MEDIA_TYPE
+)
 import logging
 
 router = APIRouter()
 
+def _discard_result(task: asyncio.Task):
+    # Mark the result as retrieved so an unused, failed schema lookup is not reported as unhandled.
+    if not task.cancelled():
+        task.exception()
+
 @router.post("/query")
-async def handle_query(request: QueryRequest):
-    user_query = request.query
+async def handle_query(request: QueryRequest, http_request: Request, response: Response):
+    """
+    Answers a natural-language question. Identical questions already in flight share one
+    pipeline run; over the in-flight limits the request gets 429 with Retry-After.
+    With "Accept: application/vnd.floatchat.columnar+json" (optionally "; precision=float32")
+    table_data comes back column-oriented and the body is compressed per Accept-Encoding.
+    """
+    options = columnar_options(http_request.headers.get("accept"))
+    result = await query_admission.run(client_key(http_request), request.query, lambda: answer_query(request.query))
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    if options is None:
+        return result
+
+    with metrics.span("encode"):
+        body = await run_in_threadpool(encode_columnar, result, options["float32"])
+        body, encoding = await run_in_threadpool(compress_body, body, http_request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    media_type = COLUMNAR_MEDIA_TYPE + ("; precision=float32" if options["float32"] else "")
+    return Response(content=body, media_type=media_type, headers=headers)
+
+async def answer_query(user_query: str):
     logging.info(f"--- New Query Received: {user_query} ---")
 
+    # A semantically equivalent earlier query lets us skip triage and SQL generation. Only embed up
+    # front when the cache can use the embedding; otherwise schema retrieval embeds the query itself,
+    # concurrently with triage.
+    query_embedding = cached = schema_task = None
+    if await semantic_cache_usable():
+        try:
+            query_embedding = await embed_query(user_query)
+        except Exception as e:
+            logging.error(f"Error embedding query, skipping semantic cache: {e!r}")
+        cached = await lookup_cached_query(user_query, query_embedding)
+
     try:
-        triage_result = triage_query(user_query)
+        if cached:
+            triage_result = {"decision": cached["decision"], "response": cached["response"]}
+        else:
+            # Schema retrieval does not depend on triage, so start it straight away (it embeds the
+            # query itself when query_embedding is None).
+            schema_task = asyncio.create_task(retrieve_schema_context(user_query, query_embedding))
+            schema_task.add_done_callback(_discard_result)
+            triage_result = await triage_query(user_query)
         decision = triage_result.get("decision")
         logging.info(f"Triage decision: {decision}")
+        metrics.QUERY_DECISIONS.inc(decision=str(decision), semantic_cache="hit" if cached else "miss")
 
         if decision == "direct_answer":
+            if not cached:
+                await store_cached_query(user_query, query_embedding, decision, response=triage_result.get("response"))
             return {
                 "natural_language_response": triage_result.get("response"),
                 "plot_data": None,
@@ -25,19 +89,53 @@ async def handle_query(request: QueryRequest):
             }
 
         elif decision == "database_query":
-            generated_sql = generate_sql_from_query(user_query)
-            query_results = execute_sql_query(generated_sql)
+            schema_context = None
+            if cached:
+                generated_sql = cached["sql"]
+            else:
+                schema_context = await schema_task
+                generated_sql = await generate_sql_from_query(user_query, schema_context)
+            try:
+                query_result = await run_limited_sql_query(generated_sql)
+            except QueryRejected as rejected:
+                # One retry: tell the LLM why the planner gate refused its query and ask for a narrower one.
+                generated_sql = await generate_sql_from_query(
+                    user_query, schema_context, rejected_sql=generated_sql, rejection_reason=rejected.reason
+                )
+                try:
+                    query_result = await run_limited_sql_query(generated_sql)
+                except QueryRejected as rejected_again:
+                    return {
+                        "natural_language_response": (
+                            f"Answering this would need a very expensive database query ({rejected_again.reason}). "
+                            "Please narrow it down by float number, region, depth or date range."
+                        ),
+                        "plot_data": None,
+                        "table_data": None,
+                        "generated_sql": None
+                    }
+                cached = None  # replace the cached SQL with the narrowed query
+            if not cached:
+                await store_cached_query(user_query, query_embedding, decision, sql=generated_sql)
+            query_results = query_result["rows"]
 
             if not query_results:
                 return {
                     "natural_language_response": "I found no data matching your query. Please try asking in a different way.",
                     "plot_data": None,
                     "table_data": None,
-                    "generated_sql": generated_sql
+                    "generated_sql": generated_sql,
+                    "sql_signature": sign_sql(generated_sql)
                 }
 
-            final_response = interpret_results_for_frontend(user_query, query_results)
+            final_response = await interpret_results_for_frontend(
+                user_query, query_results, truncated=query_result["truncated"], total_rows=query_result["total_rows"]
+            )
             final_response["generated_sql"] = generated_sql
+            final_response["sql_signature"] = sign_sql(generated_sql)
+            final_response["truncated"] = query_result["truncated"]
+            final_response["total_rows"] = query_result["total_rows"]
+            final_response["total_rows_estimated"] = query_result["total_rows_estimated"]
 
             logging.info("--- Query Processed Successfully ---")
             return final_response
@@ -51,7 +149,102 @@ async def handle_query(request: QueryRequest):
     except Exception as e:
         logging.error(f"Unexpected error in handle_query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if schema_task:
+            schema_task.cancel()
+
+@router.post("/query/stream")
+async def stream_query(request: StreamRequest, http_request: Request):
+    """
+    Streams every row of a previously generated query as NDJSON or an Arrow IPC stream.
+    Only SQL returned (and signed) by /query is accepted, and it goes through the planner gate
+    again with the stream's own cost and time limits (422 when it is over them).
+    """
+    if not verify_sql_signature(request.generated_sql, request.sql_signature):
+        raise HTTPException(status_code=403, detail="generated_sql does not match its sql_signature.")
+    output_format = choose_format(request.format, http_request.headers.get("accept"))
+
+    batches = stream_sql_query(request.generated_sql)
+    # Run the query before answering so SQL errors still produce a proper error status.
+    first = await run_in_threadpool(next, batches, None)
+
+    def replay():
+        if first is not None:
+            yield first
+        yield from batches
+
+    encode = arrow_chunks if output_format == "arrow" else ndjson_chunks
+
+    async def body():
+        try:
+            iterator = encode(replay())
+            while True:
+                chunk = await run_in_threadpool(next, iterator, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            # Also runs when the client disconnects: releases the cursor and pooled connection.
+            await run_in_threadpool(batches.close)
+
+    logging.info(f"Streaming {output_format} results for: {request.generated_sql}")
+    media_type = ARROW_MEDIA_TYPE if output_format == "arrow" else NDJSON_MEDIA_TYPE
+    return StreamingResponse(body(), media_type=media_type)
 
 @router.get("/")
 def read_root():
     return {"message": "FloatChat Agent Backend (Postgres/PostGIS) is running."}
+
+@router.get("/ready")
+async def read_readiness(request: Request):
+    """
+    Readiness probe: 503 until the lifespan warm-up has opened ChromaDB, the schema index,
+    the query cache, the LLM client and a working Postgres pool.
+    """
+    components = ai_readiness()
+    components["db_pool"] = await run_in_threadpool(ping_pool)
+    ready = all(components.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "components": components,
+            "warm_up_seconds": getattr(request.app.state, "warm_up_seconds", None),
+        },
+    )
+
+@router.get("/pool")
+def read_pool_metrics():
+    return pool_metrics()
+
+@router.get("/metrics")
+def read_metrics():
+    """
+    Prometheus text exposition: stage/request latency histograms, LLM prompt/response sizes,
+    row counts, plus pool and cache counters sampled at scrape time.
+    """
+    gauges = []
+    for key, value in pool_metrics().items():
+        gauges.append((f"floatchat_db_pool_{key}", f"Postgres pool {key.replace('_', ' ')}.", value))
+    for cache_name, stats in (("semantic", get_query_cache().stats()), ("results", result_cache.stats())):
+        for key in ("entries", "hits", "misses", "evictions", "invalidations", "bytes"):
+            if key in stats:
+                gauges.append((f"floatchat_{cache_name}_cache_{key}", f"{cache_name.title()} cache {key}.", stats[key]))
+    for key in ("running", "distinct_in_flight", "clients_in_flight"):
+        gauges.append((f"floatchat_query_{key}", f"/query {key.replace('_', ' ')}.", query_admission.stats()[key]))
+    return Response(content=metrics.render_prometheus(gauges), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+@router.get("/plans/rejected")
+def read_rejected_plans():
+    """
+    Generated queries refused by the planner gate or cancelled by their statement_timeout, newest first.
+    """
+    return {"rejected": rejected_plans()}
+
+@router.get("/cache")
+def read_cache_stats():
+    return {"semantic": get_query_cache().stats(), "results": result_cache.stats()}
+
+@router.get("/admission")
+def read_admission_stats():
+    return query_admission.stats()
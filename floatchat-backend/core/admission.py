@@ -0,0 +1,123 @@
+import os
+import asyncio
+import logging
+from fastapi import HTTPException
+from core import metrics
+from core.cache import normalize_query
+
+# --- ADMISSION CONFIGURATION ---
+# Pipelines (LLM + Postgres) allowed to run at once across all clients, and /query requests one
+# client may have in flight, coalesced or not. 0 disables a limit. Requests over a limit get 429
+# with Retry-After instead of queueing behind the LLM stage semaphores.
+QUERY_MAX_IN_FLIGHT = int(os.getenv("QUERY_MAX_IN_FLIGHT", "64"))
+QUERY_MAX_IN_FLIGHT_PER_CLIENT = int(os.getenv("QUERY_MAX_IN_FLIGHT_PER_CLIENT", "8"))
+QUERY_RETRY_AFTER_SECONDS = int(os.getenv("QUERY_RETRY_AFTER_SECONDS", "2"))
+QUERY_COALESCING_ENABLED = os.getenv("QUERY_COALESCING_ENABLED", "true").lower() == "true"
+# Header identifying the client behind a trusted proxy (e.g. X-Forwarded-For); default is the peer address.
+QUERY_CLIENT_HEADER = os.getenv("QUERY_CLIENT_HEADER")
+
+
+class TooManyRequests(HTTPException):
+    """
+    Raised when a /query request is over the global or per-client in-flight limit.
+    """
+    def __init__(self, scope: str):
+        super().__init__(
+            status_code=429,
+            detail=f"Too many queries in flight ({scope}); retry in {QUERY_RETRY_AFTER_SECONDS}s.",
+            headers={"Retry-After": str(QUERY_RETRY_AFTER_SECONDS)},
+        )
+        self.scope = scope
+
+
+def client_key(request) -> str:
+    if QUERY_CLIENT_HEADER:
+        forwarded = request.headers.get(QUERY_CLIENT_HEADER)
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class QueryAdmission:
+    """
+    Single-flight coalescing plus in-flight limits for /query. Identical normalized queries
+    in flight together share one pipeline run (an asyncio task) and all receive its result or
+    exception. Only event-loop code touches the counters, so no lock is needed.
+    """
+    def __init__(self, max_in_flight=QUERY_MAX_IN_FLIGHT, max_per_client=QUERY_MAX_IN_FLIGHT_PER_CLIENT,
+                 coalescing=QUERY_COALESCING_ENABLED):
+        self.max_in_flight = max_in_flight
+        self.max_per_client = max_per_client
+        self.coalescing = coalescing
+        self._flights = {}  # normalized query -> running pipeline task
+        self._running = 0
+        self._per_client = {}
+        self.coalesced = 0
+        self.rejected = 0
+
+    def _admit_client(self, client: str):
+        if self.max_per_client and self._per_client.get(client, 0) >= self.max_per_client:
+            self.rejected += 1
+            metrics.QUERY_ADMISSION.inc(outcome="rejected_client")
+            raise TooManyRequests("per client")
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+
+    def _release_client(self, client: str):
+        remaining = self._per_client.pop(client) - 1
+        if remaining:
+            self._per_client[client] = remaining
+
+    def _start(self, key: str, pipeline):
+        if self.max_in_flight and self._running >= self.max_in_flight:
+            self.rejected += 1
+            metrics.QUERY_ADMISSION.inc(outcome="rejected_global")
+            raise TooManyRequests("server")
+        self._running += 1
+        metrics.QUERY_ADMISSION.inc(outcome="started")
+        task = asyncio.create_task(pipeline())
+        if self.coalescing:
+            self._flights[key] = task
+
+        def finished(done):
+            self._running -= 1
+            if self._flights.get(key) is done:
+                del self._flights[key]
+            # Retrieve the outcome so a failure nobody is waiting for any more is not logged as unhandled.
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(finished)
+        return task
+
+    async def run(self, client: str, query: str, pipeline):
+        """
+        Runs pipeline() for query on behalf of client, or joins the identical run already in
+        flight. A caller that disconnects does not cancel a run other callers are waiting on.
+        """
+        self._admit_client(client)
+        try:
+            key = normalize_query(query)
+            task = self._flights.get(key) if self.coalescing else None
+            if task is not None:
+                self.coalesced += 1
+                metrics.QUERY_ADMISSION.inc(outcome="coalesced")
+                logging.info(f"Joining in-flight query: {key}")
+                with metrics.span("coalesced_wait"):
+                    return await asyncio.shield(task)
+            return await asyncio.shield(self._start(key, pipeline))
+        finally:
+            self._release_client(client)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "distinct_in_flight": len(self._flights),
+            "clients_in_flight": len(self._per_client),
+            "max_in_flight": self.max_in_flight,
+            "max_in_flight_per_client": self.max_per_client,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
+
+
+query_admission = QueryAdmission()
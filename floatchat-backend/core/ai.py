@@ -1,10 +1,14 @@
-import os
 import json
+import asyncio
 import logging
-import google.generativeai as genai
-import chromadb
+import threading
 from fastapi import HTTPException
 from dotenv import load_dotenv
+from core import llm, metrics
+from core.cache import SemanticCache, SEMANTIC_CACHE_ENABLED
+from core.db import MAX_ROWS
+from core.retrieval import build_schema_index, EMBEDDING_BACKEND, LOCAL_EMBEDDING_BACKENDS
+from core.summarize import summarize_results, build_plot_data
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,24 +16,106 @@ load_dotenv()
 # --- AI AND CHROMADB INITIALIZATION ---
 logging.basicConfig(level=logging.INFO)
 
-try:
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-except Exception as e:
-    logging.error(f"Error configuring Gemini API: {e}")
+CHROMA_PATH = "chroma_db"
+# The schema corpus is a few dozen docs, so it is embedded once into an in-process index.
+# With EMBEDDING_BACKEND "local" or "tfidf" it replaces the remote embedding + Chroma query;
+# with "gemini" it is only used when the embedding API fails.
+SCHEMA_CONTEXT_DOCS = 10
 
-try:
-    chroma_client = chromadb.PersistentClient(path="chroma_db")
-    collection = chroma_client.get_collection(name="postgres_schema_info")
-    logging.info("Successfully connected to ChromaDB and retrieved collection.")
-except Exception as e:
-    logging.error(f"Error connecting to ChromaDB: {e}")
-    collection = None
+# Created on first use (or by warm_up() from the FastAPI lifespan), so importing this module
+# does not open Chroma. Failed lookups are retried on the next call.
+_chroma_client = None
+_collection = None
+_query_cache = None
+_schema_index = None
+_resources_lock = threading.RLock()
 
-embedding_model = "models/text-embedding-004"
-generation_model = genai.GenerativeModel('gemini-2.5-flash')
+
+def get_chroma_client():
+    global _chroma_client
+    with _resources_lock:
+        if _chroma_client is None:
+            import chromadb
+            _chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return _chroma_client
+
+
+def get_schema_collection():
+    """
+    Returns the postgres_schema_info collection, or None if ChromaDB is not available.
+    """
+    global _collection
+    with _resources_lock:
+        if _collection is None:
+            try:
+                _collection = get_chroma_client().get_collection(name="postgres_schema_info")
+                logging.info("Successfully connected to ChromaDB and retrieved collection.")
+            except Exception as e:
+                logging.error(f"Error connecting to ChromaDB: {e}")
+    return _collection
+
+
+def get_query_cache() -> SemanticCache:
+    global _query_cache
+    with _resources_lock:
+        if _query_cache is None:
+            try:
+                _query_cache = SemanticCache(get_chroma_client())
+            except Exception as e:
+                logging.error(f"Error opening persistent query cache, falling back to memory only: {e}")
+                _query_cache = SemanticCache()
+    return _query_cache
+
+
+def get_schema_index():
+    """
+    Returns the in-process schema index built from the Chroma schema docs, or None.
+    """
+    global _schema_index
+    with _resources_lock:
+        if _schema_index is None:
+            collection = get_schema_collection()
+            try:
+                _schema_index = build_schema_index(collection.get(include=["documents"])["documents"] if collection else [])
+            except Exception as e:
+                logging.error(f"Error building local schema index: {e}")
+    return _schema_index
+
+
+async def _local_schema_index():
+    """
+    Returns the schema index when it replaces the remote embedding (EMBEDDING_BACKEND "local"
+    or "tfidf"), else None. Initialized off the event loop if warm_up() has not finished yet.
+    """
+    if EMBEDDING_BACKEND not in LOCAL_EMBEDDING_BACKENDS:
+        return None
+    return await asyncio.to_thread(get_schema_index)
+
+
+def warm_up():
+    """
+    Opens ChromaDB, the query cache and the schema index and creates the LLM client.
+    Blocking; the FastAPI lifespan runs it in a thread after the app starts accepting connections.
+    """
+    get_query_cache()
+    get_schema_index()
+    llm.get_backend()
+    return readiness()
+
+
+def readiness() -> dict:
+    """
+    Reports which AI-side dependencies are initialized, without initializing them.
+    """
+    return {
+        "chroma": _collection is not None,
+        "schema_index": _schema_index is not None,
+        "query_cache": _query_cache is not None,
+        "model": llm.backend_ready(),
+    }
 
 # --- AI FUNCTIONS ---
-def triage_query(user_query: str) -> dict:
+async def triage_query(user_query: str) -> dict:
     """
     First AI step: Determines if a query can be answered directly or needs database access.
     """
@@ -47,30 +133,137 @@ def triage_query(user_query: str) -> dict:
     User Query: "{user_query}"
     """
     try:
-        response = generation_model.generate_content(prompt)
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
+        with metrics.span("triage"):
+            response_text = await llm.generate("triage", prompt)
+        cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
         return json.loads(cleaned_response)
     except Exception as e:
-        logging.error(f"Error in triage_query: {e}")
+        logging.error(f"Error in triage_query: {e!r}")
         return {"decision": "database_query", "response": ""}
 
-def generate_sql_from_query(user_query: str) -> str:
+async def embed_query(user_query: str) -> list:
     """
-    Generates a SQL query for PostgreSQL/PostGIS using schema context from ChromaDB.
+    Returns the embedding of the user's query, shared by the semantic cache and schema retrieval.
+    """
+    with metrics.span("embed"):
+        schema_index = await _local_schema_index()
+        if schema_index is not None:
+            return (await asyncio.to_thread(schema_index.embed_query, user_query)).tolist()
+        return (await llm.embed([user_query]))[0]
+
+async def _embedding_space(query_embedding: list):
     """
-    if not collection:
+    Names the space query embeddings come from ("gemini:768", "local:384"), or None when they
+    must not key the semantic cache (TF-IDF, including "local" without sentence-transformers).
+    """
+    if query_embedding is None:
+        return None
+    schema_index = await _local_schema_index()
+    if schema_index is None:
+        return f"{llm.LLM_BACKEND}:{len(query_embedding)}"
+    if not schema_index.embedder.cacheable:
+        return None
+    return f"{schema_index.embedder.name}:{len(query_embedding)}"
+
+async def semantic_cache_usable() -> bool:
+    """
+    True when query embeddings can key the semantic cache: it is enabled and the embedder is not
+    TF-IDF. When False, handle_query skips the up-front embedding and lookup.
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return False
+    schema_index = await _local_schema_index()
+    return schema_index is None or schema_index.embedder.cacheable
+
+async def lookup_cached_query(user_query: str, query_embedding: list):
+    """
+    Returns a cached triage decision/SQL for a semantically equivalent earlier query, or None.
+    A failing lookup counts as a miss.
+    """
+    space = await _embedding_space(query_embedding)
+    if not SEMANTIC_CACHE_ENABLED or space is None:
+        return None
+    with metrics.span("semantic_cache"):
+        try:
+            query_cache = await asyncio.to_thread(get_query_cache)
+            cached = await asyncio.to_thread(query_cache.lookup, query_embedding, space, user_query)
+        except Exception as e:
+            logging.error(f"Semantic cache lookup failed, treating as a miss: {e!r}")
+            return None
+    if cached:
+        logging.info(f"Semantic cache hit ({cached['similarity']:.3f}) for: {cached['query']}")
+    return cached
+
+async def store_cached_query(user_query: str, query_embedding: list, decision: str, sql: str = "", response: str = ""):
+    """
+    Records a triage decision/SQL in the semantic cache (persisted off the event loop).
+    """
+    space = await _embedding_space(query_embedding)
+    if not SEMANTIC_CACHE_ENABLED or space is None:
+        return
+    with metrics.span("semantic_cache_store"):
+        query_cache = await asyncio.to_thread(get_query_cache)
+        await asyncio.to_thread(query_cache.store, user_query, query_embedding, space, decision, sql, response)
+
+async def retrieve_schema_context(user_query: str, query_embedding: list = None) -> str:
+    """
+    Embeds the query (unless already embedded) and retrieves the most relevant schema docs,
+    from the local index when configured, otherwise from ChromaDB with the local index as fallback.
+    Independent of triage, so handle_query starts it while triage is running.
+    """
+    with metrics.span("schema_retrieval"):
+        return await _retrieve_schema_context(user_query, query_embedding)
+
+async def _retrieve_schema_context(user_query: str, query_embedding: list = None) -> str:
+    collection = await asyncio.to_thread(get_schema_collection)
+    schema_index = await asyncio.to_thread(get_schema_index)
+    if not collection and not schema_index:
         raise HTTPException(status_code=500, detail="ChromaDB collection not available.")
 
-    # Step 1: Get schema context from ChromaDB
     try:
-        query_embedding = genai.embed_content(model=embedding_model, content=[user_query])['embedding']
-        results = collection.query(query_embeddings=query_embedding, n_results=10)
-        schema_context = "\n".join(doc for doc in results['documents'][0])
+        if schema_index is not None and EMBEDDING_BACKEND in LOCAL_EMBEDDING_BACKENDS:
+            if query_embedding is None:
+                query_embedding = await embed_query(user_query)
+            docs = schema_index.search_by_vector(query_embedding, SCHEMA_CONTEXT_DOCS)
+        else:
+            try:
+                if query_embedding is None:
+                    query_embedding = await embed_query(user_query)
+                results = await asyncio.to_thread(
+                    collection.query, query_embeddings=[query_embedding], n_results=SCHEMA_CONTEXT_DOCS
+                )
+                docs = results['documents'][0]
+            except Exception as e:
+                if not schema_index:
+                    raise
+                logging.error(f"Remote schema retrieval failed, using local index: {e!r}")
+                docs = await asyncio.to_thread(schema_index.search, user_query, SCHEMA_CONTEXT_DOCS)
+        schema_context = "\n".join(doc for doc in docs)
         logging.info(f"Retrieved schema context for query: {user_query}")
+        return schema_context
     except Exception as e:
-        logging.error(f"Error getting schema context: {e}")
+        logging.error(f"Error getting schema context: {e!r}")
         raise HTTPException(status_code=500, detail="Failed to retrieve schema context.")
 
+async def generate_sql_from_query(user_query: str, schema_context: str = None, rejected_sql: str = None,
+                                  rejection_reason: str = None) -> str:
+    """
+    Generates a SQL query for PostgreSQL/PostGIS using schema context from ChromaDB.
+    When the planner gate rejected a previous attempt, asks for a narrower query instead.
+    """
+    # Step 1: Get schema context from ChromaDB (unless the caller already fetched it)
+    if schema_context is None:
+        schema_context = await retrieve_schema_context(user_query)
+
+    narrowing = ""
+    if rejected_sql:
+        narrowing = f"""
+    **Previous Attempt (rejected as too expensive: {rejection_reason}):**
+    {rejected_sql}
+    Write a cheaper query: filter on platform_number, profile_time ranges or a region, aggregate in SQL,
+    prefer the rollup tables, never cross join profiles and measurements, and add a LIMIT.
+    """
+
     # Step 2: Generate SQL using the context
     prompt = f"""
     You are an expert PostgreSQL/PostGIS programmer. Given the schema context and a user question, generate a single, executable SQL SELECT query.
@@ -80,7 +273,7 @@ def generate_sql_from_query(user_query: str) -> str:
 
     **User Question:**
     "{user_query}"
-
+    {narrowing}
     **Instructions:**
     - Only generate the SQL query. No explanations or markdown.
     - Use PostgreSQL JSON operators (->, ->>, #>) for JSON columns.
@@ -90,61 +283,79 @@ def generate_sql_from_query(user_query: str) -> str:
     **PostgreSQL Query:**
     """
     try:
-        response = generation_model.generate_content(prompt)
-        sql_query = response.text.strip().replace("```sql", "").replace("```", "")
+        with metrics.span("sql_generation"):
+            response_text = await llm.generate("sql", prompt)
+        sql_query = response_text.strip().replace("```sql", "").replace("```", "")
         if not sql_query.upper().startswith("SELECT"):
             raise ValueError("Generated query is not a SELECT statement.")
         logging.info(f"Generated SQL: {sql_query}")
         return sql_query
     except Exception as e:
-        logging.error(f"Error generating SQL: {e}")
+        logging.error(f"Error generating SQL: {e!r}")
         raise HTTPException(status_code=500, detail="AI query generation failed.")
 
-def interpret_results_for_frontend(user_query: str, db_results: list) -> dict:
+async def interpret_results_for_frontend(user_query: str, db_results: list, truncated: bool = False,
+                                         total_rows: int = None) -> dict:
     """
     Converts database results into natural language, Plotly data, or tabular data.
-    Adds safeguard for large datasets.
+    The LLM only sees a compact summary and picks a plot spec; the Plotly traces are built
+    on the server from the full rows.
+    Adds safeguard for large datasets: a truncated sample is returned as a table without an LLM call.
     """
 
     # --- Step 0: Check for too many rows ---
-    MAX_ROWS = 1000
-    if len(db_results) > MAX_ROWS:
+    if truncated or len(db_results) > MAX_ROWS:
+        total_rows = total_rows or len(db_results)
         return {
             "natural_language_response": (
-                f"Your query returned {len(db_results)} rows. "
-                "Please narrow down your request by specifying float numbers, parameters, or date ranges "
+                f"Your query matches about {total_rows} rows, so only the first {min(len(db_results), MAX_ROWS)} "
+                "are shown. Please narrow down your request by specifying float numbers, parameters, or date ranges "
                 "so that fewer rows are returned."
             ),
             "plot_data": None,
-            "table_data": None
+            "table_data": db_results[:MAX_ROWS]
         }
     
+    # --- Step 1: Summarize the rows; the LLM never sees the full result set ---
+    with metrics.span("summarize"):
+        summary = await asyncio.to_thread(summarize_results, db_results)
+
     prompt = f"""
-    You are a data analysis assistant. You have a user's question and the corresponding data from a PostgreSQL/PostGIS database.
+    You are a data analysis assistant. You have a user's question and a summary of the corresponding data from a PostgreSQL/PostGIS database.
+    The summary has the row count, per-column statistics, mean values per depth bin (when pressure is present) and a few sample rows.
     Your task is to create a final JSON response. The JSON must contain:
     1. "natural_language_response": A friendly, natural language answer summarizing the key findings.
-    2. "plot_data": A Plotly-compatible JSON object if a "plot", "graph", or "chart" is requested. Otherwise, it MUST be null.
-    3. "table_data": The raw data formatted for a frontend table. Populate this if the user asks to "show", "list", "get", or "find" data and does not ask for a plot.
+    2. "plot": If a "plot", "graph", or "chart" is requested, an object {{"type": "scatter" | "line" | "bar", "x": column, "y": column, "group_by": column or null, "title": string}}. Otherwise, it MUST be null.
+    3. "show_table": true if the user asks to "show", "list", "get", or "find" data and does not ask for a plot, otherwise false.
 
     **User's Question:**
     "{user_query}"
 
-    **Data from Database:**
-    {json.dumps(db_results, indent=2)}
+    **Data Summary:**
+    {json.dumps(summary, default=str, separators=(",", ":"))}
 
     **Instructions for your response:**
-    - For plotting requests, create a plot_data object. If only one series, use index for x-axis.
-    - For tabular requests, populate table_data with raw rows.
+    - "x" and "y" must be column names from the summary. If only one series, use "index" for x.
+    - For depth profiles, put the pressure column on "y" and group_by the profile (e.g. cycle_number) when there are several.
+    - The server draws the plot and the table from the full data, so never copy rows into your answer.
     - Always provide a natural_language_response.
 
     **Final JSON:**
     """
     try:
-        response = generation_model.generate_content(prompt)
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-        return json.loads(cleaned_response)
+        with metrics.span("interpret"):
+            response_text = await llm.generate("interpret", prompt)
+        cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
+        interpretation = json.loads(cleaned_response)
+        with metrics.span("plot"):
+            plot_data = await asyncio.to_thread(build_plot_data, db_results, interpretation.get("plot"))
+        return {
+            "natural_language_response": interpretation.get("natural_language_response"),
+            "plot_data": plot_data,
+            "table_data": db_results if interpretation.get("show_table") or (interpretation.get("plot") and not plot_data) else None
+        }
     except Exception as e:
-        logging.error(f"Error in interpret_results_for_frontend: {e}")
+        logging.error(f"Error in interpret_results_for_frontend: {e!r}")
         return {
             "natural_language_response": "I was able to retrieve the data, but had trouble interpreting it for a final answer.",
             "plot_data": None,
@@ -0,0 +1,325 @@
+import os
+import re
+import time
+import zlib
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# --- SEMANTIC CACHE CONFIGURATION ---
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+# Numbers (float IDs, years, days, depths, coordinates) and month names must match for a hit:
+# questions that differ only in those embed almost identically but need different SQL.
+_NUMBER = re.compile(r"\d+(?:[.:/-]\d+)*")
+_WORD = re.compile(r"[a-z]+")
+_MONTHS = {name: name[:3] for name in (
+    "january", "february", "march", "april", "may", "june", "july", "august", "september",
+    "october", "november", "december",
+)}
+_MONTHS.update({abbreviation: abbreviation for abbreviation in _MONTHS.values()})
+_MONTHS["sept"] = "sep"
+
+
+def query_literals(query: str) -> frozenset:
+    text = query.lower()
+    return frozenset(_NUMBER.findall(text)) | {_MONTHS[word] for word in _WORD.findall(text) if word in _MONTHS}
+
+
+QUERY_CACHE_COLLECTION = "query_cache"
+# Entries written before spaces were recorded were keyed with Gemini embeddings.
+LEGACY_SPACE = "gemini:768"
+
+
+def cache_collection_name(space: str) -> str:
+    """
+    Chroma collections have a fixed dimension, so every embedding space persists to its own one.
+    """
+    if space == LEGACY_SPACE:
+        return QUERY_CACHE_COLLECTION
+    return f"{QUERY_CACHE_COLLECTION}_{re.sub(r'[^a-z0-9]+', '_', space.lower()).strip('_')}"
+
+
+class SemanticCache:
+    """
+    Caches the triage decision and generated SQL per query embedding.
+    A lookup hits when the cosine similarity to a cached query is >= threshold and both
+    queries contain the same numbers and month names (see query_literals).
+    Entries live in memory (LRU + TTL) and are mirrored to Chroma (one collection per embedding
+    space) when a client is given, so the cache survives restarts. Each entry is tagged with the
+    space it was keyed in ("gemini:768", "local:384", ...) and only compared with queries from
+    the same space.
+    """
+    def __init__(self, client=None, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS):
+        self.client = client
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.literal_mismatches = 0
+        self._entries = OrderedDict()  # id -> entry dict, least recently used first
+        self._matrices = {}  # space -> (ids, unit-norm embeddings with rows aligned to ids)
+        self._collections = {}  # space -> Chroma collection
+        self._lock = threading.Lock()
+        if client is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            names = [getattr(c, "name", c) for c in self.client.list_collections()]
+            collections = [self.client.get_collection(name) for name in names
+                           if name == QUERY_CACHE_COLLECTION or name.startswith(QUERY_CACHE_COLLECTION + "_")]
+            stored = [(collection, collection.get(include=["embeddings", "metadatas"])) for collection in collections]
+        except Exception as e:
+            logging.error(f"Error loading semantic cache from ChromaDB: {e}")
+            return
+        entries = []
+        for collection, rows in stored:
+            space = (collection.metadata or {}).get("space", LEGACY_SPACE)
+            self._collections[space] = collection
+            entries.extend((space, *row) for row in zip(rows["ids"], rows["embeddings"], rows["metadatas"]))
+        entries.sort(key=lambda item: item[3]["last_used"])
+        now = time.time()
+        expired = []
+        for space, entry_id, embedding, metadata in entries:
+            if now - metadata["created_at"] > self.ttl_seconds:
+                expired.append((entry_id, space))
+                continue
+            self._entries[entry_id] = dict(metadata, space=metadata.get("space") or f"gemini:{len(embedding)}",
+                                           literals=query_literals(metadata["query"]),
+                                           embedding=self._unit(embedding))
+        self._drop_from_store(expired + self._evict_overflow())
+        self._matrices = {}
+        logging.info(f"Loaded {len(self._entries)} semantic cache entries from ChromaDB.")
+
+    def _collection(self, space: str):
+        if space not in self._collections and self.client is not None:
+            self._collections[space] = self.client.get_or_create_collection(
+                name=cache_collection_name(space), metadata={"hnsw:space": "cosine", "space": space}
+            )
+        return self._collections.get(space)
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _space_matrix(self, space: str):
+        """
+        Returns (ids, unit embedding matrix) for the entries of one embedding space, built lazily.
+        """
+        if space not in self._matrices:
+            ids = [i for i, e in self._entries.items() if e["space"] == space]
+            matrix = np.stack([self._entries[i]["embedding"] for i in ids]) if ids else None
+            self._matrices[space] = (ids, matrix)
+        return self._matrices[space]
+
+    def _drop_from_store(self, dropped):
+        """
+        Deletes (entry id, space) pairs from their Chroma collections.
+        """
+        by_space = {}
+        for entry_id, space in dropped:
+            by_space.setdefault(space, []).append(entry_id)
+        for space, ids in by_space.items():
+            try:
+                collection = self._collection(space)
+                if collection is not None:
+                    collection.delete(ids=ids)
+            except Exception as e:
+                logging.error(f"Error deleting semantic cache entries: {e}")
+
+    def _evict_overflow(self) -> list:
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            entry_id, entry = self._entries.popitem(last=False)
+            evicted.append((entry_id, entry["space"]))
+        self.evictions += len(evicted)
+        return evicted
+
+    def lookup(self, embedding, space: str, query_text: str):
+        """
+        Returns the cached entry of the same embedding space most similar to the embedding that
+        clears the threshold and has the same literals as query_text, else None. Blocking (the
+        TTL scan and matrix rebuild are O(entries)); call via a thread.
+        """
+        query = self._unit(embedding)
+        literals = query_literals(query_text)
+        with self._lock:
+            now = time.time()
+            expired = [(i, e["space"]) for i, e in self._entries.items() if now - e["created_at"] > self.ttl_seconds]
+            for entry_id, _ in expired:
+                del self._entries[entry_id]
+            if expired:
+                self.evictions += len(expired)
+                self._matrices = {}
+            ids, matrix = self._space_matrix(space)
+
+            result = None
+            if ids and matrix.shape[1] == query.shape[0]:
+                scores = matrix @ query
+                (candidates,) = np.nonzero(scores >= self.threshold)
+                for index in candidates[np.argsort(-scores[candidates])]:
+                    entry = self._entries[ids[index]]
+                    if entry["literals"] != literals:
+                        self.literal_mismatches += 1
+                        continue
+                    entry["last_used"] = now
+                    self._entries.move_to_end(ids[index])
+                    result = {key: entry[key] for key in ("query", "decision", "response", "sql")}
+                    result["similarity"] = float(scores[index])
+                    break
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self._drop_from_store(expired)
+        return result
+
+    def store(self, query: str, embedding, space: str, decision: str, sql: str = "", response: str = ""):
+        """
+        Adds or refreshes an entry and persists it. Blocking (writes to Chroma); call via a thread.
+        """
+        entry_id = hashlib.sha256(f"{space}\n{normalize_query(query)}".encode("utf-8")).hexdigest()
+        now = time.time()
+        metadata = {
+            "query": query,
+            "space": space,
+            "decision": decision,
+            "sql": sql or "",
+            "response": response or "",
+            "created_at": now,
+            "last_used": now,
+        }
+        with self._lock:
+            self._entries[entry_id] = dict(metadata, literals=query_literals(query), embedding=self._unit(embedding))
+            self._entries.move_to_end(entry_id)
+            evicted = self._evict_overflow()
+            self._matrices = {}
+        self._drop_from_store(evicted)
+        if self.client is not None:
+            try:
+                self._collection(space).upsert(ids=[entry_id], embeddings=[list(map(float, embedding))], metadatas=[metadata])
+            except Exception as e:
+                logging.error(f"Error persisting semantic cache entry: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": SEMANTIC_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "literal_mismatches": self.literal_mismatches,
+                "threshold": self.threshold,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self.client is not None,
+            }
+
+
+# --- RESULT CACHE CONFIGURATION ---
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_MAX_ROWS = int(os.getenv("RESULT_CACHE_MAX_ROWS", "5000"))
+
+# SQL whose result depends on the clock or randomness must never be served from cache.
+_VOLATILE_SQL = re.compile(r"\b(now|random|clock_timestamp|statement_timestamp|current_timestamp|"
+                           r"current_date|current_time|localtime|localtimestamp|timeofday)\b", re.IGNORECASE)
+
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(sql.split()).rstrip(";").strip()
+
+
+class ResultCache:
+    """
+    Byte-bounded LRU of query results keyed on normalized SQL text.
+    Rows are stored as a zlib-compressed pickle of (column names, value tuples), so keys are not
+    repeated per row. Every entry is tagged with the data version it was read at; seeing a newer
+    version (bumped by the ingest job) drops the whole cache.
+    """
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, max_rows=RESULT_CACHE_MAX_ROWS):
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.data_version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # normalized sql -> compressed payload
+        self._lock = threading.Lock()
+
+    def _check_version(self, data_version):
+        if data_version != self.data_version:
+            if self._entries:
+                self.invalidations += 1
+                logging.info(f"Data version changed to {data_version}; dropping {len(self._entries)} cached results.")
+            self._entries.clear()
+            self.bytes = 0
+            self.data_version = data_version
+
+    def get(self, sql: str, data_version):
+        key = normalize_sql(sql)
+        with self._lock:
+            self._check_version(data_version)
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        columns, rows = pickle.loads(zlib.decompress(payload))
+        return [dict(zip(columns, row)) for row in rows]
+
+    def put(self, sql: str, data_version, results: list):
+        if len(results) > self.max_rows or _VOLATILE_SQL.search(sql):
+            return
+        columns = list(results[0].keys()) if results else []
+        payload = zlib.compress(pickle.dumps((columns, [tuple(row.values()) for row in results]),
+                                             protocol=pickle.HIGHEST_PROTOCOL), 1)
+        if len(payload) > self.max_bytes:
+            return
+        key = normalize_sql(sql)
+        with self._lock:
+            self._check_version(data_version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[key] = payload
+            self.bytes += len(payload)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": RESULT_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+                "data_version": self.data_version,
+            }
@@ -1,27 +1,452 @@
 import os
+import re
+import hmac
+import json
+import time
+import uuid
+import hashlib
+import functools
+import contextvars
+import secrets
+import asyncio
+import threading
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
+import psycopg2.pool
 import logging
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
+from core import metrics
+from core.cache import ResultCache, RESULT_CACHE_ENABLED
 
-# --- DB FUNCTION ---
-def execute_sql_query(sql: str) -> list:
+# --- POOL CONFIGURATION ---
+POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX", "10"))
+# Extra connection on top of POOL_MAX_SIZE kept for /ready, which the executor and stream slots
+# below can never take, so the probe still gets a connection at peak load.
+PROBE_CONNECTIONS = 1
+STATEMENT_TIMEOUT_MS = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT_MS", "30000"))
+
+# --- STREAMING CONFIGURATION ---
+MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "1000"))
+STREAM_BATCH_SIZE = int(os.getenv("QUERY_STREAM_BATCH_SIZE", "500"))
+# Pool connections reserved for long-running /query/stream exports.
+STREAM_MAX_CONCURRENCY = int(os.getenv("QUERY_STREAM_MAX_CONCURRENCY", "2"))
+# Signs generated SQL so /query/stream only runs SQL this service produced. Set it to share across workers.
+SQL_SIGNING_KEY = os.getenv("SQL_SIGNING_KEY", "").encode() or secrets.token_bytes(32)
+
+# --- PLANNER GATE ---
+# Generated queries are EXPLAINed before they run. Plans above either threshold are rewritten
+# with a LIMIT when that brings the cost down, otherwise rejected (and /query asks the LLM for
+# a narrower query). Each generated query also gets its own statement_timeout.
+QUERY_MAX_PLAN_COST = float(os.getenv("QUERY_MAX_PLAN_COST", "5000000"))
+QUERY_MAX_PLAN_ROWS = float(os.getenv("QUERY_MAX_PLAN_ROWS", "1000000"))
+QUERY_STATEMENT_TIMEOUT_MS = int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS", "10000"))
+# /query/stream re-gates the signed SQL (it may only have passed /query thanks to the LIMIT
+# rewrite): no row ceiling, since exports are meant to be large, but its own cost ceiling,
+# per-FETCH statement_timeout and a bound on the whole stream.
+QUERY_STREAM_MAX_PLAN_COST = float(os.getenv("QUERY_STREAM_MAX_PLAN_COST", "20000000"))
+QUERY_STREAM_STATEMENT_TIMEOUT_MS = int(os.getenv("QUERY_STREAM_STATEMENT_TIMEOUT_MS", "30000"))
+QUERY_STREAM_MAX_SECONDS = float(os.getenv("QUERY_STREAM_MAX_SECONDS", "300"))
+REJECTED_PLAN_LOG_SIZE = int(os.getenv("QUERY_REJECTED_PLAN_LOG_SIZE", "200"))
+# Optional JSONL file that every rejected plan is appended to.
+REJECTED_PLAN_LOG_PATH = os.getenv("QUERY_REJECTED_PLAN_LOG")
+
+_pool = None
+_pool_lock = threading.Lock()
+# Never run more blocking queries than the pool has connections, so getconn() cannot be exhausted:
+# the executor and the export streams split the pool between them.
+_executor = ThreadPoolExecutor(max_workers=max(1, POOL_MAX_SIZE - STREAM_MAX_CONCURRENCY), thread_name_prefix="pg")
+_stream_slots = threading.BoundedSemaphore(STREAM_MAX_CONCURRENCY)
+_metrics = {
+    "queries": 0,
+    "errors": 0,
+    "in_use": 0,
+    "waiting": 0,
+    "total_acquire_seconds": 0.0,
+    "total_query_seconds": 0.0,
+}
+_metrics_lock = threading.Lock()
+
+# --- RESULT CACHE ---
+# How often (seconds) to re-read the ingest data version; bounds how stale a cached result can be.
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL_SECONDS", "5"))
+result_cache = ResultCache()
+_data_version = {"value": None, "checked_at": 0.0}
+_data_version_lock = threading.Lock()
+_rejected_plans = deque(maxlen=REJECTED_PLAN_LOG_SIZE)
+_rejected_plans_lock = threading.Lock()
+
+
+class QueryRejected(HTTPException):
+    """
+    Raised when the planner gate refuses a generated query or it hits its statement_timeout.
+    """
+    def __init__(self, reason: str):
+        super().__init__(status_code=422, detail=f"Query rejected: {reason}")
+        self.reason = reason
+
+
+def _connection_params() -> dict:
+    return {
+        "host": os.getenv("POSTGRES_HOST"),
+        "user": os.getenv("POSTGRES_USER"),
+        "password": os.getenv("POSTGRES_PASSWORD"),
+        "dbname": os.getenv("POSTGRES_DB"),
+        "port": os.getenv("POSTGRES_PORT"),
+        "options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}",
+    }
+
+
+def _bump(key: str, amount=1):
+    with _metrics_lock:
+        _metrics[key] += amount
+
+
+# --- POOL LIFECYCLE ---
+def init_pool():
+    """
+    Opens the shared connection pool. Called from the FastAPI lifespan; safe to call repeatedly.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(POOL_MIN_SIZE, POOL_MAX_SIZE + PROBE_CONNECTIONS,
+                                                 **_connection_params())
+            logging.info(f"Postgres pool opened (min={POOL_MIN_SIZE}, max={POOL_MAX_SIZE}, "
+                         f"statement_timeout={STATEMENT_TIMEOUT_MS}ms).")
+    return _pool
+
+
+def close_pool():
+    """
+    Closes every pooled connection. Called from the FastAPI lifespan on shutdown.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            logging.info("Postgres pool closed.")
+
+
+def ping_pool() -> bool:
     """
-    Executes the generated SQL query on PostgreSQL/PostGIS and returns the results.
+    Returns True if the pool is open and a pooled connection answers SELECT 1. Never opens the pool.
+    An exhausted pool (e.g. several probes at once at peak load) counts as ready: it is busy, not broken.
     """
+    pool = _pool
+    if pool is None:
+        return False
     try:
-        with psycopg2.connect(
-            host=os.getenv("POSTGRES_HOST"),
-            user=os.getenv("POSTGRES_USER"),
-            password=os.getenv("POSTGRES_PASSWORD"),
-            dbname=os.getenv("POSTGRES_DB"),
-            port=os.getenv("POSTGRES_PORT")
-        ) as conn:
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-                cursor.execute(sql)
-                results = cursor.fetchall()
-                logging.info(f"SQL query returned {len(results)} results.")
-                return results
+        conn = pool.getconn()
+    except psycopg2.pool.PoolError as err:
+        if pool.closed:
+            logging.warning(f"Postgres readiness check failed: {err}")
+            return False
+        return True
     except psycopg2.Error as err:
+        logging.warning(f"Postgres readiness check failed: {err}")
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+        return True
+    except psycopg2.Error as err:
+        logging.warning(f"Postgres readiness check failed: {err}")
+        return False
+    finally:
+        pool.putconn(conn, close=conn.closed != 0)
+
+
+def pool_metrics() -> dict:
+    """
+    Returns a snapshot of the pool configuration and usage counters.
+    """
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    snapshot.update(
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        probe_connections=PROBE_CONNECTIONS,
+        statement_timeout_ms=STATEMENT_TIMEOUT_MS,
+        open=_pool is not None,
+        idle=len(_pool._pool) if _pool is not None else 0,
+        connections=len(_pool._pool) + len(_pool._used) if _pool is not None else 0,
+    )
+    return snapshot
+
+
+# --- DB FUNCTIONS ---
+@contextmanager
+def pooled_connection():
+    """
+    Borrows a read-only autocommit connection from the pool and returns it afterwards,
+    discarding it if it was broken.
+    """
+    _bump("waiting")
+    acquire_started = time.perf_counter()
+    try:
+        pool = _pool or init_pool()
+        conn = pool.getconn()
+    except psycopg2.Error as err:
+        _bump("errors")
+        logging.error(f"Postgres Connection Error: {err}")
+        raise HTTPException(status_code=500, detail=f"Database query execution failed: {err}")
+    finally:
+        _bump("waiting", -1)
+    _bump("in_use")
+    _bump("total_acquire_seconds", time.perf_counter() - acquire_started)
+    metrics.record_stage("db_acquire", time.perf_counter() - acquire_started)
+
+    try:
+        if not conn.autocommit:
+            conn.set_session(readonly=True, autocommit=True)
+        yield conn
+    finally:
+        _bump("in_use", -1)
+        pool.putconn(conn, close=conn.closed != 0)
+
+
+def current_data_version():
+    """
+    Returns the ingest data version (bumped by load_argo_data.py after each commit),
+    re-reading it from Postgres at most every DATA_VERSION_TTL seconds.
+    """
+    with _data_version_lock:
+        if time.monotonic() - _data_version["checked_at"] < DATA_VERSION_TTL:
+            return _data_version["value"]
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT version FROM data_version;")
+                row = cursor.fetchone()
+        value = row[0] if row else 0
+    except (psycopg2.Error, HTTPException) as err:
+        # No data_version table yet (nothing ingested with a versioning loader): never trust cached results.
+        logging.warning(f"Could not read data version: {err}")
+        value = None
+    with _data_version_lock:
+        _data_version.update(value=value, checked_at=time.monotonic())
+    return value
+
+
+def explain_plan(cursor, sql: str) -> dict:
+    """
+    Returns the top-level plan node of EXPLAIN (FORMAT JSON) for the query (no execution).
+    """
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+    row = cursor.fetchone()
+    plan = row["QUERY PLAN"] if isinstance(row, dict) else row[0]
+    return plan[0]["Plan"]
+
+
+def rejected_plans() -> list:
+    """
+    Returns the most recent rejected queries, newest first.
+    """
+    with _rejected_plans_lock:
+        return list(reversed(_rejected_plans))
+
+
+def _plan_summary(plan: dict) -> dict:
+    relations = set()
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        stack.extend(node.get("Plans", []))
+    return {"node_type": plan.get("Node Type"), "total_cost": plan.get("Total Cost"),
+            "plan_rows": plan.get("Plan Rows"), "relations": sorted(relations)}
+
+
+def _reject(sql: str, plan, reason: str):
+    entry = {"at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "sql": sql, "reason": reason,
+             "plan": _plan_summary(plan) if plan else None}
+    logging.warning(f"Rejected generated SQL ({reason}): {sql}")
+    metrics.PLAN_DECISIONS.inc(outcome="rejected")
+    with _rejected_plans_lock:
+        _rejected_plans.append(entry)
+        if REJECTED_PLAN_LOG_PATH:
+            try:
+                with open(REJECTED_PLAN_LOG_PATH, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as err:
+                logging.error(f"Could not write rejected plan log: {err}")
+    raise QueryRejected(reason)
+
+
+def _plan_problems(plan: dict, check_rows: bool = True, max_cost: float = None) -> list:
+    max_cost = QUERY_MAX_PLAN_COST if max_cost is None else max_cost
+    problems = []
+    if plan["Total Cost"] > max_cost:
+        problems.append(f"estimated cost {plan['Total Cost']:.0f} exceeds {max_cost:.0f}")
+    if check_rows and plan["Plan Rows"] > QUERY_MAX_PLAN_ROWS:
+        problems.append(f"estimated {plan['Plan Rows']:.0f} rows exceeds {QUERY_MAX_PLAN_ROWS:.0f}")
+    return problems
+
+
+def guard_query(cursor, sql: str, limit: int = None, max_cost: float = None, check_rows: bool = True,
+                timeout_ms: int = QUERY_STATEMENT_TIMEOUT_MS):
+    """
+    Planner gate, run inside the query's transaction: sets the per-query statement_timeout and
+    EXPLAINs the query. Plans over max_cost (QUERY_MAX_PLAN_COST) or, with check_rows,
+    QUERY_MAX_PLAN_ROWS are wrapped in LIMIT `limit` when given and that fixes them; otherwise
+    QueryRejected is raised. Returns (sql to execute, plan of the original query).
+    """
+    cursor.execute("SET LOCAL statement_timeout = %s;", (timeout_ms,))
+    plan = explain_plan(cursor, sql)
+    problems = _plan_problems(plan, check_rows=check_rows, max_cost=max_cost)
+    if not problems:
+        metrics.PLAN_DECISIONS.inc(outcome="accepted")
+        return sql, plan
+
+    if limit is not None:
+        inner_sql = re.sub(r";\s*$", "", sql.strip())
+        limited_sql = f"SELECT * FROM ({inner_sql}) AS guarded_query LIMIT {int(limit)}"
+        if not _plan_problems(explain_plan(cursor, limited_sql), check_rows=False, max_cost=max_cost):
+            logging.info(f"Planner gate added LIMIT {limit} ({'; '.join(problems)}).")
+            metrics.PLAN_DECISIONS.inc(outcome="rewritten")
+            return limited_sql, plan
+    _reject(sql, plan, "; ".join(problems))
+
+
+def execute_sql_query_limited(sql: str, max_rows: int = MAX_ROWS) -> dict:
+    """
+    Executes the query through a named server-side cursor, fetching STREAM_BATCH_SIZE rows at a time
+    and stopping as soon as more than max_rows have arrived. Closing the cursor early stops the
+    backend from producing the rest of the result.
+    Returns {"rows", "truncated", "total_rows", "total_rows_estimated"}; when truncated, total_rows
+    is the planner's estimate.
+    """
+    data_version = current_data_version() if RESULT_CACHE_ENABLED else None
+    if data_version is not None:
+        cached = result_cache.get(sql, data_version)
+        if cached is not None and len(cached) <= max_rows:
+            logging.info(f"SQL result cache hit ({len(cached)} rows).")
+            return {"rows": cached, "truncated": False, "total_rows": len(cached), "total_rows_estimated": False}
+
+    query_started = time.perf_counter()
+    try:
+        with pooled_connection() as conn:
+            # Named cursors live inside a transaction; it is rolled back (read-only anyway) afterwards.
+            conn.autocommit = False
+            try:
+                with conn.cursor() as cursor:
+                    sql_to_run, plan = guard_query(cursor, sql, limit=max_rows + 1)
+                rows = []
+                with conn.cursor(name=f"floatchat_{uuid.uuid4().hex}",
+                                 cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                    cursor.execute(sql_to_run)
+                    while len(rows) <= max_rows:
+                        batch = cursor.fetchmany(min(STREAM_BATCH_SIZE, max_rows + 1 - len(rows)))
+                        if not batch:
+                            break
+                        rows.extend(batch)
+
+                truncated = len(rows) > max_rows
+                total_rows = len(rows)
+                if truncated:
+                    rows = rows[:max_rows]
+                    total_rows = max(int(plan["Plan Rows"]), max_rows + 1)
+                    logging.info(f"SQL query exceeded {max_rows} rows; stopped early (estimated total {total_rows}).")
+                else:
+                    logging.info(f"SQL query returned {len(rows)} results.")
+                metrics.DB_ROWS.observe(len(rows), query="limited")
+            finally:
+                if not conn.closed:
+                    conn.rollback()
+                    conn.autocommit = True
+    except psycopg2.errors.QueryCanceled:
+        _bump("errors")
+        _reject(sql, None, f"exceeded the {QUERY_STATEMENT_TIMEOUT_MS} ms statement_timeout")
+    except psycopg2.Error as err:
+        _bump("errors")
         logging.error(f"Postgres Execution Error: {err}")
         raise HTTPException(status_code=500, detail=f"Database query execution failed: {err}")
+    finally:
+        _bump("queries")
+        _bump("total_query_seconds", time.perf_counter() - query_started)
+        metrics.record_stage("db_execute", time.perf_counter() - query_started)
+
+    if data_version is not None and not truncated:
+        result_cache.put(sql, data_version, rows)
+    return {"rows": rows, "truncated": truncated, "total_rows": total_rows, "total_rows_estimated": truncated}
+
+
+async def _run_in_executor(func, *args):
+    # run_in_executor does not copy context variables (unlike asyncio.to_thread); copy them so
+    # DB spans are attributed to the calling request's trace.
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args))
+
+
+async def run_limited_sql_query(sql: str, max_rows: int = MAX_ROWS) -> dict:
+    """
+    Async wrapper around execute_sql_query_limited, run on the bounded DB thread pool.
+    """
+    return await _run_in_executor(execute_sql_query_limited, sql, max_rows)
+
+
+# --- RESULT STREAMING ---
+def sign_sql(sql: str) -> str:
+    return hmac.new(SQL_SIGNING_KEY, sql.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def verify_sql_signature(sql: str, signature: str) -> bool:
+    return hmac.compare_digest(sign_sql(sql), signature or "")
+
+
+def stream_sql_query(sql: str, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Generator that runs the query through a named server-side cursor and yields
+    (columns, rows) batches of at most batch_size tuples, where columns is a list of
+    (name, type_code). Holds one of STREAM_MAX_CONCURRENCY stream slots until closed,
+    so memory stays flat regardless of result size. The query goes through the planner gate
+    with the stream limits; QueryRejected is raised before the first batch if the plan is too
+    expensive, or mid-stream once QUERY_STREAM_MAX_SECONDS have passed.
+    """
+    if not _stream_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Too many concurrent result streams, please retry shortly.")
+    started = time.monotonic()
+    try:
+        with pooled_connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor() as cursor:
+                    guard_query(cursor, sql, max_cost=QUERY_STREAM_MAX_PLAN_COST, check_rows=False,
+                                timeout_ms=QUERY_STREAM_STATEMENT_TIMEOUT_MS)
+                with conn.cursor(name=f"floatchat_stream_{uuid.uuid4().hex}") as cursor:
+                    cursor.itersize = batch_size
+                    cursor.execute(sql)
+                    columns = None
+                    while True:
+                        if time.monotonic() - started > QUERY_STREAM_MAX_SECONDS:
+                            _reject(sql, None, f"stream exceeded {QUERY_STREAM_MAX_SECONDS:g} s")
+                        batch = cursor.fetchmany(batch_size)
+                        if columns is None:
+                            columns = [(d.name, d.type_code) for d in cursor.description]
+                            if not batch:
+                                # Empty results still report their columns.
+                                yield columns, []
+                        if not batch:
+                            break
+                        yield columns, batch
+            finally:
+                if not conn.closed:
+                    conn.rollback()
+                    conn.autocommit = True
+    except psycopg2.errors.QueryCanceled:
+        _bump("errors")
+        _reject(sql, None, f"exceeded the {QUERY_STREAM_STATEMENT_TIMEOUT_MS} ms stream statement_timeout")
+    except psycopg2.Error as err:
+        _bump("errors")
+        logging.error(f"Postgres Streaming Error: {err}")
+        raise HTTPException(status_code=500, detail=f"Database query execution failed: {err}")
+    finally:
+        _stream_slots.release()
@@ -0,0 +1,208 @@
+import os
+import json
+import gzip
+import decimal
+import datetime
+import numpy as np
+from fastapi import HTTPException
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional; NDJSON always works.
+    pa = None
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available.
+    brotli = None
+
+# --- STREAMING RESULT ENCODERS ---
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Postgres type OIDs -> Arrow type names; anything else (e.g. geography) is sent as text.
+_ARROW_TYPES = {
+    16: "bool_",
+    20: "int64", 21: "int16", 23: "int32",
+    700: "float32", 701: "float64", 1700: "float64",
+    1082: "date32",
+    1114: "timestamp_us", 1184: "timestamp_us_utc",
+}
+_ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_chunks(batches):
+    """
+    Encodes (columns, rows) batches as newline-delimited JSON, one chunk per batch.
+    """
+    for columns, rows in batches:
+        names = [name for name, _ in columns]
+        if rows:
+            yield "".join(json.dumps(dict(zip(names, row)), default=_json_default) + "\n" for row in rows).encode("utf-8")
+
+
+def _arrow_schema(columns):
+    fields = []
+    for name, type_code in columns:
+        type_name = _ARROW_TYPES.get(type_code, "string")
+        if type_name == "timestamp_us":
+            arrow_type = pa.timestamp("us")
+        elif type_name == "timestamp_us_utc":
+            arrow_type = pa.timestamp("us", tz="UTC")
+        else:
+            arrow_type = getattr(pa, type_name)()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def arrow_chunks(batches):
+    """
+    Encodes (columns, rows) batches as an Apache Arrow IPC stream: the schema message,
+    one record batch message per batch, then the end-of-stream marker.
+    """
+    schema = None
+    for columns, rows in batches:
+        if schema is None:
+            schema = _arrow_schema(columns)
+            yield schema.serialize().to_pybytes()
+        if not rows:
+            continue
+        arrays = []
+        for i, field in enumerate(schema):
+            values = [row[i] for row in rows]
+            if pa.types.is_string(field.type):
+                values = [None if v is None else str(v) for v in values]
+            elif pa.types.is_floating(field.type):
+                values = [None if v is None else float(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        yield pa.record_batch(arrays, schema=schema).serialize().to_pybytes()
+    yield _ARROW_EOS
+
+
+def choose_format(requested: str, accept: str) -> str:
+    """
+    Picks "ndjson" or "arrow" from an explicit format, falling back to the Accept header.
+    """
+    if requested and requested not in ("ndjson", "arrow"):
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{requested}'. Use 'ndjson' or 'arrow'.")
+    chosen = requested or ("arrow" if accept and ARROW_MEDIA_TYPE in accept else "ndjson")
+    if chosen == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow output requires pyarrow on the server.")
+    return chosen
+
+
+# --- COLUMNAR RESPONSES ---
+# /query answers in this media type when the client's Accept header asks for it: table_data
+# becomes one array per column instead of one object per row, float columns are written with
+# NumPy's shortest round-trip text (optionally at float32 precision, "; precision=float32"),
+# and the body is brotli- or gzip-compressed according to Accept-Encoding.
+COLUMNAR_MEDIA_TYPE = "application/vnd.floatchat.columnar+json"
+COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+
+def _header_items(header: str) -> list:
+    """
+    Splits an Accept-style header into (value, {param: value}) pairs, dropping q=0 entries.
+    """
+    items = []
+    for part in (header or "").split(","):
+        value, *params = [piece.strip() for piece in part.split(";")]
+        options = dict(param.partition("=")[::2] for param in params)
+        try:
+            if float(options.get("q", 1)) <= 0:
+                continue
+        except ValueError:
+            pass
+        if value:
+            items.append((value.lower(), {k.strip().lower(): v.strip().lower() for k, v in options.items()}))
+    return items
+
+
+def columnar_options(accept: str):
+    """
+    Returns {"float32": bool} if the Accept header asks for the columnar media type, else None.
+    """
+    for media_type, params in _header_items(accept):
+        if media_type == COLUMNAR_MEDIA_TYPE:
+            precision = params.get("precision", "float64")
+            if precision not in ("float32", "float64"):
+                raise HTTPException(status_code=406, detail=f"Unsupported precision '{precision}'. Use float32 or float64.")
+            return {"float32": precision == "float32"}
+    return None
+
+
+def _is_float_column(values: list) -> bool:
+    found = False
+    for value in values:
+        if value is None:
+            continue
+        if not isinstance(value, (float, decimal.Decimal)):
+            return False
+        found = True
+    return found
+
+
+def _json_array(values: list, float32: bool) -> str:
+    """
+    Encodes a list of scalars. Float columns go through NumPy in one pass; NaN/inf become null.
+    """
+    if not _is_float_column(values):
+        return json.dumps(values, default=_json_default, separators=(",", ":"))
+    array = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float32 if float32 else np.float64)
+    text = array.astype(str).astype(object)
+    text[~np.isfinite(array)] = "null"
+    return "[" + ",".join(text) + "]"
+
+
+def _encode(value, float32: bool) -> str:
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{json.dumps(str(k))}:{_encode(v, float32)}" for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(v, (dict, list, tuple)) for v in value):
+            return "[" + ",".join(_encode(v, float32) for v in value) + "]"
+        return _json_array(list(value), float32)
+    return json.dumps(value, default=_json_default)
+
+
+def to_columns(rows: list) -> dict:
+    """
+    Converts a list of row dicts into {"row_count": n, "columns": {name: [values...]}}.
+    """
+    names = list(rows[0].keys()) if rows else []
+    return {"row_count": len(rows), "columns": {name: [row.get(name) for row in rows] for name in names}}
+
+
+def encode_columnar(response: dict, float32: bool = False) -> bytes:
+    """
+    Serializes a /query response with table_data in columnar form; plot_data traces (already
+    one array per axis) and every other field keep their shape but share the compact float text.
+    """
+    response = dict(response)
+    if isinstance(response.get("table_data"), list):
+        response["table_data"] = to_columns(response["table_data"])
+    return _encode(response, float32).encode("utf-8")
+
+
+def compress_body(body: bytes, accept_encoding: str):
+    """
+    Compresses body with brotli (if installed) or gzip, whichever the client accepts first in
+    that order. Returns (body, content_encoding or None); small bodies are left as they are.
+    """
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return body, None
+    accepted = {encoding for encoding, _ in _header_items(accept_encoding)}
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if "gzip" in accepted or "*" in accepted:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
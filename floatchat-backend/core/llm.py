@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import numpy as np
+from core import metrics
+
+# --- LLM BACKEND CONFIGURATION ---
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+GENERATION_MODEL = os.getenv("GEMINI_GENERATION_MODEL", "gemini-2.5-flash")
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_DIM = 768
+
+# Per-stage timeouts (seconds) and concurrency limits.
+STAGE_TIMEOUTS = {
+    "triage": float(os.getenv("LLM_TRIAGE_TIMEOUT", "20")),
+    "embed": float(os.getenv("LLM_EMBED_TIMEOUT", "10")),
+    "sql": float(os.getenv("LLM_SQL_TIMEOUT", "30")),
+    "interpret": float(os.getenv("LLM_INTERPRET_TIMEOUT", "60")),
+}
+STAGE_CONCURRENCY = {
+    "triage": int(os.getenv("LLM_TRIAGE_CONCURRENCY", "16")),
+    "embed": int(os.getenv("LLM_EMBED_CONCURRENCY", "32")),
+    "sql": int(os.getenv("LLM_SQL_CONCURRENCY", "16")),
+    "interpret": int(os.getenv("LLM_INTERPRET_CONCURRENCY", "8")),
+}
+_stage_limits = {stage: asyncio.Semaphore(limit) for stage, limit in STAGE_CONCURRENCY.items()}
+
+
+class GeminiBackend:
+    """
+    Calls Gemini through the async google-generativeai client (imported here, not at module
+    import, since loading it takes about a second).
+    """
+    def __init__(self):
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self.genai = genai
+        self.generation_model = genai.GenerativeModel(GENERATION_MODEL)
+
+    async def generate(self, stage: str, prompt: str) -> str:
+        response = await self.generation_model.generate_content_async(prompt)
+        return response.text
+
+    async def embed(self, contents: list) -> list:
+        return (await self.genai.embed_content_async(model=EMBEDDING_MODEL, content=contents))["embedding"]
+
+
+class FakeBackend:
+    """
+    Offline stand-in for load testing: canned responses per stage after a fixed latency,
+    and deterministic hash-seeded embeddings of the same dimension as Gemini's.
+    """
+    def __init__(self, latency: float = None):
+        self.latency = latency if latency is not None else float(os.getenv("FAKE_LLM_LATENCY_MS", "50")) / 1000
+
+    async def generate(self, stage: str, prompt: str) -> str:
+        await asyncio.sleep(self.latency)
+        if stage == "triage":
+            return json.dumps({"decision": "database_query", "response": ""})
+        if stage == "sql":
+            return ("SELECT platform_number, cycle_number, profile_time FROM profiles "
+                    "ORDER BY profile_time DESC LIMIT 10")
+        return json.dumps({
+            "natural_language_response": "Here are the results from the fake LLM backend.",
+            "plot": None,
+            "show_table": True,
+        })
+
+    async def embed(self, contents: list) -> list:
+        await asyncio.sleep(self.latency)
+        vectors = []
+        for text in contents:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Returns the process-wide LLM backend selected by LLM_BACKEND ("gemini" or "fake"),
+    creating it on first use. Warmed up from the FastAPI lifespan.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = FakeBackend() if LLM_BACKEND == "fake" else GeminiBackend()
+            logging.info(f"Using {type(_backend).__name__} for LLM calls.")
+    return _backend
+
+
+def backend_ready() -> bool:
+    return _backend is not None
+
+
+async def generate(stage: str, prompt: str) -> str:
+    """
+    Runs one generation call under the stage's concurrency limit and timeout, recording the
+    time spent waiting for a slot and the prompt/response sizes.
+    """
+    waiting = time.perf_counter()
+    async with _stage_limits[stage]:
+        metrics.record_stage(f"{stage}_queue", time.perf_counter() - waiting)
+        metrics.LLM_PROMPT_BYTES.observe(len(prompt.encode("utf-8")), stage=stage)
+        try:
+            response = await asyncio.wait_for(get_backend().generate(stage, prompt), STAGE_TIMEOUTS[stage])
+        except Exception as e:
+            metrics.LLM_ERRORS.inc(stage=stage, error=type(e).__name__)
+            raise
+        metrics.LLM_RESPONSE_BYTES.observe(len(response.encode("utf-8")), stage=stage)
+        return response
+
+
+async def embed(contents: list) -> list:
+    """
+    Embeds a list of texts under the embedding stage's concurrency limit and timeout.
+    """
+    waiting = time.perf_counter()
+    async with _stage_limits["embed"]:
+        metrics.record_stage("embed_queue", time.perf_counter() - waiting)
+        try:
+            return await asyncio.wait_for(get_backend().embed(contents), STAGE_TIMEOUTS["embed"])
+        except Exception as e:
+            metrics.LLM_ERRORS.inc(stage="embed", error=type(e).__name__)
+            raise
@@ -0,0 +1,148 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# --- METRICS ---
+# Small in-process histograms and counters rendered in the Prometheus text format by GET /metrics,
+# plus per-request traces that become the Server-Timing response header.
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help_text = name, help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines.extend(f"{self.name}{_label_text(key)} {value}" for key, value in self._values.items())
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple):
+        self.name, self.help_text, self.buckets = name, help_text, tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_text(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_label_text(key)} {series['count']}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("floatchat_stage_duration_seconds",
+                          "Duration of each /query pipeline stage.", DURATION_BUCKETS)
+REQUEST_SECONDS = Histogram("floatchat_request_duration_seconds",
+                            "End-to-end HTTP request duration.", DURATION_BUCKETS)
+LLM_PROMPT_BYTES = Histogram("floatchat_llm_prompt_bytes", "Size of LLM prompts per stage.", SIZE_BUCKETS)
+LLM_RESPONSE_BYTES = Histogram("floatchat_llm_response_bytes", "Size of LLM responses per stage.", SIZE_BUCKETS)
+DB_ROWS = Histogram("floatchat_db_rows", "Rows returned per SQL execution.", ROW_BUCKETS)
+LLM_ERRORS = Counter("floatchat_llm_errors_total", "LLM calls that failed or timed out.")
+QUERY_DECISIONS = Counter("floatchat_query_decisions_total", "Triage decisions, by semantic cache outcome.")
+PLAN_DECISIONS = Counter("floatchat_plan_decisions_total", "Planner gate outcomes for generated SQL.")
+QUERY_ADMISSION = Counter("floatchat_query_admission_total",
+                          "/query admission outcomes: started, coalesced or rejected (429).")
+
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, LLM_PROMPT_BYTES, LLM_RESPONSE_BYTES, DB_ROWS, LLM_ERRORS,
+            QUERY_DECISIONS, PLAN_DECISIONS, QUERY_ADMISSION]
+
+
+def render_prometheus(gauges: list = ()) -> str:
+    """
+    Renders every registered metric, plus (name, help, value) gauges sampled by the caller.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, help_text, value in gauges:
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {float(value)}"])
+    return "\n".join(lines) + "\n"
+
+
+# --- TRACING ---
+# The current request's list of (stage, seconds). Copied into tasks, asyncio.to_thread and the
+# DB executor, so spans recorded there land in the request that started them.
+_trace = ContextVar("floatchat_trace", default=None)
+
+
+def start_trace():
+    """
+    Starts collecting spans for the current request. Returns (token, trace) for end_trace().
+    """
+    trace = []
+    return _trace.set(trace), trace
+
+
+def end_trace(token):
+    _trace.reset(token)
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Times the enclosed block as one pipeline stage (works around awaits too).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def server_timing(trace: list, total_seconds: float) -> str:
+    """
+    Formats a trace as a Server-Timing header value, summing repeated stages, in milliseconds.
+    """
+    totals = {}
+    for stage, seconds in trace:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    totals["total"] = total_seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
@@ -1,4 +1,10 @@
+from typing import Optional
 from pydantic import BaseModel
 
 class QueryRequest(BaseModel):
     query: str
+
+class StreamRequest(BaseModel):
+    generated_sql: str
+    sql_signature: str
+    format: Optional[str] = None
@@ -0,0 +1,120 @@
+import os
+import re
+import logging
+from collections import Counter
+import numpy as np
+
+# --- LOCAL SCHEMA RETRIEVAL CONFIGURATION ---
+# "gemini": remote embeddings + Chroma (TF-IDF index used as fallback when the API fails)
+# "local": sentence-transformers model on CPU, "tfidf": pure NumPy TF-IDF
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
+LOCAL_EMBEDDING_BACKENDS = ("local", "tfidf")
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _terms(text: str) -> list:
+    """
+    Word tokens plus character trigrams of each word, so "temperature" still matches "temp_adjusted".
+    """
+    terms = []
+    for word in _TOKEN.findall(text.lower()):
+        terms.append(word)
+        padded = f"#{word}#"
+        terms.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return terms
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class TfidfEmbedder:
+    """
+    TF-IDF over word and trigram terms, fitted on the schema corpus. No dependencies beyond NumPy.
+    Not used to key the semantic cache: the vocabulary only holds schema terms, so float IDs,
+    dates and place names are dropped and different questions embed identically.
+    """
+    name = "tfidf"
+    cacheable = False
+
+    def fit(self, corpus: list):
+        doc_terms = [Counter(_terms(doc)) for doc in corpus]
+        vocabulary = sorted({term for terms in doc_terms for term in terms})
+        self.index = {term: i for i, term in enumerate(vocabulary)}
+        document_frequency = np.zeros(len(vocabulary))
+        for terms in doc_terms:
+            for term in terms:
+                document_frequency[self.index[term]] += 1
+        self.idf = np.log((1 + len(corpus)) / (1 + document_frequency)) + 1
+        return self
+
+    def embed(self, texts: list) -> np.ndarray:
+        matrix = np.zeros((len(texts), len(self.index)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term, count in Counter(_terms(text)).items():
+                column = self.index.get(term)
+                if column is not None:
+                    matrix[row, column] = (1 + np.log(count)) * self.idf[column]
+        return _unit_rows(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """
+    Small sentence-transformers model run in-process on CPU.
+    """
+    name = "local"
+    cacheable = True
+
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def fit(self, corpus: list):
+        return self
+
+    def embed(self, texts: list) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+
+class SchemaIndex:
+    """
+    The schema corpus held in memory as a unit-norm embedding matrix, with vectorized top-k search.
+    """
+    def __init__(self, docs: list, embedder):
+        self.docs = list(docs)
+        self.embedder = embedder.fit(self.docs)
+        self.matrix = self.embedder.embed(self.docs)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embedder.embed([query])[0]
+
+    def search_by_vector(self, vector, k: int = 10) -> list:
+        scores = self.matrix @ np.asarray(vector, dtype=np.float32)
+        k = min(k, len(self.docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self.docs[i] for i in top[np.argsort(-scores[top])]]
+
+    def search(self, query: str, k: int = 10) -> list:
+        return self.search_by_vector(self.embed_query(query), k)
+
+
+def build_schema_index(docs: list, backend: str = EMBEDDING_BACKEND):
+    """
+    Builds the in-process schema index for the configured backend. "gemini" gets a TF-IDF
+    index to fall back on; "local" falls back to TF-IDF when sentence-transformers is missing.
+    Returns None for an empty corpus.
+    """
+    if not docs:
+        return None
+    embedder = None
+    if backend == "local":
+        try:
+            embedder = SentenceTransformerEmbedder()
+        except Exception as e:
+            logging.error(f"Could not load local embedding model, using TF-IDF instead: {e}")
+    index = SchemaIndex(docs, embedder or TfidfEmbedder())
+    logging.info(f"Built {index.embedder.name} schema index over {len(docs)} docs.")
+    return index
@@ -0,0 +1,198 @@
+import os
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import numpy as np
+
+# --- RESULT SUMMARIZATION ---
+SAMPLE_ROWS = int(os.getenv("SUMMARY_SAMPLE_ROWS", "5"))
+PLOT_MAX_POINTS = int(os.getenv("PLOT_MAX_POINTS", "2000"))
+DEPTH_BIN_EDGES = [0, 10, 50, 100, 200, 500, 1000, 1500, 2000, 6000]
+PLOT_TYPES = ("scatter", "line", "bar")
+
+
+def _column_kind(values: list) -> str:
+    present = [v for v in values if v is not None]
+    if not present:
+        return "empty"
+    if all(isinstance(v, (int, float, Decimal)) and not isinstance(v, bool) for v in present):
+        return "numeric"
+    if all(isinstance(v, (datetime, date)) for v in present):
+        return "datetime"
+    return "text"
+
+
+def _numeric_array(values: list) -> np.ndarray:
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+
+def _naive_utc(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _datetime_array(values: list) -> np.ndarray:
+    return np.array([np.datetime64("NaT") if v is None else np.datetime64(_naive_utc(v), "us") for v in values],
+                    dtype="datetime64[us]")
+
+
+def _round(value: float):
+    return None if np.isnan(value) else float(f"{value:.6g}")
+
+
+def is_depth_column(name: str) -> bool:
+    return name.lower().startswith("pres")
+
+
+def summarize_results(rows: list) -> dict:
+    """
+    Computes a compact, JSON-serializable description of a result set: per-column stats
+    (min/max/mean/std and null counts for numbers, ranges for timestamps, top values for text),
+    plus mean values per depth bin when a pressure column is present.
+    """
+    columns = list(rows[0].keys()) if rows else []
+    summary = {"row_count": len(rows), "columns": {}}
+    numeric = {}
+    for name in columns:
+        values = [row[name] for row in rows]
+        kind = _column_kind(values)
+        stats = {"type": kind, "nulls": sum(v is None for v in values)}
+        if kind == "numeric":
+            array = _numeric_array(values)
+            numeric[name] = array
+            stats.update(min=_round(np.nanmin(array)), max=_round(np.nanmax(array)),
+                         mean=_round(np.nanmean(array)), std=_round(np.nanstd(array)))
+        elif kind == "datetime":
+            array = _datetime_array(values)
+            valid = array[~np.isnat(array)]
+            stats.update(min=str(valid.min()), max=str(valid.max()))
+        elif kind == "text":
+            distinct, counts = np.unique([str(v) for v in values if v is not None], return_counts=True)
+            top = np.argsort(counts)[::-1][:5]
+            stats.update(distinct=len(distinct), top_values={str(distinct[i]): int(counts[i]) for i in top})
+        summary["columns"][name] = stats
+
+    depth_column = next((name for name in numeric if is_depth_column(name)), None)
+    if depth_column is not None and len(numeric) > 1:
+        depth = numeric[depth_column]
+        bin_index = np.digitize(depth, DEPTH_BIN_EDGES)
+        bins = []
+        for b in np.unique(bin_index[~np.isnan(depth)]):
+            in_bin = (bin_index == b) & ~np.isnan(depth)
+            low = DEPTH_BIN_EDGES[b - 1] if b > 0 else None
+            high = DEPTH_BIN_EDGES[b] if b < len(DEPTH_BIN_EDGES) else None
+            entry = {"range": [low, high], "rows": int(in_bin.sum())}
+            for name, array in numeric.items():
+                if name != depth_column and not np.isnan(array[in_bin]).all():
+                    entry[f"mean_{name}"] = _round(np.nanmean(array[in_bin]))
+            bins.append(entry)
+        summary["depth_bins"] = {"column": depth_column, "bins": bins}
+
+    summary["sample_rows"] = rows[:SAMPLE_ROWS]
+    return summary
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling. x must be sorted ascending.
+    Returns the indices of the points to keep (always including the first and last).
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _axis_values(rows: list, name: str):
+    if name == "index" and name not in rows[0]:
+        return np.arange(len(rows), dtype=np.float64), "numeric"
+    values = [row[name] for row in rows]
+    kind = _column_kind(values)
+    if kind == "numeric":
+        return _numeric_array(values), kind
+    if kind == "datetime":
+        return _datetime_array(values), kind
+    return np.array([None if v is None else str(v) for v in values], dtype=object), kind
+
+
+def _to_json_values(array: np.ndarray, kind: str) -> list:
+    if kind == "numeric":
+        return [None if np.isnan(v) else float(v) for v in array]
+    if kind == "datetime":
+        return [None if np.isnat(v) else str(v) for v in array]
+    return array.tolist()
+
+
+def _trace(rows: list, spec: dict, name: str = None) -> dict:
+    x, x_kind = _axis_values(rows, spec["x"])
+    y, y_kind = _axis_values(rows, spec["y"])
+    # Downsample along the independent axis: pressure when it is plotted vertically (depth profiles).
+    along_y = is_depth_column(spec["y"]) and not is_depth_column(spec["x"])
+    ind, ind_kind, dep, dep_kind = (y, y_kind, x, x_kind) if along_y else (x, x_kind, y, y_kind)
+    if spec["type"] != "bar" and ind_kind in ("numeric", "datetime") and dep_kind == "numeric":
+        if ind_kind == "datetime":
+            ind_f = np.where(np.isnat(ind), np.nan, ind.astype(np.int64).astype(np.float64))
+        else:
+            ind_f = ind
+        valid = ~(np.isnan(ind_f) | np.isnan(dep))
+        order = np.flatnonzero(valid)[np.argsort(ind_f[valid], kind="stable")]
+        order = order[lttb(ind_f[order], dep[order], PLOT_MAX_POINTS)]
+        x, y = x[order], y[order]
+
+    trace = {
+        "type": "bar" if spec["type"] == "bar" else "scatter",
+        "x": _to_json_values(x, x_kind),
+        "y": _to_json_values(y, y_kind),
+    }
+    if spec["type"] == "line":
+        trace["mode"] = "lines"
+    elif spec["type"] == "scatter":
+        trace["mode"] = "markers"
+    if name is not None:
+        trace["name"] = name
+    return trace
+
+
+def build_plot_data(rows: list, spec: dict):
+    """
+    Builds a Plotly figure ({"data": [...], "layout": {...}}) from the full result rows, using a
+    small spec chosen by the LLM: {"type": "scatter"|"line"|"bar", "x": col or "index", "y": col,
+    "group_by": col or null, "title": str}. Long series are downsampled with LTTB.
+    Returns None if the spec does not fit the data.
+    """
+    if not rows or not isinstance(spec, dict):
+        return None
+    columns = rows[0].keys()
+    if spec.get("type") not in PLOT_TYPES or spec.get("y") not in columns or \
+            (spec.get("x") not in columns and spec.get("x") != "index"):
+        return None
+    group_by = spec.get("group_by")
+    if group_by in columns:
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[group_by], []).append(row)
+        traces = [_trace(group_rows, spec, name=f"{group_by} {key}") for key, group_rows in groups.items()]
+    else:
+        traces = [_trace(rows, spec)]
+
+    layout = {
+        "title": {"text": spec.get("title") or f"{spec['y']} vs {spec['x']}"},
+        "xaxis": {"title": {"text": spec["x"]}},
+        "yaxis": {"title": {"text": spec["y"]}},
+    }
+    if is_depth_column(spec["y"]):
+        # Pressure increases downwards in ocean profile plots.
+        layout["yaxis"]["autorange"] = "reversed"
+    return {"data": traces, "layout": layout}
@@ -1,11 +1,12 @@
 import os
+import time
+import random
+import hashlib
 import psycopg2
 import psycopg2.extras
-import chromadb
-from chromadb.utils import embedding_functions
 from dotenv import load_dotenv
-import google.generativeai as genai
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 # --- SETUP ---
 logging.basicConfig(level=logging.INFO)
@@ -26,9 +27,21 @@ DB_CONFIG = {
 CHROMA_PATH = "chroma_db"
 COLLECTION_NAME = "postgres_schema_info"
 
-# Google GenAI config
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Descriptions of the rollup tables maintained by load_argo_data.py. Generated SQL should
+# prefer them over scanning profiles/measurements for these question patterns.
+ROLLUP_DOCS = [
+    "Table: float_latest_position holds one row per float with its most recent profile: platform_number, cycle_number, profile_time and location (PostGIS GEOGRAPHY). Use it for 'latest/last known position of a float' instead of scanning profiles.",
+    "Table: profile_counts_monthly holds the number of profiles (profile_count) and distinct floats (float_count) per 5-degree grid cell and month. lat_cell/lon_cell are the southern/western cell edges in degrees, month is the first day of the month. Use it for 'how many profiles/floats in a region per month'.",
+    "Table: depth_bin_means_monthly holds mean_temp_adjusted and mean_psal_adjusted (good QC '1' values only) per 5-degree grid cell (lat_cell, lon_cell), month and pressure bin [depth_min, depth_max) in decibars. temp_good_count/psal_good_count are the number of values behind each mean (weight by them when combining bins); measurement_count also counts bad-QC and missing levels. Use it for 'average temperature/salinity by depth in a region and period' instead of aggregating measurements.",
+    "View: profile_cells maps each profile (platform_number, cycle_number) to its 5-degree grid cell (lat_cell, lon_cell) and month, matching the rollup tables.",
+    "Example: mean temperature in the upper 100 dbar of the cell starting at 10N 60E for September 2025: SELECT depth_min, depth_max, mean_temp_adjusted FROM depth_bin_means_monthly WHERE lat_cell = 10 AND lon_cell = 60 AND month = '2025-09-01' AND depth_max <= 100 ORDER BY depth_min;",
+]
+
+# Google GenAI config (the client is configured on first use, not at import)
 embedding_model = "models/text-embedding-004"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))  # Gemini's batch embedding limit
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
 
 # --- CONNECT TO POSTGRES ---
 def fetch_schema_info():
@@ -39,6 +52,8 @@ def fetch_schema_info():
                 SELECT table_name, column_name, data_type
                 FROM information_schema.columns
                 WHERE table_schema = 'public'
+                  AND table_name NOT IN ('ingest_manifest', 'data_version', 'schema_migrations')
+                  AND table_name NOT IN (SELECT relname FROM pg_class WHERE relispartition)
                 ORDER BY table_name, ordinal_position;
             """)
             rows = cur.fetchall()
@@ -47,32 +62,73 @@ def fetch_schema_info():
     schema_docs = []
     for row in rows:
         schema_docs.append(f"Table: {row['table_name']}, Column: {row['column_name']}, Type: {row['data_type']}")
+    schema_docs.extend(ROLLUP_DOCS)
     return schema_docs
 
+# --- EMBEDDING ---
+_genai = None
+
+def get_genai():
+    """
+    Imports and configures google.generativeai once, the first time a batch is embedded.
+    """
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        _genai = genai
+    return _genai
+
+def doc_id(doc):
+    """
+    Content-derived ID: unchanged docs keep their ID across refreshes and column reorders.
+    """
+    return "schema_" + hashlib.sha256(doc.encode("utf-8")).hexdigest()[:32]
+
+def embed_batch(batch):
+    """
+    Embeds a batch of docs in one request, retrying with exponential backoff and jitter.
+    """
+    for attempt in range(EMBED_MAX_RETRIES):
+        try:
+            return get_genai().embed_content(model=embedding_model, content=batch)["embedding"]
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES - 1:
+                raise
+            delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+            logging.warning(f"Embedding batch of {len(batch)} failed ({e}); retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+def embed_docs(docs):
+    get_genai()  # configure once before the worker threads start
+    batches = [docs[i:i + EMBED_BATCH_SIZE] for i in range(0, len(docs), EMBED_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as pool:
+        return [emb for batch_embeddings in pool.map(embed_batch, batches) for emb in batch_embeddings]
+
 # --- CONNECT TO CHROMA ---
 def update_chroma_collection(docs):
+    import chromadb
     logging.info("Connecting to ChromaDB...")
     chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    collection = chroma_client.get_or_create_collection(COLLECTION_NAME)
+
+    # Deduplicate and key every doc by its content hash
+    docs_by_id = {doc_id(doc): doc for doc in docs}
+    existing_ids = set(collection.get(include=[])["ids"])
+    new_ids = [i for i in docs_by_id if i not in existing_ids]
+    stale_ids = [i for i in existing_ids if i not in docs_by_id]
+
+    # Only new or changed docs are embedded with Gemini
+    if new_ids:
+        new_docs = [docs_by_id[i] for i in new_ids]
+        logging.info(f"Embedding {len(new_docs)} new/changed schema docs with Gemini "
+                     f"({-(-len(new_docs) // EMBED_BATCH_SIZE)} batch requests)...")
+        collection.upsert(documents=new_docs, embeddings=embed_docs(new_docs), ids=new_ids)
+    if stale_ids:
+        collection.delete(ids=stale_ids)
 
-    try:
-        collection = chroma_client.get_collection(COLLECTION_NAME)
-        logging.info(f"Collection '{COLLECTION_NAME}' found.")
-    except Exception:
-        logging.info(f"Collection '{COLLECTION_NAME}' not found. Creating new one.")
-        collection = chroma_client.create_collection(COLLECTION_NAME)
-
-    # Embed documents with Gemini
-    logging.info("Embedding schema docs with Gemini...")
-    embeddings = []
-    for doc in docs:
-        emb = genai.embed_content(model=embedding_model, content=doc)["embedding"]
-        embeddings.append(emb)
-
-    # Insert or update docs
-    ids = [f"schema_{i}" for i in range(len(docs))]
-    collection.upsert(documents=docs, embeddings=embeddings, ids=ids)
-
-    logging.info(f"Upserted {len(docs)} docs into collection '{COLLECTION_NAME}'.")
+    logging.info(f"Collection '{COLLECTION_NAME}': {len(new_ids)} added, {len(stale_ids)} removed, "
+                 f"{len(docs_by_id) - len(new_ids)} unchanged.")
 
 # --- MAIN ---
 if __name__ == "__main__":
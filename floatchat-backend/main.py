@@ -1,20 +1,87 @@
 
 
 # --- FASTAPI APP SETUP ---
-from fastapi import FastAPI
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from api.routes import router
+from core import ai, metrics
+from core.db import init_pool, close_pool
+
+WARM_UP_RETRY_SECONDS = float(os.getenv("WARM_UP_RETRY_SECONDS", "5"))
+
+
+async def warm_up(app: FastAPI):
+    """
+    Opens the Postgres pool and the AI singletons (ChromaDB, schema index, query cache, LLM client)
+    in worker threads, retrying until all are up. The app serves requests meanwhile; /ready
+    reports 503 until this finishes.
+    """
+    started = time.perf_counter()
+    while True:
+        pool, ai_state = await asyncio.gather(
+            asyncio.to_thread(init_pool), asyncio.to_thread(ai.warm_up), return_exceptions=True
+        )
+        if isinstance(pool, Exception):
+            logging.error(f"Could not open Postgres pool: {pool}")
+        if isinstance(ai_state, Exception):
+            logging.error(f"Could not initialize AI dependencies: {ai_state}")
+        elif not all(ai_state.values()):
+            logging.error(f"AI dependencies not ready: {[name for name, ok in ai_state.items() if not ok]}")
+        if not isinstance(pool, Exception) and not isinstance(ai_state, Exception) and all(ai_state.values()):
+            break
+        await asyncio.sleep(WARM_UP_RETRY_SECONDS)
+    app.state.warm_up_seconds = round(time.perf_counter() - started, 3)
+    logging.info(f"Dependencies warm after {app.state.warm_up_seconds}s.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.warm_up_seconds = None
+    warm_up_task = asyncio.create_task(warm_up(app))
+    yield
+    warm_up_task.cancel()
+    close_pool()
+
 
 app = FastAPI(
     title="FloatChat Backend API",
     description="An advanced API that uses a multi-step AI agent to answer questions about ARGO data (Postgres/PostGIS).",
-    version="3.0.0"
+    version="3.0.0",
+    lifespan=lifespan
 )
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
+
+@app.middleware("http")
+async def record_timing(request: Request, call_next):
+    """
+    Collects the request's stage spans, records its duration by route, and reports the
+    breakdown in a Server-Timing header (milliseconds per stage plus total).
+    """
+    token, trace = metrics.start_trace()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        route = request.scope.get("route")
+        metrics.REQUEST_SECONDS.observe(elapsed, route=route.path if route else "unmatched",
+                                        method=request.method, status=str(status))
+        metrics.end_trace(token)
+    response.headers["Server-Timing"] = metrics.server_timing(trace, elapsed)
+    return response
+
 app.include_router(router)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The backend runs from floatchat-backend/ (uvicorn main:app); import its packages the same way.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
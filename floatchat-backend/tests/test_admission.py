@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.admission import QueryAdmission, TooManyRequests, client_key
+
+
+def gated_pipeline(gate, calls, result="answer"):
+    async def pipeline():
+        calls.append(1)
+        await gate.wait()
+        return result
+    return pipeline
+
+
+def test_identical_queries_share_one_run():
+    async def scenario():
+        admission = QueryAdmission(max_in_flight=10, max_per_client=10)
+        gate, calls = asyncio.Event(), []
+        waiters = [asyncio.create_task(admission.run(f"client{i}", query, gated_pipeline(gate, calls)))
+                   for i, query in enumerate(["Latest floats", "latest   FLOATS", "latest floats"])]
+        await asyncio.sleep(0)
+        assert admission.stats()["distinct_in_flight"] == 1
+        gate.set()
+        return admission, calls, await asyncio.gather(*waiters)
+
+    admission, calls, results = asyncio.run(scenario())
+    assert results == ["answer"] * 3 and len(calls) == 1
+    assert admission.coalesced == 2
+    assert admission.stats()["running"] == 0 and admission.stats()["clients_in_flight"] == 0
+
+
+def test_coalescing_can_be_disabled():
+    async def scenario():
+        admission = QueryAdmission(max_in_flight=10, max_per_client=10, coalescing=False)
+        gate, calls = asyncio.Event(), []
+        waiters = [asyncio.create_task(admission.run("client", "latest floats", gated_pipeline(gate, calls)))
+                   for _ in range(2)]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*waiters)
+        return calls
+
+    assert len(asyncio.run(scenario())) == 2
+
+
+def test_global_and_per_client_limits():
+    async def scenario():
+        admission = QueryAdmission(max_in_flight=2, max_per_client=1)
+        gate, calls = asyncio.Event(), []
+        first = asyncio.create_task(admission.run("a", "query one", gated_pipeline(gate, calls)))
+        second = asyncio.create_task(admission.run("b", "query two", gated_pipeline(gate, calls)))
+        await asyncio.sleep(0)
+        with pytest.raises(TooManyRequests) as per_client:
+            await admission.run("a", "query three", gated_pipeline(gate, calls))
+        with pytest.raises(TooManyRequests) as server:
+            await admission.run("c", "query four", gated_pipeline(gate, calls))
+        gate.set()
+        await asyncio.gather(first, second)
+        # Capacity is back once the runs finish.
+        assert await admission.run("a", "query five", gated_pipeline(gate, calls)) == "answer"
+        return admission, per_client.value, server.value
+
+    admission, per_client, server = asyncio.run(scenario())
+    assert per_client.scope == "per client" and server.scope == "server"
+    assert server.status_code == 429 and "Retry-After" in server.headers
+    assert admission.rejected == 2
+
+
+def test_failure_reaches_every_waiter_and_caller_cancellation_does_not_cancel_the_run():
+    async def scenario():
+        admission = QueryAdmission(max_in_flight=10, max_per_client=10)
+        gate = asyncio.Event()
+
+        async def failing():
+            await gate.wait()
+            raise ValueError("boom")
+
+        leaving = asyncio.create_task(admission.run("a", "same query", failing))
+        staying = asyncio.create_task(admission.run("b", "same query", failing))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        with pytest.raises(ValueError):
+            await staying
+        return admission
+
+    admission = asyncio.run(scenario())
+    assert admission.stats()["running"] == 0 and admission.stats()["distinct_in_flight"] == 0
+
+
+def test_client_key(monkeypatch):
+    request = SimpleNamespace(headers={"X-Forwarded-For": "203.0.113.7, 10.0.0.1"}, client=SimpleNamespace(host="10.0.0.1"))
+    assert client_key(request) == "10.0.0.1"
+    monkeypatch.setattr("core.admission.QUERY_CLIENT_HEADER", "X-Forwarded-For")
+    assert client_key(request) == "203.0.113.7"
+    assert client_key(SimpleNamespace(headers={}, client=None)) == "unknown"
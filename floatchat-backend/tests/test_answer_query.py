@@ -0,0 +1,47 @@
+import asyncio
+
+from api import routes
+
+
+def patch_pipeline(monkeypatch, cache_usable):
+    events = []
+
+    def stage(name, result, delay=0.01):
+        async def run(*args, **kwargs):
+            events.append(f"{name} start")
+            await asyncio.sleep(delay)
+            events.append(f"{name} end")
+            return result(*args) if callable(result) else result
+        return run
+
+    monkeypatch.setattr(routes, "semantic_cache_usable", stage("usable", cache_usable, 0))
+    monkeypatch.setattr(routes, "embed_query", stage("embed", [1.0, 0.0]))
+    monkeypatch.setattr(routes, "lookup_cached_query", stage("lookup", None, 0))
+    monkeypatch.setattr(routes, "store_cached_query", stage("store", None, 0))
+    monkeypatch.setattr(routes, "triage_query", stage("triage", {"decision": "database_query", "response": ""}))
+    monkeypatch.setattr(routes, "retrieve_schema_context",
+                        stage("schema", lambda query, embedding: events.append(("schema embedding", embedding))))
+    monkeypatch.setattr(routes, "generate_sql_from_query", stage("sql", "SELECT 1", 0))
+    monkeypatch.setattr(routes, "run_limited_sql_query", stage("db", {"rows": []}, 0))
+    return events
+
+
+def test_schema_retrieval_overlaps_triage_when_the_cache_cannot_be_used(monkeypatch):
+    events = patch_pipeline(monkeypatch, cache_usable=False)
+    response = asyncio.run(routes.answer_query("temperature of float 1901"))
+
+    assert response["generated_sql"] == "SELECT 1"
+    assert "embed start" not in events and "lookup start" not in events
+    assert ("schema embedding", None) in events
+    # Both stages start before either finishes.
+    assert max(events.index("triage start"), events.index("schema start")) < \
+        min(events.index("triage end"), events.index("schema end"))
+
+
+def test_cache_lookup_reuses_the_embedding_for_schema_retrieval(monkeypatch):
+    events = patch_pipeline(monkeypatch, cache_usable=True)
+    asyncio.run(routes.answer_query("temperature of float 1901"))
+
+    assert events.index("embed end") < events.index("lookup start") < events.index("triage start")
+    assert ("schema embedding", [1.0, 0.0]) in events
+    assert "store start" in events
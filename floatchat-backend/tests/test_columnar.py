@@ -0,0 +1,73 @@
+import datetime
+import gzip
+import json
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from core import export
+from core.export import columnar_options, compress_body, encode_columnar, to_columns
+
+ROWS = [
+    {"pres_adjusted": 5.0, "temp_adjusted": Decimal("28.125"), "qc": "1", "profile_time": datetime.datetime(2025, 9, 12, 6, 30)},
+    {"pres_adjusted": 10.0, "temp_adjusted": None, "qc": "4", "profile_time": None},
+]
+
+
+def test_columnar_options():
+    assert columnar_options("application/json") is None
+    assert columnar_options(f"application/json, {export.COLUMNAR_MEDIA_TYPE}") == {"float32": False}
+    assert columnar_options(f"{export.COLUMNAR_MEDIA_TYPE}; precision=float32") == {"float32": True}
+    assert columnar_options(f"{export.COLUMNAR_MEDIA_TYPE};q=0") is None
+    with pytest.raises(HTTPException) as unsupported:
+        columnar_options(f"{export.COLUMNAR_MEDIA_TYPE}; precision=float16")
+    assert unsupported.value.status_code == 406
+
+
+def test_to_columns():
+    assert to_columns([]) == {"row_count": 0, "columns": {}}
+    assert to_columns(ROWS)["columns"]["qc"] == ["1", "4"]
+
+
+def test_encode_columnar_round_trips_as_json():
+    response = {"answer": "ok", "table_data": ROWS,
+                "plot_data": {"data": [{"x": [1.5, float("nan")], "y": [0.1, 2.0]}], "layout": {}}}
+    decoded = json.loads(encode_columnar(response))
+
+    assert decoded["answer"] == "ok"
+    assert decoded["table_data"] == {"row_count": 2, "columns": {
+        "pres_adjusted": [5.0, 10.0],
+        "temp_adjusted": [28.125, None],
+        "qc": ["1", "4"],
+        "profile_time": ["2025-09-12T06:30:00", None],
+    }}
+    assert decoded["plot_data"]["data"][0] == {"x": [1.5, None], "y": [0.1, 2.0]}
+
+
+def test_float32_precision_uses_shortest_float32_text():
+    body = encode_columnar({"table_data": [{"t": 0.1}, {"t": 28.123456789}]}, float32=True).decode()
+    assert '"t":[0.1,28.123457]' in body
+    assert json.loads(encode_columnar({"table_data": [{"t": 0.1}]}))["table_data"]["columns"]["t"] == [0.1]
+
+
+def test_float_text_round_trips_exactly():
+    values = list(np.random.default_rng(0).normal(size=200) * 1000)
+    decoded = json.loads(encode_columnar({"table_data": [{"v": v} for v in values]}))
+    assert decoded["table_data"]["columns"]["v"] == values
+
+
+def test_compress_body(monkeypatch):
+    monkeypatch.setattr(export, "COMPRESSION_MIN_BYTES", 10)
+    body = b'{"columns":' + b"[1.0,2.0]," * 100 + b"}"
+
+    assert compress_body(b"{}", "gzip") == (b"{}", None)
+    assert compress_body(body, "identity") == (body, None)
+    compressed, encoding = compress_body(body, "gzip, deflate")
+    assert encoding == "gzip" and gzip.decompress(compressed) == body
+    if export.brotli is not None:
+        compressed, encoding = compress_body(body, "gzip, br")
+        assert encoding == "br" and export.brotli.decompress(compressed) == body
+    monkeypatch.setattr(export, "brotli", None)
+    assert compress_body(body, "br, gzip")[1] == "gzip"
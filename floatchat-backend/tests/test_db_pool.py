@@ -0,0 +1,76 @@
+import psycopg2
+import psycopg2.pool
+
+from core import db
+
+
+class FakeCursor:
+    def __init__(self, error=None):
+        self.error = error
+
+    def execute(self, sql):
+        if self.error:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def cursor(self):
+        return FakeCursor(self.error)
+
+
+class FakePool:
+    def __init__(self, getconn_error=None, query_error=None):
+        self.closed = False
+        self.getconn_error = getconn_error
+        self.query_error = query_error
+        self.returned = []
+
+    def getconn(self):
+        if self.getconn_error:
+            raise self.getconn_error
+        return FakeConnection(self.query_error)
+
+    def putconn(self, conn, close=False):
+        self.returned.append(conn)
+
+
+def test_pool_keeps_a_connection_beyond_the_executor_and_streams():
+    assert db._executor._max_workers + db.STREAM_MAX_CONCURRENCY <= db.POOL_MAX_SIZE
+    assert db.PROBE_CONNECTIONS >= 1
+
+
+def test_ping_pool(monkeypatch):
+    monkeypatch.setattr(db, "_pool", None)
+    assert db.ping_pool() is False
+
+    pool = FakePool()
+    monkeypatch.setattr(db, "_pool", pool)
+    assert db.ping_pool() is True
+    assert len(pool.returned) == 1
+
+
+def test_ping_pool_exhausted_is_ready_but_broken_is_not(monkeypatch):
+    exhausted = FakePool(getconn_error=psycopg2.pool.PoolError("connection pool exhausted"))
+    monkeypatch.setattr(db, "_pool", exhausted)
+    assert db.ping_pool() is True
+
+    exhausted.closed = True
+    assert db.ping_pool() is False
+
+    monkeypatch.setattr(db, "_pool", FakePool(getconn_error=psycopg2.OperationalError("server closed")))
+    assert db.ping_pool() is False
+    broken = FakePool(query_error=psycopg2.OperationalError("server closed"))
+    monkeypatch.setattr(db, "_pool", broken)
+    assert db.ping_pool() is False
+    assert len(broken.returned) == 1
@@ -0,0 +1,60 @@
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+from chromadb.api.models.Collection import Collection
+
+import get_collection
+
+DOCS = [
+    "Table: floats, Column: platform_number, Type: integer",
+    "Table: profiles, Column: profile_time, Type: timestamp with time zone",
+    "Table: measurements, Column: temp_adjusted, Type: real",
+] + get_collection.ROLLUP_DOCS
+
+
+@pytest.fixture
+def refresh(tmp_path, monkeypatch):
+    """
+    Runs update_chroma_collection against a Chroma store in tmp_path, with fixed embeddings,
+    recording the docs sent for embedding and the IDs upserted on each run.
+    """
+    embedded, upserted = [], []
+    monkeypatch.setattr(get_collection, "CHROMA_PATH", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(get_collection, "embed_docs",
+                        lambda docs: embedded.extend(docs) or [[float(len(doc)), 1.0, 0.0] for doc in docs])
+    real_upsert = Collection.upsert
+
+    def recording_upsert(self, ids, **kwargs):
+        upserted.extend(ids)
+        return real_upsert(self, ids=ids, **kwargs)
+    monkeypatch.setattr(Collection, "upsert", recording_upsert)
+
+    def run(docs):
+        embedded.clear()
+        upserted.clear()
+        get_collection.update_chroma_collection(docs)
+        collection = chromadb.PersistentClient(path=get_collection.CHROMA_PATH).get_collection(get_collection.COLLECTION_NAME)
+        return list(embedded), list(upserted), set(collection.get(include=[])["ids"])
+    return run
+
+
+def test_second_refresh_over_same_docs_upserts_nothing(refresh):
+    embedded, upserted, stored = refresh(DOCS)
+    assert sorted(embedded) == sorted(DOCS)
+    assert stored == set(upserted) == {get_collection.doc_id(doc) for doc in DOCS}
+
+    # Same docs in another order (e.g. a column reorder) must not be re-embedded.
+    embedded, upserted, stored_again = refresh(list(reversed(DOCS)))
+    assert embedded == [] and upserted == []
+    assert stored_again == stored
+
+
+def test_refresh_embeds_only_changed_docs_and_removes_stale_ones(refresh):
+    refresh(DOCS)
+    changed = DOCS[:-1] + ["Table: measurements, Column: psal_adjusted, Type: real"]
+
+    embedded, upserted, stored = refresh(changed)
+
+    assert embedded == [changed[-1]]
+    assert upserted == [get_collection.doc_id(changed[-1])]
+    assert stored == {get_collection.doc_id(doc) for doc in changed}
@@ -0,0 +1,66 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from core import llm, metrics
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    """
+    Selects the fake backend through the environment, as a load test would, with fresh
+    stage semaphores so each asyncio.run gets its own.
+    """
+    def configure(latency_ms):
+        monkeypatch.setenv("FAKE_LLM_LATENCY_MS", str(latency_ms))
+        monkeypatch.setattr(llm, "LLM_BACKEND", "fake")
+        monkeypatch.setattr(llm, "_backend", None)
+        monkeypatch.setattr(llm, "_stage_limits",
+                            {stage: asyncio.Semaphore(limit) for stage, limit in llm.STAGE_CONCURRENCY.items()})
+        return llm.get_backend()
+    return configure
+
+
+def timeouts(stage):
+    return metrics.LLM_ERRORS._values.get((("error", "TimeoutError"), ("stage", stage)), 0)
+
+
+def test_stage_timeout_fires_when_fake_latency_exceeds_it(fake_backend, monkeypatch):
+    backend = fake_backend(latency_ms=500)
+    assert isinstance(backend, llm.FakeBackend) and backend.latency == 0.5
+    monkeypatch.setitem(llm.STAGE_TIMEOUTS, "sql", 0.05)
+    monkeypatch.setitem(llm.STAGE_TIMEOUTS, "embed", 0.05)
+    sql_before, embed_before = timeouts("sql"), timeouts("embed")
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(llm.generate("sql", "latest floats"))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(llm.embed(["latest floats"]))
+
+    assert timeouts("sql") == sql_before + 1
+    assert timeouts("embed") == embed_before + 1
+
+
+def test_fake_latency_below_timeout_returns_canned_response(fake_backend, monkeypatch):
+    fake_backend(latency_ms=1)
+    monkeypatch.setitem(llm.STAGE_TIMEOUTS, "sql", 1)
+
+    sql = asyncio.run(llm.generate("sql", "latest floats"))
+
+    assert sql.startswith("SELECT platform_number")
+
+
+def test_fake_embeddings_are_deterministic_unit_vectors(fake_backend):
+    fake_backend(latency_ms=0)
+    texts = ["temperature near 10N 70E", "salinity in March", "temperature near 10N 70E"]
+
+    first = np.array(asyncio.run(llm.embed(texts)))
+    # A new backend instance (another worker process) must produce the same vectors.
+    second = np.array(asyncio.run(llm.FakeBackend(latency=0).embed(texts)))
+
+    assert first.shape == (3, llm.EMBEDDING_DIM)
+    np.testing.assert_array_equal(first, second)
+    np.testing.assert_array_equal(first[0], first[2])
+    assert not np.allclose(first[0], first[1])
+    np.testing.assert_allclose(np.linalg.norm(first, axis=1), 1.0)
@@ -0,0 +1,92 @@
+import re
+
+from core import metrics
+from core.metrics import Counter, Histogram, render_prometheus, server_timing
+
+SAMPLE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+# RFC 7230 token, then ;dur=<number>.
+SERVER_TIMING_METRIC = re.compile(r"^[!#$%&'*+.^_`|~0-9A-Za-z-]+;dur=\d+(\.\d+)?$")
+
+
+def parse(text):
+    """
+    Parses exposition text into {"help": {}, "type": {}, "samples": [(name, labels, value)]}.
+    """
+    parsed = {"help": {}, "type": {}, "samples": []}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, _, help_text = line[7:].partition(" ")
+            parsed["help"][name] = help_text
+        elif line.startswith("# TYPE "):
+            name, _, kind = line[7:].partition(" ")
+            parsed["type"][name] = kind
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"malformed sample line: {line!r}"
+            labels = dict(LABEL.findall(match["labels"] or ""))
+            parsed["samples"].append((match["name"], labels, float(match["value"])))
+    return parsed
+
+
+def test_histogram_buckets_are_cumulative_with_inclusive_upper_bounds():
+    histogram = Histogram("test_seconds", "Test durations.", (0.1, 1, 10))
+    for value in (0.05, 0.1, 0.5, 1, 20):
+        histogram.observe(value, stage="sql")
+    histogram.observe(3, stage="triage")
+    parsed = parse("\n".join(histogram.render()))
+
+    assert parsed["type"] == {"test_seconds": "histogram"}
+    buckets = {s[1]["le"]: s[2] for s in parsed["samples"] if s[0] == "test_seconds_bucket" and s[1]["stage"] == "sql"}
+    assert buckets == {"0.1": 2, "1": 4, "10": 4, "+Inf": 5}
+    totals = {(s[0], s[1]["stage"]): s[2] for s in parsed["samples"] if not s[0].endswith("_bucket")}
+    assert totals[("test_seconds_count", "sql")] == 5
+    assert totals[("test_seconds_sum", "sql")] == 21.65
+    assert totals[("test_seconds_count", "triage")] == 1
+
+
+def test_counter_and_label_escaping():
+    counter = Counter("test_total", "Test events.")
+    counter.inc(decision="database_query")
+    counter.inc(2, decision="database_query")
+    counter.inc(reason='say "hi"\nnow\\')
+    parsed = parse("\n".join(counter.render()))
+
+    assert parsed["type"] == {"test_total": "counter"}
+    values = {tuple(s[1].items()): s[2] for s in parsed["samples"]}
+    assert values[(("decision", "database_query"),)] == 3
+    assert values[(("reason", r'say \"hi\"\nnow\\'),)] == 1
+
+
+def test_render_prometheus_is_valid_exposition_text(monkeypatch):
+    histogram = Histogram("test_rows", "Rows.", (1, 10))
+    histogram.observe(5)
+    monkeypatch.setattr(metrics, "REGISTRY", [histogram, Counter("test_empty_total", "Nothing yet.")])
+    text = render_prometheus(gauges=[("test_pool_in_use", "Connections in use.", 3)])
+    parsed = parse(text)
+
+    assert text.endswith("\n")
+    assert parsed["type"] == {"test_rows": "histogram", "test_empty_total": "counter", "test_pool_in_use": "gauge"}
+    assert ("test_rows_bucket", {"le": "+Inf"}, 1.0) in parsed["samples"]
+    assert ("test_pool_in_use", {}, 3.0) in parsed["samples"]
+
+
+def test_server_timing_sums_repeated_stages():
+    header = server_timing([("triage", 0.12), ("sql", 0.3), ("triage", 0.0301)], total_seconds=0.5)
+    assert header == "triage;dur=150.1, sql;dur=300.0, total;dur=500.0"
+    assert all(SERVER_TIMING_METRIC.match(part) for part in header.split(", "))
+
+
+def test_spans_land_in_the_current_trace():
+    token, trace = metrics.start_trace()
+    try:
+        with metrics.span("embed"):
+            pass
+        metrics.record_stage("db_execute", 0.25)
+    finally:
+        metrics.end_trace(token)
+    assert [stage for stage, _ in trace] == ["embed", "db_execute"]
+    metrics.record_stage("after", 0.1)
+    assert len(trace) == 2
+    header = server_timing(trace, 1.0)
+    assert all(SERVER_TIMING_METRIC.match(part) for part in header.split(", "))
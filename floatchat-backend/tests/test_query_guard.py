@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+
+import pytest
+
+from core import db
+from core.db import QueryRejected, _plan_problems, guard_query
+
+
+def plan(cost, rows):
+    return {"Node Type": "Seq Scan", "Relation Name": "measurements", "Total Cost": cost, "Plan Rows": rows}
+
+
+class FakeCursor:
+    """
+    Answers EXPLAIN with the plan registered for the first matching SQL fragment; records the rest.
+    """
+    def __init__(self, plans, rows=()):
+        self.plans = plans
+        self.rows = list(rows)
+        self.executed = []
+        self.description = [type("Column", (), {"name": "x", "type_code": 23})]
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        sql = self.executed[-1][0]
+        return [[{"Plan": next(p for fragment, p in self.plans if fragment in sql)}]]
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_plan_problems(monkeypatch):
+    monkeypatch.setattr(db, "QUERY_MAX_PLAN_COST", 1000)
+    monkeypatch.setattr(db, "QUERY_MAX_PLAN_ROWS", 100)
+    assert _plan_problems(plan(10, 10)) == []
+    assert _plan_problems(plan(5000, 10)) == ["estimated cost 5000 exceeds 1000"]
+    assert len(_plan_problems(plan(5000, 500))) == 2
+    assert _plan_problems(plan(10, 500), check_rows=False) == []
+    assert _plan_problems(plan(5000, 10), max_cost=10000) == []
+
+
+def test_guard_accepts_cheap_plans_unchanged(monkeypatch):
+    monkeypatch.setattr(db, "QUERY_MAX_PLAN_COST", 1000)
+    cursor = FakeCursor([("SELECT", plan(10, 10))])
+    assert guard_query(cursor, "SELECT 1", limit=5) == ("SELECT 1", plan(10, 10))
+    assert cursor.executed[0] == ("SET LOCAL statement_timeout = %s;", (db.QUERY_STATEMENT_TIMEOUT_MS,))
+
+
+def test_guard_wraps_in_limit_when_that_fixes_the_plan(monkeypatch):
+    monkeypatch.setattr(db, "QUERY_MAX_PLAN_ROWS", 100)
+    cursor = FakeCursor([("guarded_query LIMIT", plan(50, 11)), ("SELECT", plan(5000, 10**6))])
+    sql, original = guard_query(cursor, "SELECT * FROM measurements;", limit=11)
+    assert sql == "SELECT * FROM (SELECT * FROM measurements) AS guarded_query LIMIT 11"
+    assert original == plan(5000, 10**6)
+
+
+def test_guard_rejects_when_limit_does_not_help(monkeypatch):
+    monkeypatch.setattr(db, "QUERY_MAX_PLAN_COST", 1000)
+    monkeypatch.setattr(db, "REJECTED_PLAN_LOG_PATH", None)
+    cursor = FakeCursor([("guarded_query LIMIT", plan(10**9, 11)), ("SELECT", plan(10**9, 10))])
+    with pytest.raises(QueryRejected) as rejected:
+        guard_query(cursor, "SELECT * FROM a CROSS JOIN b", limit=11)
+    assert rejected.value.status_code == 422
+    assert db.rejected_plans()[0]["plan"]["relations"] == ["measurements"]
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.closed = False
+        self.autocommit = True
+
+    def cursor(self, name=None, cursor_factory=None):
+        return self._cursor
+
+    def rollback(self):
+        pass
+
+
+def stream(monkeypatch, cursor, sql="SELECT x FROM big"):
+    @contextmanager
+    def pooled_connection():
+        yield FakeConnection(cursor)
+
+    monkeypatch.setattr(db, "pooled_connection", pooled_connection)
+    monkeypatch.setattr(db, "REJECTED_PLAN_LOG_PATH", None)
+    return db.stream_sql_query(sql, batch_size=2)
+
+
+def test_stream_is_gated_by_its_own_cost_ceiling(monkeypatch):
+    # A plan /query only accepted behind a LIMIT: no row ceiling when streaming, but a cost one.
+    monkeypatch.setattr(db, "QUERY_STREAM_MAX_PLAN_COST", 10**6)
+    rows = [(i,) for i in range(5)]
+    cursor = FakeCursor([("SELECT", plan(10**5, 10**8))], rows)
+    assert [batch for _, batch in stream(monkeypatch, cursor)] == [rows[:2], rows[2:4], rows[4:]]
+    assert cursor.executed[0][1] == (db.QUERY_STREAM_STATEMENT_TIMEOUT_MS,)
+
+    with pytest.raises(QueryRejected):
+        next(stream(monkeypatch, FakeCursor([("SELECT", plan(10**7, 10))], rows)))
+
+
+def test_stream_stops_after_its_time_bound(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(db.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(db, "QUERY_STREAM_MAX_SECONDS", 10)
+    batches = stream(monkeypatch, FakeCursor([("SELECT", plan(10, 10))], [(i,) for i in range(10)]))
+    next(batches)
+    clock[0] = 11
+    with pytest.raises(QueryRejected) as rejected:
+        next(batches)
+    assert "stream exceeded 10 s" in rejected.value.detail
+
+
+def test_sql_signatures():
+    signature = db.sign_sql("SELECT 1")
+    assert db.verify_sql_signature("SELECT 1", signature)
+    assert not db.verify_sql_signature("SELECT 2", signature)
+    assert not db.verify_sql_signature("SELECT 1", None)
@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from core.cache import ResultCache, normalize_sql
+
+ROWS = [{"platform_number": 1901, "temp_adjusted": Decimal("10.5")}, {"platform_number": 1902, "temp_adjusted": None}]
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT *\n  FROM profiles ;") == "SELECT * FROM profiles"
+
+
+def test_round_trip_and_key_normalization():
+    cache = ResultCache()
+    assert cache.get("SELECT * FROM measurements", 1) is None
+    cache.put("SELECT * FROM measurements;", 1, ROWS)
+
+    assert cache.get("SELECT *   FROM measurements", 1) == ROWS
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_empty_results_keep_no_columns():
+    cache = ResultCache()
+    cache.put("SELECT 1 WHERE false", 1, [])
+    assert cache.get("SELECT 1 WHERE false", 1) == []
+
+
+def test_new_data_version_drops_everything():
+    cache = ResultCache()
+    cache.put("SELECT 1", 1, ROWS)
+    assert cache.get("SELECT 1", 2) is None
+    assert cache.invalidations == 1 and cache.stats()["entries"] == 0 and cache.bytes == 0
+
+
+def test_volatile_and_oversized_results_are_not_cached():
+    cache = ResultCache(max_rows=1)
+    cache.put("SELECT now()", 1, ROWS[:1])
+    cache.put("SELECT * FROM floats", 1, ROWS)
+    assert cache.stats()["entries"] == 0
+
+
+def test_byte_bound_evicts_least_recently_used():
+    probe = ResultCache()
+    probe.put("SELECT 0", 1, ROWS)
+    cache = ResultCache(max_bytes=probe.bytes * 2)
+    cache.put("SELECT 1", 1, ROWS)
+    cache.put("SELECT 2", 1, ROWS)
+    cache.get("SELECT 1", 1)
+    cache.put("SELECT 3", 1, ROWS)
+
+    assert cache.get("SELECT 2", 1) is None
+    assert cache.get("SELECT 1", 1) == ROWS and cache.get("SELECT 3", 1) == ROWS
+    assert cache.bytes <= cache.max_bytes
@@ -0,0 +1,66 @@
+import sys
+import types
+
+import numpy as np
+
+from core import retrieval
+from core.retrieval import SchemaIndex, TfidfEmbedder, build_schema_index
+
+CORPUS = [
+    "The 'floats' table contains metadata about each Argo float: platform_number, project_name and platform_type.",
+    "The 'profiles' table stores one row per cycle with profile_time and a geographic location.",
+    "The column 'temp_adjusted' is the adjusted sea water temperature in degrees Celsius.",
+    "The column 'psal_adjusted' is the adjusted practical salinity in PSU.",
+    "The 'float_latest_position' table holds the latest known position of every float.",
+]
+
+
+def test_tfidf_embeddings_are_unit_norm_and_ignore_unknown_terms():
+    embedder = TfidfEmbedder().fit(CORPUS)
+    vectors = embedder.embed(["temperature", "zzzz qqqq"])
+    assert vectors.shape == (2, len(embedder.index))
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert not vectors[1].any()
+
+
+def test_tfidf_ranking():
+    index = SchemaIndex(CORPUS, TfidfEmbedder())
+    # Trigrams let "temperature" match temp_adjusted and "salinity" match the psal doc.
+    assert index.search("sea temperature readings", k=1) == [CORPUS[2]]
+    assert index.search("salinity in PSU", k=1) == [CORPUS[3]]
+    assert index.search("latest position of a float", k=2)[0] == CORPUS[4]
+    assert len(index.search("anything", k=50)) == len(CORPUS)
+
+
+def test_search_by_vector_orders_by_score():
+    index = SchemaIndex(CORPUS, TfidfEmbedder())
+    vector = index.matrix[1] * 0.6 + index.matrix[3] * 0.4
+    assert index.search_by_vector(vector, k=2) == [CORPUS[1], CORPUS[3]]
+
+
+def test_local_backend_falls_back_to_tfidf_without_sentence_transformers(monkeypatch):
+    monkeypatch.setitem(sys.modules, "sentence_transformers", None)
+    index = build_schema_index(CORPUS, backend="local")
+    assert isinstance(index.embedder, TfidfEmbedder)
+    assert not index.embedder.cacheable
+
+
+def test_local_backend_uses_sentence_transformers_when_available(monkeypatch):
+    class FakeModel:
+        def __init__(self, name, device):
+            self.name = name
+
+        def encode(self, texts, normalize_embeddings):
+            return np.eye(len(CORPUS), dtype=np.float32)[[CORPUS.index(t) if t in CORPUS else 0 for t in texts]]
+
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=FakeModel))
+    index = build_schema_index(CORPUS, backend="local")
+    assert index.embedder.name == "local" and index.embedder.cacheable
+    assert index.embedder.model.name == retrieval.LOCAL_EMBEDDING_MODEL
+    assert index.search(CORPUS[3], k=1) == [CORPUS[3]]
+
+
+def test_build_schema_index_backends():
+    assert build_schema_index([]) is None
+    assert isinstance(build_schema_index(CORPUS, backend="gemini").embedder, TfidfEmbedder)
+    assert isinstance(build_schema_index(CORPUS, backend="tfidf").embedder, TfidfEmbedder)
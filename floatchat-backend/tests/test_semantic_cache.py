@@ -0,0 +1,82 @@
+import numpy as np
+
+from core.cache import SemanticCache, cache_collection_name, query_literals
+
+SPACE = "local:4"
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_query_literals():
+    assert query_literals("Temperature of float 2902746 in Sept 2025") == {"2902746", "2025", "sep"}
+    assert query_literals("salinity at 10.5 dbar on 2025-09-01") == {"10.5", "2025-09-01"}
+    assert query_literals("latest positions") == frozenset()
+
+
+def test_cache_collection_name():
+    assert cache_collection_name("gemini:768") == "query_cache"
+    assert cache_collection_name("local:384") == "query_cache_local_384"
+
+
+def test_hit_above_threshold_with_same_literals():
+    cache = SemanticCache(threshold=0.95)
+    cache.store("temperature of float 1901", vector(1, 0, 0, 0), SPACE, "sql", sql="SELECT 1")
+
+    hit = cache.lookup(vector(1, 0.1, 0, 0), SPACE, "Temperature of float 1901?")
+    assert hit["sql"] == "SELECT 1" and hit["similarity"] > 0.95
+    assert cache.lookup(vector(0, 1, 0, 0), SPACE, "temperature of float 1901") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_different_literals_never_hit():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("temperature of float 1901", vector(1, 0, 0, 0), SPACE, "sql", sql="SELECT 1901")
+    cache.store("temperature of float 1902", vector(1, 0.05, 0, 0), SPACE, "sql", sql="SELECT 1902")
+
+    assert cache.lookup(vector(1, 0, 0, 0), SPACE, "temperature of float 1902")["sql"] == "SELECT 1902"
+    assert cache.lookup(vector(1, 0, 0, 0), SPACE, "temperature of float 1903") is None
+    assert cache.literal_mismatches == 3
+
+
+def test_spaces_are_separate_and_dimension_changes_miss():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("latest positions", vector(1, 0, 0, 0), SPACE, "sql", sql="SELECT 4")
+    cache.store("latest positions", vector(1, 0, 0), "local:3", "sql", sql="SELECT 3")
+
+    assert cache.lookup(vector(1, 0, 0), "local:3", "latest positions")["sql"] == "SELECT 3"
+    assert cache.lookup(vector(1, 0, 0, 0), SPACE, "latest positions")["sql"] == "SELECT 4"
+    assert cache.lookup(vector(1, 0, 0, 0, 0), SPACE, "latest positions") is None
+    assert cache.lookup(vector(1, 0, 0, 0), "other:4", "latest positions") is None
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("core.cache.time.time", lambda: clock[0])
+    cache = SemanticCache(threshold=0.9, max_entries=2, ttl_seconds=60)
+    for i, embedding in enumerate([vector(1, 0, 0, 0), vector(0, 1, 0, 0), vector(0, 0, 1, 0)]):
+        cache.store(f"query {i}", embedding, SPACE, "sql", sql=f"SELECT {i}")
+
+    assert cache.stats()["entries"] == 2 and cache.evictions == 1
+    assert cache.lookup(vector(1, 0, 0, 0), SPACE, "query 0") is None
+    assert cache.lookup(vector(0, 1, 0, 0), SPACE, "query 1")["sql"] == "SELECT 1"
+
+    clock[0] += 61
+    assert cache.lookup(vector(0, 1, 0, 0), SPACE, "query 1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_persist_per_space(tmp_path):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    cache = SemanticCache(client, threshold=0.9)
+    cache.store("latest positions", vector(1, 0, 0, 0), SPACE, "sql", sql="SELECT 4")
+    cache.store("latest positions", vector(1, 0, 0), "local:3", "sql", sql="SELECT 3")
+
+    names = sorted(getattr(c, "name", c) for c in client.list_collections())
+    assert names == ["query_cache_local_3", "query_cache_local_4"]
+    reloaded = SemanticCache(client, threshold=0.9)
+    assert reloaded.stats()["entries"] == 2
+    assert reloaded.lookup(vector(1, 0, 0), "local:3", "latest positions")["sql"] == "SELECT 3"
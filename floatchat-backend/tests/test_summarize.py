@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import numpy as np
+
+from core.summarize import DEPTH_BIN_EDGES, SAMPLE_ROWS, build_plot_data, lttb, summarize_results
+
+
+def test_lttb_keeps_everything_below_threshold():
+    x = np.arange(10, dtype=float)
+    assert lttb(x, x, 10).tolist() == list(range(10))
+    assert lttb(x, x, 2).tolist() == list(range(10))
+
+
+def test_lttb_keeps_endpoints_and_sorted_unique_indices():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 25.0)
+    keep = lttb(x, y, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_picks_the_spike():
+    x = np.arange(500, dtype=float)
+    y = np.zeros(500)
+    y[237] = 100.0
+    assert 237 in lttb(x, y, 20)
+
+
+def test_summarize_empty_result():
+    summary = summarize_results([])
+    assert summary == {"row_count": 0, "columns": {}, "sample_rows": []}
+
+
+def test_summarize_column_kinds_and_stats():
+    rows = [
+        {"platform_number": 1, "temp_adjusted": Decimal("10.5"), "profile_time": datetime(2025, 9, 1), "qc": "1"},
+        {"platform_number": 2, "temp_adjusted": None, "profile_time": datetime(2025, 9, 3, tzinfo=timezone.utc), "qc": "1"},
+        {"platform_number": 3, "temp_adjusted": 12.5, "profile_time": None, "qc": "4"},
+    ]
+    columns = summarize_results(rows)["columns"]
+
+    assert columns["temp_adjusted"] == {"type": "numeric", "nulls": 1, "min": 10.5, "max": 12.5, "mean": 11.5, "std": 1.0}
+    assert columns["profile_time"]["type"] == "datetime"
+    assert columns["profile_time"]["min"].startswith("2025-09-01")
+    assert columns["profile_time"]["max"].startswith("2025-09-03")
+    assert columns["qc"] == {"type": "text", "nulls": 0, "distinct": 2, "top_values": {"1": 2, "4": 1}}
+
+
+def test_summarize_depth_bins_and_sample():
+    rows = [{"pres_adjusted": p, "temp_adjusted": t} for p, t in [(5, 20.0), (8, 22.0), (30, 15.0), (None, 1.0)]]
+    summary = summarize_results(rows * 3)
+
+    depth = summary["depth_bins"]
+    assert depth["column"] == "pres_adjusted"
+    assert depth["bins"] == [
+        {"range": [DEPTH_BIN_EDGES[0], DEPTH_BIN_EDGES[1]], "rows": 6, "mean_temp_adjusted": 21.0},
+        {"range": [DEPTH_BIN_EDGES[1], DEPTH_BIN_EDGES[2]], "rows": 3, "mean_temp_adjusted": 15.0},
+    ]
+    assert len(summary["sample_rows"]) == SAMPLE_ROWS
+
+
+def test_build_plot_data_downsamples_along_pressure(monkeypatch):
+    monkeypatch.setattr("core.summarize.PLOT_MAX_POINTS", 100)
+    rows = [{"pres_adjusted": float(p), "temp_adjusted": 20.0 - p / 100} for p in range(2000, 0, -1)]
+    figure = build_plot_data(rows, {"type": "line", "x": "temp_adjusted", "y": "pres_adjusted"})
+
+    (trace,) = figure["data"]
+    assert len(trace["y"]) == 100
+    assert trace["y"] == sorted(trace["y"])
+    assert figure["layout"]["yaxis"]["autorange"] == "reversed"
+
+
+def test_build_plot_data_rejects_unknown_columns():
+    rows = [{"a": 1, "b": 2}]
+    assert build_plot_data(rows, {"type": "scatter", "x": "a", "y": "missing"}) is None
+    assert build_plot_data(rows, {"type": "pie", "x": "a", "y": "b"}) is None
@@ -1,7 +1,144 @@
+import argparse
+import glob
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import netCDF4
 import psycopg2
+import psycopg2.extras
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+import argo_schema
+
+# --- DATA VERSION ---
+# The API caches query results per data version; every committed ingest bumps it.
+
+def bump_data_version(conn):
+    """
+    Increments the shared data version in its own transaction. Call only after the data commit.
+    """
+    with conn.cursor() as cur:
+        cur.execute("UPDATE data_version SET version = version + 1, updated_at = now() RETURNING version;")
+        version = cur.fetchone()[0]
+    conn.commit()
+    return version
+
+
+# --- ROLLUPS ---
+# Rollup tables are created by argo_schema (migration 3) and kept up to date incrementally
+# after each ingest.
+DEPTH_BINS = [0, 10, 50, 100, 200, 500, 1000, 1500, 2000, 6000]
+
+# {scope} is either "TRUE" (full rebuild) or a filter restricting the work to what the
+# current file's staging_profiles touched.
+REFRESH_LATEST_POSITION_SQL = """
+INSERT INTO float_latest_position (platform_number, cycle_number, profile_time, location)
+SELECT DISTINCT ON (platform_number) platform_number, cycle_number, profile_time, location
+FROM profiles
+WHERE profile_time IS NOT NULL AND ({scope})
+ORDER BY platform_number, profile_time DESC
+ON CONFLICT (platform_number) DO UPDATE SET
+    cycle_number = EXCLUDED.cycle_number,
+    profile_time = EXCLUDED.profile_time,
+    location = EXCLUDED.location;
+"""
+
+AFFECTED_CELLS_SQL = """
+CREATE TEMP TABLE affected_cells ON COMMIT DROP AS
+SELECT DISTINCT c.lat_cell, c.lon_cell, c.month
+FROM profile_cells c
+WHERE {scope};
+"""
+
+REFRESH_PROFILE_COUNTS_SQL = """
+INSERT INTO profile_counts_monthly (lat_cell, lon_cell, month, profile_count, float_count)
+SELECT c.lat_cell, c.lon_cell, c.month, count(*), count(DISTINCT c.platform_number)
+FROM profile_cells c
+JOIN affected_cells a USING (lat_cell, lon_cell, month)
+GROUP BY c.lat_cell, c.lon_cell, c.month
+ON CONFLICT (lat_cell, lon_cell, month) DO UPDATE SET
+    profile_count = EXCLUDED.profile_count,
+    float_count = EXCLUDED.float_count;
+"""
+
+REFRESH_DEPTH_BIN_MEANS_SQL = """
+INSERT INTO depth_bin_means_monthly (lat_cell, lon_cell, month, depth_min, depth_max, measurement_count,
+                                     mean_temp_adjusted, mean_psal_adjusted, temp_good_count, psal_good_count)
+SELECT c.lat_cell, c.lon_cell, c.month, b.depth_min, b.depth_max, count(*),
+       avg(m.temp_adjusted) FILTER (WHERE m.temp_adjusted_qc = '1'),
+       avg(m.psal_adjusted) FILTER (WHERE m.psal_adjusted_qc = '1'),
+       count(m.temp_adjusted) FILTER (WHERE m.temp_adjusted_qc = '1'),
+       count(m.psal_adjusted) FILTER (WHERE m.psal_adjusted_qc = '1')
+FROM profile_cells c
+JOIN affected_cells a USING (lat_cell, lon_cell, month)
+JOIN measurements m USING (platform_number, cycle_number)
+JOIN (SELECT lower_edge AS depth_min, upper_edge AS depth_max
+      FROM unnest(%(lower)s::REAL[], %(upper)s::REAL[]) AS e(lower_edge, upper_edge)) b
+  ON m.pres_adjusted >= b.depth_min AND m.pres_adjusted < b.depth_max
+GROUP BY c.lat_cell, c.lon_cell, c.month, b.depth_min, b.depth_max
+ON CONFLICT (lat_cell, lon_cell, month, depth_min) DO UPDATE SET
+    depth_max = EXCLUDED.depth_max,
+    measurement_count = EXCLUDED.measurement_count,
+    mean_temp_adjusted = EXCLUDED.mean_temp_adjusted,
+    mean_psal_adjusted = EXCLUDED.mean_psal_adjusted,
+    temp_good_count = EXCLUDED.temp_good_count,
+    psal_good_count = EXCLUDED.psal_good_count;
+"""
+
+CLEAR_AFFECTED_ROLLUPS_SQL = """
+DELETE FROM profile_counts_monthly r USING affected_cells a
+WHERE r.lat_cell = a.lat_cell AND r.lon_cell = a.lon_cell AND r.month = a.month;
+DELETE FROM depth_bin_means_monthly r USING affected_cells a
+WHERE r.lat_cell = a.lat_cell AND r.lon_cell = a.lon_cell AND r.month = a.month;
+"""
+
+# Serializes rollup refreshes across parallel loaders so each one recomputes from committed data.
+ROLLUP_LOCK_ID = 0x41524730
+
+
+def refresh_rollups(cur, incremental=True, replaced_cells=False):
+    """
+    Recomputes the rollup rows affected by the current transaction's staging_profiles
+    (incremental), or truncates and rebuilds all of them. replaced_cells also recomputes the
+    cells listed in the replaced_cells temp table (where replaced profiles used to be). Runs
+    inside the caller's transaction; does not commit.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (ROLLUP_LOCK_ID,))
+    if not incremental:
+        # Rows for floats or cells that no longer have profiles would otherwise survive a rebuild.
+        cur.execute("TRUNCATE float_latest_position, profile_counts_monthly, depth_bin_means_monthly;")
+    if incremental:
+        platform_scope = "platform_number IN (SELECT platform_number FROM staging_profiles)"
+        cell_scope = "(c.platform_number, c.cycle_number) IN (SELECT platform_number, cycle_number FROM staging_profiles)"
+    else:
+        platform_scope = cell_scope = "TRUE"
+    cur.execute(REFRESH_LATEST_POSITION_SQL.format(scope=platform_scope))
+    cur.execute("DROP TABLE IF EXISTS affected_cells;")
+    cur.execute(AFFECTED_CELLS_SQL.format(scope=cell_scope))
+    if replaced_cells:
+        cur.execute("INSERT INTO affected_cells SELECT * FROM replaced_cells EXCEPT SELECT * FROM affected_cells;")
+    cur.execute(CLEAR_AFFECTED_ROLLUPS_SQL)
+    cur.execute(REFRESH_PROFILE_COUNTS_SQL)
+    cur.execute(REFRESH_DEPTH_BIN_MEANS_SQL, {"lower": DEPTH_BINS[:-1], "upper": DEPTH_BINS[1:]})
+
+
+def rebuild_rollups(db_params):
+    """
+    Recomputes every rollup table from profiles/measurements.
+    """
+    conn = psycopg2.connect(**db_params)
+    try:
+        argo_schema.migrate(conn)
+        with conn.cursor() as cur:
+            refresh_rollups(cur, incremental=False)
+        conn.commit()
+        bump_data_version(conn)
+    finally:
+        conn.close()
+    print("✅ Rollup tables rebuilt.")
+
 
 def load_argo_nc_to_postgres(nc_file_path, db_params):
     try:
@@ -11,103 +148,722 @@ def load_argo_nc_to_postgres(nc_file_path, db_params):
     except psycopg2.OperationalError as e:
         print(f"❌ Could not connect to the database: {e}")
         return
+    argo_schema.migrate(conn, verbose=True)
 
     print(f"🔄 Reading from NetCDF file: {nc_file_path}")
     with netCDF4.Dataset(nc_file_path, 'r') as nc_file:
-        platform_number = int(nc_file.variables['PLATFORM_NUMBER'][0].tobytes().decode('utf-8').strip())
-        
-        print(f"  - Found Platform Number: {platform_number}")
-        
         insert_float_sql = """
         INSERT INTO floats (platform_number, project_name, pi_name, platform_type, float_serial_no, wmo_inst_type)
         VALUES (%s, %s, %s, %s, %s, %s)
         ON CONFLICT (platform_number) DO NOTHING;
         """
-        project_name = nc_file.variables['PROJECT_NAME'][0].tobytes().decode('utf-8').strip()
-        pi_name = nc_file.variables['PI_NAME'][0].tobytes().decode('utf-8').strip()
-        platform_type = nc_file.variables['PLATFORM_TYPE'][0].tobytes().decode('utf-8').strip()
-        float_serial_no = nc_file.variables['FLOAT_SERIAL_NO'][0].tobytes().decode('utf-8').strip()
-        wmo_inst_type = nc_file.variables['WMO_INST_TYPE'][0].tobytes().decode('utf-8').strip()
-
-        cur.execute(insert_float_sql, (platform_number, project_name, pi_name, platform_type, float_serial_no, wmo_inst_type))
-        print(f"  - Upserted float {platform_number} into 'floats' table.")
 
         num_profiles = len(nc_file.dimensions['N_PROF'])
         print(f"  - Found {num_profiles} profiles in this file.")
         
-        reference_date_time = datetime.strptime(
-            nc_file.variables['REFERENCE_DATE_TIME'][:].tobytes().decode('utf-8').strip(), 
-            '%Y%m%d%H%M%S'
-        )
-
-        for i in range(num_profiles):
-            cycle_number = int(nc_file.variables['CYCLE_NUMBER'][i])
-            print(f"\n  - Processing Profile {i+1}/{num_profiles} (Cycle: {cycle_number})")
-            
-            direction = nc_file.variables['DIRECTION'][i].tobytes().decode('utf-8').strip()
-            juld = nc_file.variables['JULD'][i]
-            profile_time = None
-            if not np.ma.is_masked(juld):
-                profile_time = reference_date_time + timedelta(days=float(juld))
-                
-            latitude = nc_file.variables['LATITUDE'][i]
-            longitude = nc_file.variables['LONGITUDE'][i]
-            
-            location_wkt = None
-            if not np.ma.is_masked(latitude) and not np.ma.is_masked(longitude):
-                location_wkt = f"POINT({longitude} {latitude})"
-            
-            profile_pres_qc = nc_file.variables['PROFILE_PRES_QC'][i].tobytes().decode('utf-8').strip()
-            profile_temp_qc = nc_file.variables['PROFILE_TEMP_QC'][i].tobytes().decode('utf-8').strip()
-            profile_psal_qc = nc_file.variables['PROFILE_PSAL_QC'][i].tobytes().decode('utf-8').strip()
-            
-            insert_profile_sql = """
-            INSERT INTO profiles (platform_number, cycle_number, direction, profile_time, location, profile_pres_qc, profile_temp_qc, profile_psal_qc)
-            VALUES (%s, %s, %s, %s, ST_SetSRID(ST_GeomFromText(%s), 4326), %s, %s, %s)
-            ON CONFLICT (platform_number, cycle_number) DO NOTHING;
-            """
-            cur.execute(insert_profile_sql, (platform_number, cycle_number, direction, profile_time, location_wkt, profile_pres_qc, profile_temp_qc, profile_psal_qc))
-            
-            measurements_count = 0
-            num_levels = len(nc_file.dimensions['N_LEVELS'])
-            pres_adjusted = nc_file.variables['PRES_ADJUSTED'][i, :]
-            temp_adjusted = nc_file.variables['TEMP_ADJUSTED'][i, :]
-            psal_adjusted = nc_file.variables['PSAL_ADJUSTED'][i, :]
-            pres_adjusted_qc = nc_file.variables['PRES_ADJUSTED_QC'][i, :].tobytes().decode('utf-8')
-            temp_adjusted_qc = nc_file.variables['TEMP_ADJUSTED_QC'][i, :].tobytes().decode('utf-8')
-            psal_adjusted_qc = nc_file.variables['PSAL_ADJUSTED_QC'][i, :].tobytes().decode('utf-8')
-
-            for j in range(num_levels):
-                if not np.ma.is_masked(pres_adjusted[j]):
-                    insert_measurement_sql = """
-                    INSERT INTO measurements (platform_number, cycle_number, pres_adjusted, pres_adjusted_qc, temp_adjusted, temp_adjusted_qc, psal_adjusted, psal_adjusted_qc)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (platform_number, cycle_number, pres_adjusted) DO NOTHING;
-                    """
-                    temp_val = float(temp_adjusted[j]) if not np.ma.is_masked(temp_adjusted[j]) else None
-                    psal_val = float(psal_adjusted[j]) if not np.ma.is_masked(psal_adjusted[j]) else None
-                    
+        insert_profile_sql = """
+        INSERT INTO profiles (platform_number, cycle_number, direction, profile_time, location, profile_pres_qc, profile_temp_qc, profile_psal_qc, content_checksum)
+        VALUES (%s, %s, %s, %s, ST_SetSRID(ST_GeomFromText(%s), 4326), %s, %s, %s, %s)
+        ON CONFLICT (platform_number, cycle_number) DO NOTHING;
+        """
+        insert_measurement_sql = """
+        INSERT INTO measurements (platform_number, cycle_number, pres_adjusted, pres_adjusted_qc, temp_adjusted, temp_adjusted_qc, psal_adjusted, psal_adjusted_qc)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (platform_number, cycle_number, pres_adjusted) DO NOTHING;
+        """
+
+        loaded_keys = []
+        for batch in read_profile_batches(nc_file):
+            floats, profiles, measurements = batch["floats"], batch["profiles"], batch["measurements"]
+            # Measurements come grouped by profile; level_bounds[k]:level_bounds[k + 1] are profile k's.
+            level_bounds = np.searchsorted(measurements["profile_index"], np.arange(len(profiles["cycle_number"]) + 1))
+
+            for k in range(len(profiles["cycle_number"])):
+                # Merged files hold profiles from many floats: key every row by its own profile's float.
+                platform_number = int(profiles["platform_number"][k])
+                cycle_number = int(profiles["cycle_number"][k])
+                loaded_keys.append((platform_number, cycle_number))
+                print(f"\n  - Processing Profile {profiles['n_prof'][k]+1}/{num_profiles} "
+                      f"(Float: {platform_number}, Cycle: {cycle_number})")
+
+                float_metadata = [str(floats[name.lower()][k]) for name in FLOAT_METADATA_VARIABLES]
+                cur.execute(insert_float_sql, (platform_number, *float_metadata))
+
+                profile_time = None
+                if not np.isnat(profiles["profile_time"][k]):
+                    profile_time = profiles["profile_time"][k].item()
+
+                latitude = profiles["latitude"][k]
+                longitude = profiles["longitude"][k]
+                location_wkt = None
+                if not np.ma.is_masked(latitude) and not np.ma.is_masked(longitude):
+                    location_wkt = f"POINT({longitude} {latitude})"
+
+                cur.execute(insert_profile_sql, (
+                    platform_number, cycle_number, profiles["direction"][k].strip(), profile_time, location_wkt,
+                    profiles["profile_pres_qc"][k].strip(), profiles["profile_temp_qc"][k].strip(),
+                    profiles["profile_psal_qc"][k].strip(), profiles["content_checksum"][k]
+                ))
+
+                measurements_count = 0
+                for j in range(level_bounds[k], level_bounds[k + 1]):
+                    temp_val = None if np.ma.is_masked(measurements["temp_adjusted"][j]) else float(measurements["temp_adjusted"][j])
+                    psal_val = None if np.ma.is_masked(measurements["psal_adjusted"][j]) else float(measurements["psal_adjusted"][j])
+
                     cur.execute(insert_measurement_sql, (
-                        platform_number, cycle_number, float(pres_adjusted[j]),
-                        pres_adjusted_qc[j], temp_val, temp_adjusted_qc[j],
-                        psal_val, psal_adjusted_qc[j]
+                        platform_number, cycle_number, float(measurements["pres_adjusted"][j]),
+                        measurements["pres_adjusted_qc"][j], temp_val, measurements["temp_adjusted_qc"][j],
+                        psal_val, measurements["psal_adjusted_qc"][j]
                     ))
                     measurements_count += 1
-            print(f"    -> Inserted 1 profile row and {measurements_count} measurement rows.")
+                print(f"    -> Inserted 1 profile row and {measurements_count} measurement rows.")
+
 
+    # Scope the rollup refresh to this file's profiles, as the COPY path does.
+    print("\nRefreshing rollup tables...")
+    cur.execute(STAGING_DDL)
+    psycopg2.extras.execute_values(
+        cur, "INSERT INTO staging_profiles (platform_number, cycle_number) VALUES %s", loaded_keys
+    )
+    refresh_rollups(cur)
 
     print("\nCommitting transaction to database...")
     conn.commit()
+    bump_data_version(conn)
     cur.close()
     conn.close()
     print("✅ Data from {nc_file_path} loaded successfully.")
 
-if __name__ == '__main__':
-    db_connection_params = {
-        "host": "localhost",
-        "database": "argodb",
-        "user": "argo",
-        "password": "mysecretpassword"
+# --- CHUNKED NETCDF READER ---
+# Profiles are read PROFILE_BLOCK_SIZE at a time: one HDF5 read per variable per block, so memory
+# stays bounded on large merged GDAC files and there is no per-profile Python decoding.
+PROFILE_BLOCK_SIZE = int(os.getenv("ARGO_PROFILE_BLOCK_SIZE", "512"))
+FLOAT_METADATA_VARIABLES = ('PROJECT_NAME', 'PI_NAME', 'PLATFORM_TYPE', 'FLOAT_SERIAL_NO', 'WMO_INST_TYPE')
+MEASUREMENT_VARIABLES = ('PRES_ADJUSTED', 'TEMP_ADJUSTED', 'PSAL_ADJUSTED')
+
+
+def _decode_char_rows(values):
+    """
+    Decodes an (N, width) NetCDF char array into N stripped Python strings in one pass.
+    """
+    data = np.ascontiguousarray(np.ma.getdata(values))
+    rows = data.view(f"S{data.shape[-1]}").reshape(data.shape[:-1])
+    return np.char.strip(np.char.decode(rows, "utf-8"))
+
+
+def _decode_char_cells(values):
+    """
+    Decodes an N-D NetCDF char array element-wise (one character per cell, unstripped).
+    """
+    return np.char.decode(np.ma.getdata(values), "utf-8")
+
+
+def _reference_datetime(nc_file):
+    return np.datetime64(datetime.strptime(
+        nc_file.variables['REFERENCE_DATE_TIME'][:].tobytes().decode('utf-8').strip(),
+        '%Y%m%d%H%M%S'
+    ), 'us')
+
+
+def _profile_checksums(profile_arrays, prof_index, level_arrays):
+    """
+    Hashes each profile's values into a hex digest, so a reprocessed cycle can be told apart from
+    an identical re-download. profile_arrays hold one row per profile; level_arrays hold the valid
+    levels only (ordered by prof_index), so the padding to the file's N_LEVELS does not count.
+    """
+    def byte_rows(values, rows):
+        values = np.ascontiguousarray(np.ma.getdata(values))
+        return values.reshape(rows, int(np.prod(values.shape[1:]))).view(np.uint8)
+
+    rows = len(profile_arrays[0])
+    headers = np.hstack([byte_rows(values, rows) for values in profile_arrays])
+    levels = np.hstack([byte_rows(values, len(prof_index)) for values in level_arrays])
+    bounds = np.searchsorted(prof_index, np.arange(rows + 1))
+    return np.array([
+        hashlib.blake2b(headers[i].tobytes() + levels[bounds[i]:bounds[i + 1]].tobytes(), digest_size=16).hexdigest()
+        for i in range(rows)
+    ], dtype=object)
+
+
+def read_profile_batches(nc_file, block_size=PROFILE_BLOCK_SIZE, keep=None):
+    """
+    Generator over an open Argo *_prof.nc dataset yielding one columnar batch per block of
+    block_size profiles:
+      {"floats": per-profile float metadata columns,
+       "profiles": n_prof (position in the file), platform_number, cycle_number, direction,
+                   profile_time (datetime64, NaT when missing), latitude, longitude (masked),
+                   the profile QC columns and content_checksum,
+       "measurements": every level with a valid adjusted pressure, with the adjusted values
+                       (masked) and QC columns, plus profile_index (position in the batch)}.
+    Column names match the database columns. keep(platform_numbers, cycle_numbers) may return a
+    boolean mask of the block's profiles to read; the others are skipped before any level is read.
+    """
+    variables = nc_file.variables
+    num_profiles = len(nc_file.dimensions['N_PROF'])
+    reference_date_time = _reference_datetime(nc_file)
+
+    for start in range(0, num_profiles, block_size):
+        block = slice(start, min(start + block_size, num_profiles))
+        n_prof = np.arange(block.start, block.stop)
+        platform_numbers = _decode_char_rows(variables['PLATFORM_NUMBER'][block]).astype(np.int64)
+        cycle_numbers = np.ma.getdata(variables['CYCLE_NUMBER'][block]).astype(np.int64)
+        if keep is not None:
+            wanted = keep(platform_numbers, cycle_numbers)
+            if not wanted.any():
+                continue
+            if not wanted.all():
+                n_prof, platform_numbers, cycle_numbers = n_prof[wanted], platform_numbers[wanted], cycle_numbers[wanted]
+                block = n_prof
+
+        raw = {name: variables[name][block] for name in (
+            'JULD', 'LATITUDE', 'LONGITUDE', 'DIRECTION', 'PROFILE_PRES_QC', 'PROFILE_TEMP_QC', 'PROFILE_PSAL_QC',
+        ) + MEASUREMENT_VARIABLES + tuple(f'{name}_QC' for name in MEASUREMENT_VARIABLES)}
+
+        juld = raw['JULD']
+        offsets = np.rint(np.ma.getdata(juld).astype(np.float64) * 86400e6).astype('timedelta64[us]')
+        profile_times = reference_date_time + offsets
+        profile_times[np.ma.getmaskarray(juld)] = np.datetime64('NaT')
+
+        floats = {"platform_number": platform_numbers}
+        for name in FLOAT_METADATA_VARIABLES:
+            floats[name.lower()] = _decode_char_rows(variables[name][block])
+
+        profiles = {
+            "n_prof": n_prof,
+            "platform_number": platform_numbers,
+            "cycle_number": cycle_numbers,
+            "direction": _decode_char_cells(raw['DIRECTION']),
+            "profile_time": profile_times,
+            "latitude": raw['LATITUDE'],
+            "longitude": raw['LONGITUDE'],
+            "profile_pres_qc": _decode_char_cells(raw['PROFILE_PRES_QC']),
+            "profile_temp_qc": _decode_char_cells(raw['PROFILE_TEMP_QC']),
+            "profile_psal_qc": _decode_char_cells(raw['PROFILE_PSAL_QC']),
+        }
+
+        prof_index, level_index = np.nonzero(~np.ma.getmaskarray(raw['PRES_ADJUSTED']))
+        measurements = {
+            "profile_index": prof_index,
+            "platform_number": platform_numbers[prof_index],
+            "cycle_number": cycle_numbers[prof_index],
+        }
+        level_arrays = []
+        for name in MEASUREMENT_VARIABLES:
+            values = raw[name][prof_index, level_index]
+            qc = np.ma.getdata(raw[f'{name}_QC'])[prof_index, level_index]
+            measurements[name.lower()] = values
+            measurements[f"{name.lower()}_qc"] = _decode_char_cells(qc)
+            # Masked values hash as NaN whatever fill value the file uses.
+            level_arrays += [np.ma.filled(values.astype(np.float64), np.nan), qc]
+        profiles["content_checksum"] = _profile_checksums(
+            [raw[name] for name in ('JULD', 'LATITUDE', 'LONGITUDE', 'DIRECTION',
+                                    'PROFILE_PRES_QC', 'PROFILE_TEMP_QC', 'PROFILE_PSAL_QC')],
+            prof_index, level_arrays)
+
+        yield {"floats": floats, "profiles": profiles, "measurements": measurements}
+
+
+def select_profiles(batch, wanted):
+    """
+    Returns the batch restricted to the profiles where the boolean mask wanted is set.
+    """
+    (positions,) = np.nonzero(wanted)
+    levels = np.isin(batch["measurements"]["profile_index"], positions)
+    measurements = {name: values[levels] for name, values in batch["measurements"].items()}
+    measurements["profile_index"] = np.searchsorted(positions, measurements["profile_index"])
+    return {
+        "floats": {name: values[wanted] for name, values in batch["floats"].items()},
+        "profiles": {name: values[wanted] for name, values in batch["profiles"].items()},
+        "measurements": measurements,
     }
-    netcdf_file = "20250912_prof.nc"
-    load_argo_nc_to_postgres(netcdf_file, db_connection_params)
\ No newline at end of file
+
+
+# --- BULK (COPY) INGEST ---
+STAGING_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS staging_profiles (
+    platform_number BIGINT,
+    cycle_number INTEGER,
+    direction TEXT,
+    profile_time TIMESTAMP,
+    location_wkt TEXT,
+    profile_pres_qc TEXT,
+    profile_temp_qc TEXT,
+    profile_psal_qc TEXT,
+    content_checksum TEXT
+) ON COMMIT DROP;
+CREATE TEMP TABLE IF NOT EXISTS staging_measurements (
+    platform_number BIGINT,
+    cycle_number INTEGER,
+    pres_adjusted DOUBLE PRECISION,
+    pres_adjusted_qc TEXT,
+    temp_adjusted DOUBLE PRECISION,
+    temp_adjusted_qc TEXT,
+    psal_adjusted DOUBLE PRECISION,
+    psal_adjusted_qc TEXT
+) ON COMMIT DROP;
+TRUNCATE staging_profiles, staging_measurements;
+"""
+
+MERGE_PROFILES_SQL = """
+INSERT INTO profiles (platform_number, cycle_number, direction, profile_time, location, profile_pres_qc, profile_temp_qc, profile_psal_qc, content_checksum)
+SELECT platform_number, cycle_number, direction, profile_time, ST_SetSRID(ST_GeomFromText(location_wkt), 4326), profile_pres_qc, profile_temp_qc, profile_psal_qc, content_checksum
+FROM staging_profiles
+ON CONFLICT (platform_number, cycle_number) DO NOTHING;
+"""
+
+MERGE_MEASUREMENTS_SQL = """
+INSERT INTO measurements (platform_number, cycle_number, pres_adjusted, pres_adjusted_qc, temp_adjusted, temp_adjusted_qc, psal_adjusted, psal_adjusted_qc)
+SELECT platform_number, cycle_number, pres_adjusted, pres_adjusted_qc, temp_adjusted, temp_adjusted_qc, psal_adjusted, psal_adjusted_qc
+FROM staging_measurements
+ON CONFLICT (platform_number, cycle_number, pres_adjusted) DO NOTHING;
+"""
+
+# --- SYNC (NEW OR CHANGED CYCLES ONLY) ---
+# Staged cycles that already exist are replaced in place: the profile row is updated and its
+# levels are deleted, so MERGE_MEASUREMENTS_SQL inserts the reprocessed ones.
+KNOWN_CYCLES_SQL = """
+SELECT platform_number, cycle_number, content_checksum FROM profiles WHERE platform_number = ANY(%s);
+"""
+
+REPLACED_CELLS_SQL = """
+CREATE TEMP TABLE replaced_cells ON COMMIT DROP AS
+SELECT DISTINCT c.lat_cell, c.lon_cell, c.month
+FROM profile_cells c
+JOIN staging_profiles s USING (platform_number, cycle_number);
+"""
+
+REPLACE_CHANGED_PROFILES_SQL = """
+UPDATE profiles p SET
+    direction = s.direction,
+    profile_time = s.profile_time,
+    location = ST_SetSRID(ST_GeomFromText(s.location_wkt), 4326),
+    profile_pres_qc = s.profile_pres_qc,
+    profile_temp_qc = s.profile_temp_qc,
+    profile_psal_qc = s.profile_psal_qc,
+    content_checksum = s.content_checksum
+FROM staging_profiles s
+WHERE p.platform_number = s.platform_number AND p.cycle_number = s.cycle_number;
+"""
+
+DELETE_REPLACED_MEASUREMENTS_SQL = """
+DELETE FROM measurements m
+USING staging_profiles s
+WHERE m.platform_number = s.platform_number AND m.cycle_number = s.cycle_number;
+"""
+
+
+def fetch_known_cycles(cur, nc_file):
+    """
+    Returns {(platform_number, cycle_number): content_checksum} for every stored profile of
+    the floats in the file, in one query.
+    """
+    platform_numbers = np.unique(_decode_char_rows(nc_file.variables['PLATFORM_NUMBER'][:]).astype(np.int64))
+    cur.execute(KNOWN_CYCLES_SQL, (platform_numbers.tolist(),))
+    return {(platform, cycle): checksum for platform, cycle, checksum in cur.fetchall()}
+
+
+def _is_known(known, platform_numbers, cycle_numbers):
+    return np.array([(int(p), int(c)) in known for p, c in zip(platform_numbers, cycle_numbers)], dtype=bool)
+
+
+COPY_NULL = "\\N"
+
+
+def _copy_column(values):
+    """
+    Formats a 1-D (masked) numeric array as COPY text, using \\N for masked cells.
+    """
+    text = np.ma.getdata(values).astype(np.float64).astype(str)
+    text[np.ma.getmaskarray(values)] = COPY_NULL
+    return text
+
+
+def _copy_rows(columns):
+    """
+    Joins equally sized string columns into a tab-separated COPY FROM STDIN buffer.
+    """
+    buffer = io.StringIO()
+    for row in zip(*columns):
+        buffer.write("\t".join(row))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+
+def _copy_times(values):
+    """
+    Formats a datetime64 array as COPY text, using \\N for NaT.
+    """
+    text = np.datetime_as_string(values, unit='us').astype(object)
+    text[np.isnat(values)] = COPY_NULL
+    return text
+
+
+def _copy_locations(latitude, longitude):
+    """
+    Formats masked latitude/longitude arrays as WKT points, using \\N when either is missing.
+    """
+    has_location = ~(np.ma.getmaskarray(latitude) | np.ma.getmaskarray(longitude))
+    locations = np.full(len(has_location), COPY_NULL, dtype=object)
+    locations[has_location] = [
+        f"POINT({lon} {lat})"
+        for lon, lat in zip(np.ma.getdata(longitude)[has_location], np.ma.getdata(latitude)[has_location])
+    ]
+    return locations
+
+
+def _profile_copy_buffer(profiles):
+    return _copy_rows([
+        profiles["platform_number"].astype(str),
+        profiles["cycle_number"].astype(str),
+        profiles["direction"],
+        _copy_times(profiles["profile_time"]),
+        _copy_locations(profiles["latitude"], profiles["longitude"]),
+        profiles["profile_pres_qc"],
+        profiles["profile_temp_qc"],
+        profiles["profile_psal_qc"],
+        profiles["content_checksum"],
+    ])
+
+
+def _measurement_copy_buffer(measurements):
+    columns = [measurements["platform_number"].astype(str), measurements["cycle_number"].astype(str)]
+    for name in MEASUREMENT_VARIABLES:
+        columns.append(_copy_column(measurements[name.lower()]))
+        columns.append(measurements[f"{name.lower()}_qc"])
+    return _copy_rows(columns)
+
+
+def copy_nc_file_into_db(cur, nc_file_path, block_size=PROFILE_BLOCK_SIZE, sync=False, update_changed=False):
+    """
+    Loads one Argo *_prof.nc file through the cursor: each block from read_profile_batches is
+    COPYed into staging tables, then everything is merged with INSERT ... ON CONFLICT DO NOTHING.
+
+    sync: fetch the stored cycles of the file's floats first and skip them before their levels
+    are read. update_changed (implies sync): instead of skipping, compare content checksums and
+    replace the stored cycles whose values changed (e.g. delayed-mode reprocessing); cycles
+    loaded before checksums existed count as changed once.
+
+    Does not commit. Returns a dict with the number of rows read and inserted per table.
+    """
+    cur.execute(STAGING_DDL)
+    float_rows = {}
+    profiles_read = measurements_read = profiles_skipped = 0
+    with netCDF4.Dataset(nc_file_path, 'r') as nc_file:
+        keep = None
+        if sync or update_changed:
+            known = fetch_known_cycles(cur, nc_file)
+            profiles_skipped = len(nc_file.dimensions['N_PROF'])
+            if not update_changed:
+                def keep(platform_numbers, cycle_numbers):
+                    return ~_is_known(known, platform_numbers, cycle_numbers)
+
+        for batch in read_profile_batches(nc_file, block_size, keep=keep):
+            if update_changed:
+                profiles = batch["profiles"]
+                unchanged = np.array([
+                    known.get((int(p), int(c))) == checksum
+                    for p, c, checksum in zip(profiles["platform_number"], profiles["cycle_number"], profiles["content_checksum"])
+                ], dtype=bool)
+                if unchanged.all():
+                    continue
+                if unchanged.any():
+                    batch = select_profiles(batch, ~unchanged)
+            floats = batch["floats"]
+            # --- floats: one row per distinct platform, metadata from its first profile ---
+            _, first_index = np.unique(floats["platform_number"], return_index=True)
+            for i in first_index:
+                float_rows.setdefault(int(floats["platform_number"][i]), tuple(
+                    str(floats[name.lower()][i]) for name in FLOAT_METADATA_VARIABLES
+                ))
+
+            cur.copy_expert(
+                "COPY staging_profiles (platform_number, cycle_number, direction, profile_time, location_wkt, "
+                "profile_pres_qc, profile_temp_qc, profile_psal_qc, content_checksum) FROM STDIN",
+                _profile_copy_buffer(batch["profiles"]),
+            )
+            cur.copy_expert(
+                "COPY staging_measurements (platform_number, cycle_number, pres_adjusted, pres_adjusted_qc, "
+                "temp_adjusted, temp_adjusted_qc, psal_adjusted, psal_adjusted_qc) FROM STDIN",
+                _measurement_copy_buffer(batch["measurements"]),
+            )
+            profiles_read += len(batch["profiles"]["cycle_number"])
+            measurements_read += len(batch["measurements"]["cycle_number"])
+    if sync or update_changed:
+        profiles_skipped -= profiles_read
+
+    floats_inserted = 0
+    if float_rows:
+        # execute_values sends pages of 100 rows and rowcount only covers the last one; count RETURNING rows.
+        inserted = psycopg2.extras.execute_values(cur, """
+            INSERT INTO floats (platform_number, project_name, pi_name, platform_type, float_serial_no, wmo_inst_type)
+            VALUES %s
+            ON CONFLICT (platform_number) DO NOTHING
+            RETURNING platform_number;
+            """, [(platform,) + metadata for platform, metadata in float_rows.items()], fetch=True)
+        floats_inserted = len(inserted)
+
+    profiles_updated = 0
+    if update_changed:
+        cur.execute(REPLACED_CELLS_SQL)
+        cur.execute(REPLACE_CHANGED_PROFILES_SQL)
+        profiles_updated = cur.rowcount
+        cur.execute(DELETE_REPLACED_MEASUREMENTS_SQL)
+    cur.execute(MERGE_PROFILES_SQL)
+    profiles_inserted = cur.rowcount
+    cur.execute(MERGE_MEASUREMENTS_SQL)
+    measurements_inserted = cur.rowcount
+    refresh_rollups(cur, replaced_cells=update_changed)
+
+    return {
+        "floats_read": len(float_rows),
+        "floats_inserted": floats_inserted,
+        "profiles_read": profiles_read,
+        "profiles_inserted": profiles_inserted,
+        "profiles_skipped": profiles_skipped,
+        "profiles_updated": profiles_updated,
+        "measurements_read": measurements_read,
+        "measurements_inserted": measurements_inserted,
+    }
+
+
+def bulk_load_argo_nc_to_postgres(nc_file_path, db_params, sync=False, update_changed=False):
+    """
+    Bulk variant of load_argo_nc_to_postgres: reads whole 2-D arrays, drops masked levels
+    with vectorized masks and streams rows through COPY. Same ON CONFLICT DO NOTHING semantics.
+    sync/update_changed: see copy_nc_file_into_db.
+    """
+    try:
+        conn = psycopg2.connect(**db_params)
+        print("✅ Successfully connected to the database.")
+    except psycopg2.OperationalError as e:
+        print(f"❌ Could not connect to the database: {e}")
+        return None
+
+    print(f"🔄 Bulk loading NetCDF file: {nc_file_path}")
+    started = time.perf_counter()
+    try:
+        argo_schema.migrate(conn, verbose=True)
+        with conn.cursor() as cur:
+            stats = copy_nc_file_into_db(cur, nc_file_path, sync=sync, update_changed=update_changed)
+        conn.commit()
+        bump_data_version(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    rows = stats["profiles_read"] + stats["measurements_read"]
+    print(f"  - Floats: {stats['floats_inserted']}/{stats['floats_read']} new, "
+          f"profiles: {stats['profiles_inserted']}/{stats['profiles_read']} new, "
+          f"measurements: {stats['measurements_inserted']}/{stats['measurements_read']} new.")
+    if sync or update_changed:
+        print(f"  - Skipped {stats['profiles_skipped']} known cycles, replaced {stats['profiles_updated']} changed ones.")
+    print(f"✅ Loaded {rows} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/sec).")
+    return stats
+
+
+# --- PARALLEL MULTI-FILE INGEST ---
+RECORD_MANIFEST_SQL = """
+INSERT INTO ingest_manifest (path, checksum, mtime, size_bytes, floats_inserted, profiles_read, profiles_inserted,
+                             measurements_read, measurements_inserted, duration_seconds)
+VALUES (%(path)s, %(checksum)s, %(mtime)s, %(size_bytes)s, %(floats_inserted)s, %(profiles_read)s, %(profiles_inserted)s,
+        %(measurements_read)s, %(measurements_inserted)s, %(seconds)s)
+ON CONFLICT (path) DO UPDATE SET
+    checksum = EXCLUDED.checksum,
+    mtime = EXCLUDED.mtime,
+    size_bytes = EXCLUDED.size_bytes,
+    floats_inserted = EXCLUDED.floats_inserted,
+    profiles_read = EXCLUDED.profiles_read,
+    profiles_inserted = EXCLUDED.profiles_inserted,
+    measurements_read = EXCLUDED.measurements_read,
+    measurements_inserted = EXCLUDED.measurements_inserted,
+    duration_seconds = EXCLUDED.duration_seconds,
+    loaded_at = now();
+"""
+
+REFRESH_MANIFEST_MTIME_SQL = """
+UPDATE ingest_manifest SET mtime = %(mtime)s, size_bytes = %(size_bytes)s WHERE path = %(path)s;
+"""
+
+# One connection per worker process, opened by the pool initializer and reopened if it dies.
+_worker_conn = None
+_worker_db_params = None
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_nc_files(path_or_glob):
+    """
+    Expands a directory (searched recursively for *_prof.nc) or a glob pattern into sorted absolute paths.
+    """
+    if os.path.isdir(path_or_glob):
+        pattern = os.path.join(path_or_glob, "**", "*_prof.nc")
+    else:
+        pattern = path_or_glob
+    return sorted(os.path.abspath(p) for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+
+
+def _init_worker(db_params):
+    global _worker_conn, _worker_db_params
+    _worker_db_params = db_params
+    _worker_conn = psycopg2.connect(**db_params)
+
+
+def _worker_connection():
+    """
+    Returns the worker's connection, reconnecting if it was lost.
+    """
+    global _worker_conn
+    if _worker_conn is None or _worker_conn.closed:
+        _worker_conn = psycopg2.connect(**_worker_db_params)
+    return _worker_conn
+
+
+def _reset_worker_connection():
+    """
+    Rolls back the worker's failed transaction, or drops the connection if that fails too (the
+    server went away), so the next file reconnects instead of failing on a dead connection.
+    """
+    global _worker_conn
+    try:
+        if _worker_conn is not None and not _worker_conn.closed:
+            _worker_conn.rollback()
+            return
+    except (psycopg2.InterfaceError, psycopg2.OperationalError):
+        pass
+    if _worker_conn is not None:
+        _worker_conn.close()
+    _worker_conn = None
+
+
+def _ingest_one_file(path, size_bytes, mtime, known_checksum, sync=False, update_changed=False):
+    """
+    Worker task: loads one file and records it in ingest_manifest in the same transaction.
+    Files whose checksum matches the manifest are skipped (their new mtime is recorded so
+    the next run does not hash them again). Errors are returned as a "failed" result.
+    """
+    record = {"path": path, "mtime": datetime.fromtimestamp(mtime), "size_bytes": size_bytes}
+    started = time.perf_counter()
+    try:
+        checksum = file_checksum(path)
+        conn = _worker_connection()
+        with conn.cursor() as cur:
+            if checksum == known_checksum:
+                cur.execute(REFRESH_MANIFEST_MTIME_SQL, record)
+                conn.commit()
+                return {"path": path, "status": "skipped"}
+            stats = copy_nc_file_into_db(cur, path, sync=sync, update_changed=update_changed)
+            stats.update(record, checksum=checksum, seconds=time.perf_counter() - started)
+            cur.execute(RECORD_MANIFEST_SQL, stats)
+        conn.commit()
+        bump_data_version(conn)
+    except Exception as e:
+        _reset_worker_connection()
+        return {"path": path, "status": "failed", "error": str(e)}
+
+    stats["status"] = "loaded"
+    return stats
+
+
+def load_argo_directory(path_or_glob, db_params, workers=None, sync=False, update_changed=False):
+    """
+    Loads every matching *_prof.nc file with a process pool (one connection per worker),
+    committing per file. Files already recorded in ingest_manifest with the same size and
+    mtime (or the same checksum) are skipped, so an interrupted run can simply be restarted.
+    sync/update_changed apply per file; see copy_nc_file_into_db.
+    """
+    files = find_nc_files(path_or_glob)
+    print(f"🔄 Found {len(files)} NetCDF files matching {path_or_glob}")
+    if not files:
+        return []
+
+    try:
+        with psycopg2.connect(**db_params) as conn:
+            argo_schema.migrate(conn, verbose=True)
+            with conn.cursor() as cur:
+                cur.execute("SELECT path, checksum, mtime, size_bytes FROM ingest_manifest;")
+                manifest = {row[0]: row[1:] for row in cur.fetchall()}
+        conn.close()
+    except psycopg2.OperationalError as e:
+        print(f"❌ Could not connect to the database: {e}")
+        return []
+
+    tasks = []
+    for path in files:
+        st = os.stat(path)
+        mtime = datetime.fromtimestamp(st.st_mtime)
+        known = manifest.get(path)
+        if known and known[1] == mtime and known[2] == st.st_size:
+            continue
+        tasks.append((path, st.st_size, st.st_mtime, known[0] if known else None))
+    print(f"  - {len(files) - len(tasks)} files unchanged since last run, {len(tasks)} to check/load.")
+
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_params,)) as pool:
+        futures = {pool.submit(_ingest_one_file, *task, sync=sync, update_changed=update_changed): task[0]
+                   for task in tasks}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                result = future.result()
+            except Exception as e:  # e.g. a worker process died; keep loading the other files
+                result = {"path": futures[future], "status": "failed", "error": repr(e)}
+            results.append(result)
+            if result["status"] == "loaded":
+                print(f"  [{done}/{len(tasks)}] {result['path']}: {result['measurements_inserted']} measurements "
+                      f"in {result['seconds']:.2f}s")
+            elif result["status"] == "failed":
+                print(f"  [{done}/{len(tasks)}] ❌ {result['path']}: {result['error']}")
+
+    elapsed = time.perf_counter() - started
+    loaded = [r for r in results if r["status"] == "loaded"]
+    failed = [r for r in results if r["status"] == "failed"]
+    rows = sum(r["profiles_read"] + r["measurements_read"] for r in loaded)
+    print(f"✅ Loaded {len(loaded)} files ({rows} rows, {rows / max(elapsed, 1e-9):,.0f} rows/sec), "
+          f"skipped {len(files) - len(loaded) - len(failed)}, failed {len(failed)}.")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load Argo *_prof.nc files into Postgres/PostGIS.")
+    parser.add_argument("netcdf_file", nargs="?", default="20250912_prof.nc",
+                        help="A single file, a directory or a glob pattern.")
+    parser.add_argument("--bulk", action="store_true", help="Use the COPY-based bulk ingest engine.")
+    parser.add_argument("--sync", action="store_true",
+                        help="Bulk-load only cycles not yet in the database (one lookup per file).")
+    parser.add_argument("--update-changed", action="store_true",
+                        help="Like --sync, but also replace stored cycles whose content checksum changed.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for directory/glob ingest (default: CPU count).")
+    parser.add_argument("--refresh-rollups", action="store_true",
+                        help="Rebuild every rollup table from scratch and exit.")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Only create/upgrade the schema (see argo_schema.py) and exit.")
+    args = parser.parse_args()
+
+    db_connection_params = argo_schema.DEFAULT_DB_PARAMS
+    if args.migrate:
+        argo_schema.ensure_schema(db_connection_params)
+    elif args.refresh_rollups:
+        rebuild_rollups(db_connection_params)
+    elif os.path.isdir(args.netcdf_file) or glob.has_magic(args.netcdf_file):
+        load_argo_directory(args.netcdf_file, db_connection_params, workers=args.workers,
+                            sync=args.sync, update_changed=args.update_changed)
+    elif args.bulk or args.sync or args.update_changed:
+        bulk_load_argo_nc_to_postgres(args.netcdf_file, db_connection_params, sync=args.sync,
+                                      update_changed=args.update_changed)
+    else:
+        load_argo_nc_to_postgres(args.netcdf_file, db_connection_params)
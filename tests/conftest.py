@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BUNDLED_FILE = os.path.join(ROOT, "20250912_prof.nc")
+
+
+@pytest.fixture
+def bundled_file():
+    return BUNDLED_FILE
@@ -0,0 +1,53 @@
+import numpy as np
+import netCDF4
+
+import load_argo_data
+from load_argo_data import (COPY_NULL, _copy_column, _copy_locations, _copy_rows, _copy_times,
+                            _measurement_copy_buffer, _profile_copy_buffer, read_profile_batches)
+
+
+def test_copy_column_marks_masked_cells_null():
+    values = np.ma.masked_array(np.array([1.5, 2.0, 3.25], dtype=np.float32), mask=[False, True, False])
+    assert _copy_column(values).tolist() == ["1.5", COPY_NULL, "3.25"]
+
+
+def test_copy_times():
+    values = np.array(["2025-09-12T06:30:00.000001", "NaT"], dtype="datetime64[us]")
+    assert _copy_times(values).tolist() == ["2025-09-12T06:30:00.000001", COPY_NULL]
+
+
+def test_copy_locations_need_both_coordinates():
+    latitude = np.ma.masked_array([10.5, 20.0, 30.0], mask=[False, True, False])
+    longitude = np.ma.masked_array([70.25, 71.0, 72.0], mask=[False, False, True])
+    assert _copy_locations(latitude, longitude).tolist() == ["POINT(70.25 10.5)", COPY_NULL, COPY_NULL]
+
+
+def test_copy_rows():
+    buffer = _copy_rows([np.array(["1", "2"]), np.array(["a", COPY_NULL])])
+    assert buffer.read() == "1\ta\n2\t\\N\n"
+
+
+def test_profile_and_measurement_buffers_have_one_line_per_row(bundled_file):
+    with netCDF4.Dataset(bundled_file) as nc:
+        batch = next(read_profile_batches(nc, block_size=4))
+    profile_lines = _profile_copy_buffer(batch["profiles"]).read().splitlines()
+    measurement_lines = _measurement_copy_buffer(batch["measurements"]).read().splitlines()
+
+    assert len(profile_lines) == 4
+    assert all(len(line.split("\t")) == 9 for line in profile_lines)
+    assert len(measurement_lines) == len(batch["measurements"]["pres_adjusted"])
+    assert all(len(line.split("\t")) == 8 for line in measurement_lines)
+
+
+def test_batches_cover_the_file_whatever_the_block_size(bundled_file):
+    def read(block_size):
+        with netCDF4.Dataset(bundled_file) as nc:
+            return list(read_profile_batches(nc, block_size=block_size))
+
+    whole, blocks = read(load_argo_data.PROFILE_BLOCK_SIZE), read(3)
+    assert len(whole) == 1 and len(blocks) > 1
+    for key in ("cycle_number", "platform_number", "content_checksum"):
+        assert np.concatenate([b["profiles"][key] for b in blocks]).tolist() == whole[0]["profiles"][key].tolist()
+    temps = np.ma.concatenate([b["measurements"]["temp_adjusted"] for b in blocks])
+    assert np.array_equal(np.ma.filled(temps.astype(float), np.nan),
+                          np.ma.filled(whole[0]["measurements"]["temp_adjusted"].astype(float), np.nan), equal_nan=True)
@@ -0,0 +1,74 @@
+import numpy as np
+import netCDF4
+import pytest
+
+from load_argo_data import _profile_checksums, read_profile_batches, select_profiles
+
+
+def write_copy(src, dst, extra_levels=0, edit=None):
+    """
+    Rewrites an Argo profile file with N_LEVELS padded by extra_levels, then applies edit(dataset).
+    """
+    with netCDF4.Dataset(src) as s, netCDF4.Dataset(dst, "w") as d:
+        for name, dim in s.dimensions.items():
+            d.createDimension(name, None if dim.isunlimited() else len(dim) + (extra_levels if name == "N_LEVELS" else 0))
+        for name, var in s.variables.items():
+            attrs = var.ncattrs()
+            copy = d.createVariable(name, var.datatype, var.dimensions,
+                                    fill_value=var.getncattr("_FillValue") if "_FillValue" in attrs else None)
+            copy.setncatts({k: var.getncattr(k) for k in attrs if k != "_FillValue"})
+            data = var[:]
+            copy[tuple(slice(0, n) for n in data.shape)] = data
+        if edit is not None:
+            edit(d)
+
+
+def checksums(path):
+    with netCDF4.Dataset(path) as nc:
+        return np.concatenate([b["profiles"]["content_checksum"] for b in read_profile_batches(nc, block_size=5)])
+
+
+def test_checksums_ignore_level_padding(bundled_file, tmp_path):
+    padded = tmp_path / "padded_prof.nc"
+    write_copy(bundled_file, padded, extra_levels=10)
+    assert checksums(padded).tolist() == checksums(bundled_file).tolist()
+
+
+def test_checksums_change_only_for_edited_profiles(bundled_file, tmp_path):
+    def edit(d):
+        d["TEMP_ADJUSTED"][1, :5] = d["TEMP_ADJUSTED"][1, :5] + 1
+        d["PSAL_ADJUSTED_QC"][3, 0] = b"4"
+        d["LATITUDE"][6] = d["LATITUDE"][6] + 1
+        d["PRES_ADJUSTED"][9, 10:] = np.ma.masked
+
+    changed = tmp_path / "changed_prof.nc"
+    write_copy(bundled_file, changed, edit=edit)
+    assert np.flatnonzero(checksums(changed) != checksums(bundled_file)).tolist() == [1, 3, 6, 9]
+
+
+def test_profile_checksums_cover_header_and_levels():
+    profile_arrays = [np.array([1.0, 1.0, 1.0])]
+    level_arrays = [np.array([10.0, 20.0]), np.array([b"1", b"1"])]
+    digests = _profile_checksums(profile_arrays, np.array([1, 1]), level_arrays)
+
+    # Profiles 0 and 2 share a header and have no levels; profile 1 has both levels.
+    assert digests[0] == digests[2] != digests[1]
+    assert _profile_checksums(profile_arrays, np.array([0, 0]), level_arrays)[1] == digests[0]
+    assert _profile_checksums([np.array([2.0, 1.0, 1.0])], np.array([1, 1]), level_arrays)[0] != digests[0]
+
+
+@pytest.mark.parametrize("block_size", [4, 100])
+def test_select_profiles_keeps_levels_aligned(bundled_file, block_size):
+    with netCDF4.Dataset(bundled_file) as nc:
+        batch = next(read_profile_batches(nc, block_size=block_size))
+    count = len(batch["profiles"]["cycle_number"])
+    wanted = np.arange(count) % 2 == 1
+    selected = select_profiles(batch, wanted)
+
+    assert selected["profiles"]["cycle_number"].tolist() == batch["profiles"]["cycle_number"][wanted].tolist()
+    assert len(selected["floats"]["platform_number"]) == wanted.sum()
+    kept_levels = np.isin(batch["measurements"]["profile_index"], np.flatnonzero(wanted))
+    assert selected["measurements"]["pres_adjusted"].tolist() == batch["measurements"]["pres_adjusted"][kept_levels].tolist()
+    # profile_index is renumbered to positions in the selected batch.
+    assert np.array_equal(selected["profiles"]["cycle_number"][selected["measurements"]["profile_index"]],
+                          selected["measurements"]["cycle_number"])